@@ -0,0 +1,48 @@
+import math
+
+from database import (ANOMALY_MIN_COUNT, database_path, database_paths, get_anomaly_stats, read_connection,
+                      rebuild_anomaly_stats, write_connection)
+
+# Long-run deviations the recent average (EWMA) has to move from the
+# long-run mean before a mood/category pair counts as drifting
+DRIFT_Z = 1.0
+
+def std(n, m2):
+    return math.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+
+def describe(anomaly):
+    # e.g. "3.2σ above your usual Sad-mood Shopping spend (₹4,800 vs ₹1,150 on average)"
+    direction = 'above' if anomaly['z'] > 0 else 'below'
+    return (f"{abs(anomaly['z']):.1f}σ {direction} your usual {anomaly['mood']}-mood {anomaly['category']} spend "
+            f"(₹{anomaly['amount']:,.0f} vs ₹{anomaly['mean']:,.0f} on average)")
+
+def expense_anomaly(user_id, expense_id):
+    # What the insert recorded for this expense; None if it was usual
+    with read_connection(user_id) as conn:
+        row = conn.execute(
+            '''SELECT expense_id, date, mood, category, amount, mean, std, z, recent_z FROM spending_anomalies
+               WHERE expense_id = ? AND user_id = ?''',
+            (expense_id, user_id)
+        ).fetchone()
+    return dict(row) if row else None
+
+def drifting(user_id):
+    # Mood/category pairs whose recent average has moved at least DRIFT_Z
+    # long-run deviations from the long-run mean, biggest move first
+    groups = []
+    for row in get_anomaly_stats(user_id):
+        spread = std(row['n'], row['m2'])
+        if row['n'] < ANOMALY_MIN_COUNT or not spread:
+            continue
+        drift = (row['ewma'] - row['mean']) / spread
+        if abs(drift) >= DRIFT_Z:
+            groups.append({'mood': row['mood'], 'category': row['category'], 'mean': row['mean'],
+                           'recent': row['ewma'], 'drift': drift})
+    return sorted(groups, key=lambda group: -abs(group['drift']))
+
+def rebuild(user_id=None):
+    # Recomputes statistics and recorded anomalies from the full history
+    paths = [database_path(user_id)] if user_id is not None else database_paths()
+    for path in paths:
+        with write_connection(path=path) as conn:
+            rebuild_anomaly_stats(conn, user_id)
@@ -0,0 +1,211 @@
+# uvicorn api:app --host 0.0.0.0 --port 8000
+#
+# JSON API next to the Streamlit UI, on the same database.py layer. Log in
+# with POST /token and send the token as "Authorization: Bearer <token>".
+# Handlers are async; the blocking SQLite calls run on worker threads.
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date as Date
+from typing import List, Literal, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Query, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel, Field
+
+import archive
+import database
+import eco
+import forecast as forecasting
+import metrics
+
+MAX_BATCH = 10_000
+MAX_PAGE = 500
+
+@asynccontextmanager
+async def lifespan(app):
+    database.init_db()
+    if metrics.TEXTFILE:
+        metrics.start_textfile_exporter()
+    if archive.ARCHIVE_INTERVAL:
+        archive.start_archiver()
+    yield
+    archive.stop_archiver()
+    database.close_connections()
+
+app = FastAPI(title="Smart Expense Tracker API", lifespan=lifespan)
+bearer = HTTPBearer()
+
+class Credentials(BaseModel):
+    username: str = Field(min_length=1)
+    password: str = Field(min_length=1)
+    email: Optional[str] = None
+
+class Expense(BaseModel):
+    date: Date
+    category: Literal[database.CATEGORIES]
+    amount: float = Field(gt=0)
+    description: str = ''
+    mood: Literal[database.MOODS]
+
+    def row(self, user_id):
+        return (user_id, self.date.isoformat(), self.category, self.amount, self.description, self.mood)
+
+class ExpenseBatch(BaseModel):
+    expenses: List[Expense] = Field(min_length=1, max_length=MAX_BATCH)
+
+async def current_user(credentials: HTTPAuthorizationCredentials = Depends(bearer)):
+    user_id = await asyncio.to_thread(database.get_token_user, credentials.credentials)
+    if user_id is None:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, 'invalid or revoked token',
+                            headers={'WWW-Authenticate': 'Bearer'})
+    return user_id
+
+# ----------------- AUTH ---------------------------
+@app.post('/users', status_code=status.HTTP_201_CREATED)
+async def register(credentials: Credentials):
+    user_id = await asyncio.to_thread(database.create_user, credentials.username, credentials.password, credentials.email)
+    if user_id is None:
+        raise HTTPException(status.HTTP_409_CONFLICT, 'username already taken')
+    return {'user_id': user_id}
+
+@app.post('/token')
+async def login(credentials: Credentials):
+    user = await asyncio.to_thread(database.verify_user, credentials.username, credentials.password)
+    if user is None:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, 'invalid username or password')
+    token = await asyncio.to_thread(database.create_api_token, user['id'])
+    return {'access_token': token, 'token_type': 'bearer', 'user_id': user['id']}
+
+@app.delete('/token', status_code=status.HTTP_204_NO_CONTENT)
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(bearer)):
+    await asyncio.to_thread(database.revoke_api_token, credentials.credentials)
+
+# ----------------- EXPENSES -----------------------
+@app.post('/expenses', status_code=status.HTTP_201_CREATED)
+async def add_expense(expense: Expense, user_id: int = Depends(current_user)):
+    if database.GROUP_COMMIT:
+        # Shares a transaction with concurrent adds, no worker thread needed
+        expense_id = await asyncio.wrap_future(database.add_expense_async(*expense.row(user_id)))
+    else:
+        expense_id = await asyncio.to_thread(database.add_expense, *expense.row(user_id))
+    return {'id': expense_id}
+
+@app.post('/expenses/batch', status_code=status.HTTP_201_CREATED)
+async def add_expenses(batch: ExpenseBatch, user_id: int = Depends(current_user)):
+    # One transaction for the whole batch
+    inserted = await asyncio.to_thread(database.add_expenses_bulk, [expense.row(user_id) for expense in batch.expenses])
+    return {'inserted': inserted}
+
+def _filters(category, mood, min_amount, max_amount, start, end):
+    return {'category': category, 'mood': mood, 'min_amount': min_amount, 'max_amount': max_amount,
+            'start': start, 'end': end}
+
+@app.get('/expenses')
+async def list_expenses(
+    user_id: int = Depends(current_user),
+    sort: Literal[database.PAGE_SORT_COLUMNS] = 'date',
+    descending: bool = True,
+    after: Optional[str] = Query(None, description='next_cursor from the previous page'),
+    limit: int = Query(50, ge=1, le=MAX_PAGE),
+    category: Optional[str] = None,
+    mood: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start: Optional[Date] = None,
+    end: Optional[Date] = None,
+):
+    cursor = None
+    if after:
+        # "<sort value>,<id>", as returned in next_cursor
+        value, _, expense_id = after.rpartition(',')
+        try:
+            cursor = (float(value) if sort == 'amount' else value, int(expense_id))
+        except ValueError:
+            raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, f'bad cursor {after!r}')
+    rows, next_cursor = await asyncio.to_thread(
+        database.get_expenses_page, user_id, cursor, limit, sort, descending,
+        **_filters(category, mood, min_amount, max_amount, start, end)
+    )
+    return {
+        'expenses': rows,
+        'next_cursor': f'{next_cursor[0]},{next_cursor[1]}' if next_cursor else None,
+    }
+
+@app.get('/expenses/summary')
+async def expenses_summary(
+    user_id: int = Depends(current_user),
+    category: Optional[str] = None,
+    mood: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start: Optional[Date] = None,
+    end: Optional[Date] = None,
+):
+    return await asyncio.to_thread(
+        database.get_expenses_summary, user_id, **_filters(category, mood, min_amount, max_amount, start, end)
+    )
+
+@app.get('/expenses/search')
+async def search_expenses(
+    q: str = Query(min_length=1, description='words to find in descriptions, matched as prefixes'),
+    user_id: int = Depends(current_user),
+    offset: int = Query(0, ge=0, description='next_offset from the previous page'),
+    limit: int = Query(50, ge=1, le=MAX_PAGE),
+    category: Optional[Literal[database.CATEGORIES]] = None,
+    start: Optional[Date] = None,
+    end: Optional[Date] = None,
+):
+    rows, next_offset = await asyncio.to_thread(
+        database.search_expenses, user_id, q, offset, limit, category=category, start=start, end=end
+    )
+    return {'expenses': rows, 'next_offset': next_offset}
+
+# ----------------- AGGREGATES ---------------------
+# All take an optional inclusive start/end date window
+class Window(BaseModel):
+    start: Optional[Date] = None
+    end: Optional[Date] = None
+
+    def dates(self):
+        return {'start': self.start, 'end': self.end}
+
+@app.get('/totals')
+async def totals(user_id: int = Depends(current_user), window: Window = Depends()):
+    return await asyncio.to_thread(database.get_expense_totals, user_id, **window.dates())
+
+@app.get('/rollups/{name}')
+async def rollup(name: Literal[tuple(database.ROLLUPS)], user_id: int = Depends(current_user), window: Window = Depends()):
+    return await asyncio.to_thread(database.get_rollup, user_id, name, **window.dates())
+
+@app.get('/spending/mood')
+async def spending_by_mood(user_id: int = Depends(current_user), window: Window = Depends()):
+    return await asyncio.to_thread(database.get_spending_by_mood, user_id, **window.dates())
+
+@app.get('/spending/category-mood')
+async def spending_by_category_mood(user_id: int = Depends(current_user), window: Window = Depends()):
+    return await asyncio.to_thread(database.get_spending_by_category_mood, user_id, **window.dates())
+
+@app.get('/anomalies')
+async def spending_anomalies(
+    user_id: int = Depends(current_user),
+    window: Window = Depends(),
+    limit: int = Query(database.ANOMALY_PAGE, ge=1, le=MAX_PAGE),
+):
+    return await asyncio.to_thread(database.get_anomalies, user_id, limit=limit, **window.dates())
+
+@app.get('/eco')
+async def eco_impact(
+    by: Literal[tuple(eco.IMPACT_QUERIES)] = 'category',
+    user_id: int = Depends(current_user),
+    window: Window = Depends(),
+):
+    return await asyncio.to_thread(eco.get_eco_impact, user_id, by, **window.dates())
+
+@app.get('/forecast')
+async def predicted_spending(
+    user_id: int = Depends(current_user),
+    horizon: int = Query(forecasting.DEFAULT_HORIZON, ge=1, le=365),
+    category: Optional[Literal[database.CATEGORIES]] = None,
+    window: Window = Depends(),
+):
+    return await asyncio.to_thread(forecasting.forecast, user_id, horizon, category, **window.dates())
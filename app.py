@@ -1,15 +1,26 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-from sklearn.linear_model import LinearRegression
 from database import (
-    create_table, create_user, verify_user,
-    add_expense, get_all_expenses, get_spending_by_mood, 
-    get_spending_by_category_mood, get_eco_impact_by_mood
+    init_db, create_user, verify_user,
+    add_expense, get_expense_totals, get_spending_by_mood, 
+    get_spending_by_category_mood, get_eco_impact_by_mood,
+    get_expenses_page, get_expenses_summary, get_rollup, search_expenses,
+    get_anomalies, cache_stats
 )
-from datetime import date
+from eco import get_eco_impact, get_total_impact
+from forecast import forecast, last_run
+from anomaly import describe, drifting, expense_anomaly
+from importer import import_csv
+from exporter import export_expenses, parquet_available
+from datetime import date, timedelta
+from pathlib import Path
+import archive
+import metrics
+import os
+import tempfile
 import time
 
+STYLESHEET = Path(__file__).parent / "static" / "style.css"
+
 # ------------------ PAGE SETUP --------------------
 st.set_page_config(
     page_title=" Smart Expense Tracker", 
@@ -19,70 +30,59 @@ st.set_page_config(
 )
 
 # ----------------- CUSTOM STYLING -----------------
-st.markdown("""
-<style>
-    /* Main Theme */
-    .main-header {
-        font-size: 3rem;
-        font-weight: 700;
-        text-align: center;
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        margin-bottom: 0.5rem;
-    }
-    
-    .sub-header {
-        text-align: center;
-        color: #6c757d;
-        font-size: 1.2rem;
-        margin-bottom: 2rem;
-    }
-    
-    /* Card Styling */
-    .metric-card {
-        background: white;
-        padding: 1.5rem;
-        border-radius: 15px;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        border-left: 4px solid #667eea;
-        margin-bottom: 1rem;
-    }
-    
-    .login-card {
-        background: white;
-        padding: 2rem;
-        border-radius: 20px;
-        box-shadow: 0 10px 30px rgba(0, 0, 0, 0.1);
-        max-width: 500px;
-        margin: 2rem auto;
-    }
-    
-    /* Button Styling */
-    .stButton button {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border: none;
-        border-radius: 10px;
-        padding: 0.5rem 2rem;
-        font-weight: 600;
-        width: 100%;
-    }
-    
-    .stButton button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 5px 15px rgba(102, 126, 234, 0.4);
-    }
-    
-    /* Sidebar Styling */
-    .sidebar .sidebar-content {
-        background: linear-gradient(180deg, #667eea 0%, #764ba2 100%);
-    }
-</style>
-""", unsafe_allow_html=True)
+@st.cache_resource
+def load_styles():
+    # Read once per process; Streamlit still needs the tag on every rerun
+    return f"<style>\n{STYLESHEET.read_text()}</style>"
+
+st.markdown(load_styles(), unsafe_allow_html=True)
+
+# ----------------- OPTIONS ------------------------
+CATEGORY_OPTIONS = ["🍔 Food", "🚗 Travel", "🛍️ Shopping", "📱 Bills", "🎯 Other"]
+MOOD_OPTIONS = ["😊 Happy", "😢 Sad", "😐 Neutral", "🎉 Excited", "😴 Tired"]
+SORT_OPTIONS = {
+    "Newest first": ("date", True),
+    "Oldest first": ("date", False),
+    "Highest amount": ("amount", True),
+    "Lowest amount": ("amount", False),
+}
+PAGE_SIZE = 50
+DATE_COLUMN = {"date": st.column_config.DateColumn("date", format="YYYY-MM-DD")}
+PAGES = ["📊 Dashboard", "➕ Add Expense", "📋 View Expenses", "🔮 Predict Spending", "😊 Mood Analysis", "🌍 Eco Impact"]
+ADMIN_PAGE = "🛠️ Admin Metrics"
+# Comma-separated usernames that may see the metrics page
+ADMIN_USERS = {name.strip() for name in os.environ.get("EXPENSE_TRACKER_ADMINS", "").split(",") if name.strip()}
+
+PERIOD_OPTIONS = ["All time", "This month", "Last 30 days", "Last 90 days", "This year", "Custom range"]
+
+def period_window(period, today=None):
+    # (start, end) for the sidebar period; None means open-ended, so
+    # future-dated expenses still show up under "this month" and the like
+    today = today or date.today()
+    if period == "This month":
+        return today.replace(day=1), None
+    if period == "Last 30 days":
+        return today - timedelta(days=29), None
+    if period == "Last 90 days":
+        return today - timedelta(days=89), None
+    if period == "This year":
+        return today.replace(month=1, day=1), None
+    return None, None
+
+def clean_label(option):
+    # Remove emoji from category/mood for database
+    return option.split(' ')[-1] if ' ' in option else option
+
+def page_name(option):
+    # Menu label without its emoji, used as the metrics name
+    return option.split(' ', 1)[-1]
 
 # ----------------- INITIALIZE DATABASE ------------
-create_table()
+init_db()  # no-op after the first run in this process
+if metrics.TEXTFILE:
+    metrics.start_textfile_exporter()  # once per process
+if archive.ARCHIVE_INTERVAL:
+    archive.start_archiver()  # likewise
 
 # ----------------- AUTHENTICATION -----------------
 def initialize_session_state():
@@ -162,6 +162,12 @@ def show_login_page():
 
 # ----------------- MAIN APP ----------------------
 def main_app():
+    # Deferred so the login page renders without loading pandas
+    import pandas as pd
+    # Every chart and table below goes through charts: bucketed, thinned
+    # and capped before Streamlit serializes it
+    import charts
+    
     # Header
     col1, col2, col3 = st.columns([2, 1, 1])
     with col1:
@@ -177,56 +183,67 @@ def main_app():
     # ----------------- SIDEBAR MENU -------------------
     with st.sidebar:
         st.markdown("### 🧭 Navigation")
-        menu = st.radio("Go to", 
-            ["📊 Dashboard", "➕ Add Expense", "📋 View Expenses", "🔮 Predict Spending", "😊 Mood Analysis", "🌍 Eco Impact"])
+        is_admin = st.session_state.username in ADMIN_USERS
+        menu = st.radio("Go to", PAGES + [ADMIN_PAGE] if is_admin else PAGES, key="menu")
+        
+        st.markdown("---")
+        st.markdown("### 📅 Period")
+        period = st.selectbox("Analyse", PERIOD_OPTIONS, key="period")
+        start, end = period_window(period)
+        if period == "Custom range":
+            picked = st.date_input("Dates", (date.today() - timedelta(days=29), date.today()))
+            if len(picked) == 2:
+                start, end = picked
+            elif picked:  # the second date hasn't been picked yet
+                start = end = picked[0]
+        # Passed to every query; answered by index range scans in SQLite
+        window = {"start": start, "end": end}
         
         st.markdown("---")
         st.markdown("### 💡 Quick Stats")
-        data = get_all_expenses(st.session_state.user_id)
-        if data:
-            df = pd.DataFrame(data)
-            total_spent = df["amount"].sum()
-            st.metric("Total Spending", f"₹{total_spent:,.2f}")
-            st.metric("Total Expenses", len(data))
+        totals = get_expense_totals(st.session_state.user_id, **window)
+        if totals["count"]:
+            st.metric("Total Spending", f"₹{totals['total_amount']:,.2f}")
+            st.metric("Total Expenses", totals["count"])
         else:
-            st.info("No expenses yet!")
+            st.info("No expenses yet!" if period == "All time" else "No expenses in this period.")
     
     # ---------------- DASHBOARD PAGE -------------------
     if menu == "📊 Dashboard":
         st.subheader("📊 Summary Dashboard")
-        data = get_all_expenses(st.session_state.user_id)
         
-        if not data:
-            st.info("🎉 Welcome! Start by adding your first expense to see your dashboard.")
+        if not totals["count"]:
+            st.info("🎉 Welcome! Start by adding your first expense to see your dashboard." if period == "All time"
+                    else "No expenses in this period.")
         else:
-            df = pd.DataFrame(data)
+            # Aggregates come from the rollup tables, one row per group
+            category_totals = get_rollup(st.session_state.user_id, "category", as_frame=True, **window)
+            mood_totals = get_rollup(st.session_state.user_id, "mood", as_frame=True, **window)
             
             # Top Metrics
             col1, col2, col3, col4 = st.columns(4)
             
             with col1:
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-                total_spent = df["amount"].sum()
+                total_spent = totals["total_amount"]
                 st.metric("💸 Total Spending", f"₹{total_spent:.2f}")
                 st.markdown('</div>', unsafe_allow_html=True)
             
             with col2:
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-                eco_factor = {"Food": 2.0, "Travel": 3.0, "Shopping": 1.5, "Bills": 0.5, "Other": 1.0}
-                df["Eco Impact"] = df.apply(lambda x: x["amount"]/100 * eco_factor.get(x["category"], 1), axis=1)
-                total_eco = df["Eco Impact"].sum()
+                total_eco = get_total_impact(st.session_state.user_id, **window)
                 st.metric("🌍 Eco Impact", f"{total_eco:.2f} kg CO₂")
                 st.markdown('</div>', unsafe_allow_html=True)
             
             with col3:
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-                avg_expense = df["amount"].mean()
+                avg_expense = totals["total_amount"] / totals["count"]
                 st.metric("📊 Avg Expense", f"₹{avg_expense:.2f}")
                 st.markdown('</div>', unsafe_allow_html=True)
             
             with col4:
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-                total_expenses = len(df)
+                total_expenses = totals["count"]
                 st.metric("📈 Total Entries", f"{total_expenses}")
                 st.markdown('</div>', unsafe_allow_html=True)
             
@@ -236,43 +253,38 @@ def main_app():
             with col1:
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
                 st.write("### 📈 Recent Expenses")
-                st.dataframe(df.head(10), use_container_width=True)
+                recent, _ = get_expenses_page(st.session_state.user_id, limit=10, as_frame=True, **window)
+                st.dataframe(charts.capped(recent.drop(columns="id")), column_config=DATE_COLUMN, use_container_width=True)
                 st.markdown('</div>', unsafe_allow_html=True)
                 
                 # Spending by Category
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
                 st.write("### 🏷️ Spending by Category")
-                category_totals = df.groupby("category")["amount"].sum().reset_index()
-                st.bar_chart(category_totals.set_index("category"))
+                st.bar_chart(charts.capped(category_totals.set_index("category")[["total_amount"]].rename(columns={"total_amount": "amount"})))
+                st.markdown('</div>', unsafe_allow_html=True)
+                
+                # Daily rollups summed into days, weeks or months by span
+                st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+                st.write("### 📅 Spending over Time")
+                daily = get_rollup(st.session_state.user_id, "daily", as_frame=True, **window)
+                st.line_chart(charts.time_series(daily, "day", ["total_amount"]).rename(columns={"total_amount": "amount"}))
                 st.markdown('</div>', unsafe_allow_html=True)
             
             with col2:
                 # Average spending per mood
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
                 st.write("### 😊 Spending by Mood")
-                avg_mood = df.groupby("mood")["amount"].mean().reset_index()
-                st.bar_chart(avg_mood.set_index("mood"))
+                avg_mood = mood_totals.set_index("mood")
+                st.bar_chart(charts.capped((avg_mood["total_amount"] / avg_mood["expense_count"]).rename("amount").to_frame()))
                 st.markdown('</div>', unsafe_allow_html=True)
                 
                 # Predict next 7 days spending
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
                 st.write("### 🔮 Weekly Forecast")
-                if len(df) >= 3:
-                    df["date"] = pd.to_datetime(df["date"])
-                    df.sort_values("date", inplace=True)
-                    df["Days"] = (df["date"] - df["date"].min()).dt.days
-                    
-                    X = df["Days"].values.reshape(-1,1)
-                    y = df["amount"].values
-                    
-                    model = LinearRegression()
-                    model.fit(X, y)
-                    
-                    future_days = np.array([X[-1][0]+i for i in range(1,8)]).reshape(-1,1)
-                    predicted = model.predict(future_days)
-                    
-                    for i, pred in enumerate(predicted[:4]):  # Show first 4 days
-                        st.write(f"**Day +{i+1}:** ₹{pred:.2f}")
+                predicted = forecast(st.session_state.user_id, 7, **window)
+                if predicted:
+                    for pred in predicted[:4]:  # Show first 4 days
+                        st.write(f"**Day +{pred['day']}:** ₹{pred['amount']:.2f}")
                 else:
                     st.info("Need 3+ expenses for predictions")
                 st.markdown('</div>', unsafe_allow_html=True)
@@ -286,8 +298,8 @@ def main_app():
         with col1:
             st.markdown('<div class="metric-card">', unsafe_allow_html=True)
             exp_date = st.date_input("📅 Date", date.today())
-            category = st.selectbox("📂 Category", ["🍔 Food", "🚗 Travel", "🛍️ Shopping", "📱 Bills", "🎯 Other"])
-            mood = st.selectbox("😊 Your Mood", ["😊 Happy", "😢 Sad", "😐 Neutral", "🎉 Excited", "😴 Tired"])
+            category = st.selectbox("📂 Category", CATEGORY_OPTIONS)
+            mood = st.selectbox("😊 Your Mood", MOOD_OPTIONS)
             st.markdown('</div>', unsafe_allow_html=True)
         
         with col2:
@@ -297,114 +309,278 @@ def main_app():
             
             if st.button("💾 Save Expense"):
                 if amount > 0:
-                    # Remove emoji from category for database
-                    clean_category = category.split(' ')[-1] if ' ' in category else category
-                    clean_mood = mood.split(' ')[-1] if ' ' in mood else mood
-                    
-                    add_expense(st.session_state.user_id, str(exp_date), clean_category, amount, description, clean_mood)
+                    expense_id = add_expense(st.session_state.user_id, str(exp_date), clean_label(category), amount, description, clean_label(mood))
                     st.success("✅ Expense added successfully!")
+                    # Scored against your history as it was inserted
+                    unusual = expense_anomaly(st.session_state.user_id, expense_id)
+                    if unusual:
+                        st.warning(f"🚨 Unusual: {describe(unusual)}")
                 else:
                     st.warning("⚠️ Please enter a valid amount")
             st.markdown('</div>', unsafe_allow_html=True)
+        
+        # Bulk onboarding from a CSV or bank statement export
+        with st.expander("📥 Import from CSV / bank statement"):
+            uploaded = st.file_uploader("CSV file", type=["csv"])
+            st.caption("Map your file's column names. Category and mood are optional; "
+                       "unknown values become Other / Neutral.")
+            map1, map2, map3 = st.columns(3)
+            with map1:
+                date_column = st.text_input("Date column", "date")
+                amount_column = st.text_input("Amount column", "amount")
+            with map2:
+                description_column = st.text_input("Description column", "description")
+                category_column = st.text_input("Category column", "category")
+            with map3:
+                mood_column = st.text_input("Mood column", "mood")
+                date_format = st.text_input("Date format (blank = auto)", placeholder="%d/%m/%Y")
+            expenses_negative = st.checkbox("Expenses are negative amounts (debits shown as -)")
+            
+            if st.button("📥 Import Expenses", disabled=uploaded is None):
+                progress = st.progress(0.0, text="Importing...")
+                size = max(uploaded.size, 1)
+                
+                def report(stats):
+                    # Uploads are read sequentially, so the file position tracks progress
+                    done = min(uploaded.tell() / size, 1.0)
+                    progress.progress(done, text=f"Imported {stats['inserted']:,} of {stats['read']:,} rows read")
+                
+                try:
+                    result = import_csv(
+                        st.session_state.user_id, uploaded,
+                        mapping={
+                            "date": date_column, "amount": amount_column, "description": description_column,
+                            "category": category_column, "mood": mood_column,
+                        },
+                        date_format=date_format or None,
+                        expenses_negative=expenses_negative,
+                        progress=report,
+                    )
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                else:
+                    progress.progress(1.0, text="Done")
+                    st.success(
+                        f"✅ Imported {result['inserted']:,} expenses "
+                        f"({result['duplicates']:,} duplicates, {result['skipped']:,} credits/zero rows, "
+                        f"{result['invalid']:,} invalid rows skipped)"
+                    )
+                    for error in result["errors"]:
+                        st.caption(error)
     
     # ----------------- VIEW EXPENSES PAGE -------------
     elif menu == "📋 View Expenses":
         st.subheader("📋 All Expenses")
-        data = get_all_expenses(st.session_state.user_id)
         
-        if data:
-            df = pd.DataFrame(data)
-            st.dataframe(df, use_container_width=True)
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                total = df["amount"].sum()
-                st.metric("💰 Total Spending", f"₹{total:.2f}")
-            with col2:
-                st.metric("📊 Total Expenses", len(data))
+        search_text = st.text_input("🔎 Search descriptions", placeholder="e.g. coffee, uber airport")
+        col1, col2, col3, col4, col5 = st.columns(5)
+        with col1:
+            category_filter = st.selectbox("📂 Category", ["All"] + CATEGORY_OPTIONS)
+        with col2:
+            mood_filter = st.selectbox("😊 Mood", ["All"] + MOOD_OPTIONS)
+        with col3:
+            min_amount = st.number_input("Min ₹", min_value=0.0, step=10.0)
+        with col4:
+            max_amount = st.number_input("Max ₹ (0 = any)", min_value=0.0, step=10.0)
+        with col5:
+            sort_label = st.selectbox("↕️ Sort by", list(SORT_OPTIONS))
+        
+        # Filtering, sorting and paging all happen in SQL
+        filters = {
+            "category": clean_label(category_filter) if category_filter != "All" else None,
+            "mood": clean_label(mood_filter) if mood_filter != "All" else None,
+            "min_amount": min_amount or None,
+            "max_amount": max_amount or None,
+            **window,
+        }
+        sort, descending = SORT_OPTIONS[sort_label]
+        
+        if search_text.strip():
+            # Ranked full-text matches; category and the sidebar period narrow them
+            search_filters = {"category": filters["category"], **window}
+            search_key = (search_text, tuple(sorted(search_filters.items())))
+            if st.session_state.get("search_key") != search_key:
+                st.session_state.search_key = search_key
+                st.session_state.search_offset = 0
+            offset = st.session_state.search_offset
+            rows, next_offset = search_expenses(
+                st.session_state.user_id, search_text, offset=offset, limit=PAGE_SIZE, as_frame=True, **search_filters
+            )
+            if rows.empty:
+                st.info("No descriptions match this search.")
+            else:
+                st.dataframe(charts.capped(rows.drop(columns=["id", "score"])), column_config=DATE_COLUMN, use_container_width=True)
+                nav1, nav2, nav3 = st.columns([1, 2, 1])
+                with nav1:
+                    if st.button("⬅️ Previous", disabled=offset == 0):
+                        st.session_state.search_offset = max(0, offset - PAGE_SIZE)
+                        st.rerun()
+                with nav2:
+                    st.caption(f"Results {offset + 1}–{offset + len(rows)}, best matches first (mood and amount filters don't apply)")
+                with nav3:
+                    if st.button("Next ➡️", disabled=next_offset is None):
+                        st.session_state.search_offset = next_offset
+                        st.rerun()
         else:
-            st.info("No expenses added yet!")
+            # Start again from the first page whenever the query changes
+            page_key = (tuple(sorted(filters.items())), sort, descending)
+            if st.session_state.get("expense_page_key") != page_key:
+                st.session_state.expense_page_key = page_key
+                st.session_state.expense_cursors = [None]
+            cursors = st.session_state.expense_cursors
+        
+            summary = get_expenses_summary(st.session_state.user_id, **filters)
+            rows, next_cursor = get_expenses_page(
+                st.session_state.user_id, after=cursors[-1], limit=PAGE_SIZE,
+                sort=sort, descending=descending, as_frame=True, **filters
+            )
+        
+            if not rows.empty:
+                st.dataframe(charts.capped(rows.drop(columns="id")), column_config=DATE_COLUMN, use_container_width=True)
+            
+                nav1, nav2, nav3 = st.columns([1, 2, 1])
+                with nav1:
+                    if st.button("⬅️ Previous", disabled=len(cursors) == 1):
+                        cursors.pop()
+                        st.rerun()
+                with nav2:
+                    total_pages = -(-summary["count"] // PAGE_SIZE)
+                    st.caption(f"Page {len(cursors)} of {total_pages}")
+                with nav3:
+                    if st.button("Next ➡️", disabled=next_cursor is None):
+                        cursors.append(next_cursor)
+                        st.rerun()
+            
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.metric("💰 Total Spending", f"₹{summary['total_amount']:.2f}")
+                with col2:
+                    st.metric("📊 Total Expenses", summary["count"])
+            elif any(filters.values()):
+                st.info("No expenses match these filters.")
+            else:
+                st.info("No expenses added yet!")
+        
+        # Only runs when the button is clicked. Rows stream from SQLite in
+        # chunks into a temporary file, but Streamlit turns whatever the
+        # callable returns into bytes and keeps them in its media storage
+        # (a file object or generator would be read whole too). So a click
+        # holds one copy of the finished file in memory: about 45 bytes a row
+        # as CSV with short descriptions, under 10 as Parquet. Exports too
+        # large for that go through `manage.py export`, which writes straight
+        # to disk.
+        with st.expander("⬇️ Export expenses"):
+            ex1, ex2, ex3 = st.columns(3)
+            with ex1:
+                export_start = st.date_input("From", value=start)
+            with ex2:
+                export_end = st.date_input("To", value=end)
+            with ex3:
+                export_format = st.selectbox("Format", ["csv", "parquet"] if parquet_available() else ["csv"])
+            export_categories = st.multiselect("Categories (leave empty for all)", CATEGORY_OPTIONS)
+            
+            export_user = st.session_state.user_id
+            export_filters = {
+                "start": export_start,
+                "end": export_end,
+                "categories": [clean_label(option) for option in export_categories],
+            }
+            
+            def build_export():
+                with tempfile.TemporaryFile() as out:
+                    export_expenses(export_user, out, format=export_format, **export_filters)
+                    out.seek(0)
+                    return out.read()
+            
+            st.download_button(
+                "⬇️ Download",
+                data=build_export,
+                file_name=f"expenses.{export_format}",
+                mime="text/csv" if export_format == "csv" else "application/vnd.apache.parquet",
+            )
     
     # ------------- PREDICTIVE SPENDING ----------------
     elif menu == "🔮 Predict Spending":
         st.subheader("🔮 Predictive Spending Forecast")
-        data = get_all_expenses(st.session_state.user_id)
         
-        if len(data) < 3:
+        col1, col2 = st.columns(2)
+        with col1:
+            horizon = st.selectbox("📅 Forecast horizon", [7, 14, 30], format_func=lambda days: f"{days} days")
+        with col2:
+            series = st.selectbox("📂 Category", ["All"] + CATEGORY_OPTIONS)
+        
+        # Nightly precomputed forecast while it is current, otherwise a
+        # closed-form fit from running sums kept up to date by add_expense
+        predicted = forecast(st.session_state.user_id, horizon, clean_label(series) if series != "All" else None, **window)
+        
+        if not predicted:
             st.warning("Not enough data to make predictions (minimum 3 entries required).")
         else:
-            df = pd.DataFrame(data)
-            df["date"] = pd.to_datetime(df["date"])
-            df.sort_values("date", inplace=True)
-            df["Days"] = (df["date"] - df["date"].min()).dt.days
-            
-            X = df["Days"].values.reshape(-1,1)
-            y = df["amount"].values
-            
-            model = LinearRegression()
-            model.fit(X, y)
-            
-            future_days = np.array([X[-1][0]+i for i in range(1,8)]).reshape(-1,1)
-            predicted = model.predict(future_days)
-            
             forecast_df = pd.DataFrame({
-                "Day": [f"Day +{i}" for i in range(1,8)],
-                "Predicted Amount (₹)": predicted.round(2)
+                "Day": [f"Day +{pred['day']}" for pred in predicted],
+                "Date": [pred["date"] for pred in predicted],
+                "Predicted Amount (₹)": [round(pred["amount"], 2) for pred in predicted]
             })
             
-            st.table(forecast_df)
+            st.table(charts.capped(forecast_df))
+            run = last_run(st.session_state.user_id) if not any(window.values()) else None
+            if run and run["horizon"] >= horizon:
+                st.caption(f"Precomputed by the nightly forecast run at {run['generated_at']} UTC")
+            else:
+                st.caption("Fitted on demand from your latest expenses")
             
             # Visual representation
             st.write("### 📈 Forecast Trend")
-            st.line_chart(forecast_df.set_index("Day"))
+            st.line_chart(charts.capped(charts.thin(forecast_df.set_index("Date")[["Predicted Amount (₹)"]])))
     
     # --------------- MOOD ANALYSIS -------------------
     elif menu == "😊 Mood Analysis":
         st.subheader("😊 Mood Linked Spending Analysis")
-        data = get_all_expenses(st.session_state.user_id)
         
-        if not data:
+        if not totals["count"]:
             st.info("No expenses added yet!")
         else:
-            df = pd.DataFrame(data)
-            
             col1, col2 = st.columns(2)
             
             with col1:
                 st.write("### 💰 Total Spending by Mood")
-                mood_summary = pd.DataFrame(get_spending_by_mood(st.session_state.user_id))
+                mood_summary = get_spending_by_mood(st.session_state.user_id, as_frame=True, **window)
                 if not mood_summary.empty:
-                    st.bar_chart(mood_summary.set_index("mood"))
+                    st.bar_chart(charts.capped(mood_summary.set_index("mood")))
                 else:
                     st.info("No mood data available")
             
             with col2:
                 st.write("### 🏷️ Spending by Category & Mood")
-                category_mood_summary = pd.DataFrame(get_spending_by_category_mood(st.session_state.user_id))
+                category_mood_summary = get_spending_by_category_mood(st.session_state.user_id, as_frame=True, **window)
                 if not category_mood_summary.empty:
-                    st.dataframe(category_mood_summary)
+                    st.dataframe(charts.capped(category_mood_summary))
                 else:
                     st.info("No category-mood data available")
+            
+            # Kept up to date by every insert, so nothing here scans history
+            st.write("### 🚨 Unusual Spending")
+            for group in drifting(st.session_state.user_id)[:3]:
+                direction = "up" if group["drift"] > 0 else "down"
+                st.info(f"Lately your {group['mood']}-mood {group['category']} spend is {direction}: "
+                        f"₹{group['recent']:,.0f} vs ₹{group['mean']:,.0f} on average")
+            anomalies = get_anomalies(st.session_state.user_id, **window)
+            if anomalies:
+                for unusual in anomalies:
+                    st.write(f"• {unusual['date']}: {describe(unusual)}")
+            else:
+                st.caption("Nothing unusual in this period")
     
     # ---------------- ECO IMPACT ----------------------
     elif menu == "🌍 Eco Impact":
         st.subheader("🌍 Eco Impact Calculator")
-        data = get_all_expenses(st.session_state.user_id)
+        category_impact = get_eco_impact(st.session_state.user_id, "category", as_frame=True, **window)
         
-        if not data:
+        if category_impact.empty:
             st.info("No expenses added yet!")
         else:
-            df = pd.DataFrame(data)
-            eco_factor = {
-                "Food": 2.0, "Travel": 3.0, "Shopping": 1.5, 
-                "Bills": 0.5, "Other": 1.0
-            }
-            
-            df["Eco Impact (kg CO₂)"] = df.apply(
-                lambda x: x["amount"]/100 * eco_factor.get(x["category"], 1), axis=1
-            )
-            
-            total_impact = df["Eco Impact (kg CO₂)"].sum()
+            category_impact = category_impact.rename(columns={"co2_kg": "Eco Impact (kg CO₂)"})
+            total_impact = category_impact["Eco Impact (kg CO₂)"].sum()
             
             col1, col2 = st.columns(2)
             
@@ -413,14 +589,18 @@ def main_app():
                 st.metric("🌳 Equivalent Tree Months", f"{total_impact / 21:.1f} months")
                 
                 st.write("### 📊 Eco Impact by Category")
-                category_impact = df.groupby("category")["Eco Impact (kg CO₂)"].sum().reset_index()
-                st.bar_chart(category_impact.set_index("category"))
+                st.bar_chart(charts.capped(category_impact.set_index("category")[["Eco Impact (kg CO₂)"]]))
+                
+                st.write("### 📈 Eco Impact over Time")
+                # Per day from SQL, then summed into days, weeks or months by span
+                daily_impact = get_eco_impact(st.session_state.user_id, "date", as_frame=True, **window)
+                st.line_chart(charts.time_series(daily_impact, "date", ["co2_kg"]).rename(columns={"co2_kg": "Eco Impact (kg CO₂)"}))
             
             with col2:
                 st.write("### 🔍 Detailed Breakdown")
-                eco_mood = pd.DataFrame(get_eco_impact_by_mood(st.session_state.user_id))
+                eco_mood = get_eco_impact_by_mood(st.session_state.user_id, as_frame=True, **window)
                 if not eco_mood.empty:
-                    st.dataframe(eco_mood)
+                    st.dataframe(charts.capped(eco_mood))
                 
                 st.write("### 💡 Eco Tips")
                 tips = [
@@ -433,14 +613,55 @@ def main_app():
                 for tip in tips:
                     st.write(f"• {tip}")
 
+    # ---------------- ADMIN METRICS -------------------
+    elif menu == ADMIN_PAGE and is_admin:
+        st.subheader("🛠️ Admin Metrics")
+        st.caption("Since this server process started")
+        
+        cache = cache_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Cache Hit Rate", f"{cache['hit_rate']:.1%}")
+        col2.metric("Cache Hits", cache["hits"])
+        col3.metric("Cached Entries", cache["entries"], f"{cache['bytes'] / 1024:,.0f} KiB", delta_color="off")
+        col4.metric("Evictions", cache["evictions"])
+        
+        latencies = pd.DataFrame(metrics.registry.snapshot())
+        if latencies.empty:
+            st.info("Nothing recorded yet")
+        else:
+            lookups = metrics.registry.counters()
+            latencies["cache_hits"] = [lookups.get(("cache_lookups", name, "hit"), 0) for name in latencies["name"]]
+            latencies["cache_misses"] = [lookups.get(("cache_lookups", name, "miss"), 0) for name in latencies["name"]]
+            for kind, label in [("page", "### 🖥️ Page Renders"), ("db", "### 🗄️ Database Calls"), ("forecast", "### 🔮 Forecasts")]:
+                rows = latencies[latencies["kind"] == kind].drop(columns="kind").sort_values("total_s", ascending=False)
+                if not rows.empty:
+                    st.write(label)
+                    st.dataframe(charts.capped(rows.set_index("name").round(3)), use_container_width=True)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("⬇️ Prometheus Metrics", metrics.registry.prometheus_text(),
+                               file_name="expense_tracker.prom", mime="text/plain")
+        with col2:
+            if st.button("♻️ Reset Metrics"):
+                metrics.registry.reset()
+                st.rerun()
+
 # ----------------- APP FLOW ----------------------
 def main():
     initialize_session_state()
     
-    if not st.session_state.logged_in:
-        show_login_page()
-    else:
-        main_app()
+    logged_in = st.session_state.logged_in
+    started = time.perf_counter()
+    try:
+        if not logged_in:
+            show_login_page()
+        else:
+            main_app()
+    finally:
+        # Also runs when st.rerun() cuts the script short
+        page = page_name(st.session_state.get("menu", PAGES[0])) if logged_in else "Login"
+        metrics.registry.observe("page", page, time.perf_counter() - started)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,262 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import closing
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from database import database_path, database_paths, index_expenses, read_connection, write_connection
+from metrics import timed
+
+# Whole years older than this many days move to the archive
+ARCHIVE_AFTER_DAYS = int(os.environ.get('EXPENSE_TRACKER_ARCHIVE_DAYS', 730))
+# Seconds between background runs; unset means no background archiver
+ARCHIVE_INTERVAL = float(os.environ.get('EXPENSE_TRACKER_ARCHIVE_INTERVAL', 0))
+# Decoded partitions kept in memory for reads that reach into the archive
+DECODED_CACHE_SIZE = 256
+
+# One row per (user, year): every column of its expenses, stored column by
+# column as JSON and zlib-compressed. Each hot file (the database, or each
+# shard) has its own archive file next to it.
+COLUMNS = ('id', 'user_id', 'date', 'category', 'amount', 'description', 'mood', 'created_at', 'fingerprint')
+SCHEMA = '''CREATE TABLE IF NOT EXISTS partitions (
+    user_id INTEGER NOT NULL,
+    year TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    archived_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, year)
+)'''
+
+def archive_path(path):
+    root, ext = os.path.splitext(path)
+    return f'{root}.archive{ext or ".db"}'
+
+def encode(rows):
+    return zlib.compress(json.dumps([list(column) for column in zip(*rows)]).encode(), 9)
+
+def decode(data):
+    return list(zip(*json.loads(zlib.decompress(data))))
+
+def cutoff_year(today=None, days=ARCHIVE_AFTER_DAYS):
+    # Years before this one are archived; the year containing the cutoff
+    # date stays hot, so partitions only ever cover complete years
+    return str(((today or date.today()) - timedelta(days=days)).year)
+
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+def _archive_connection(path):
+    archive = archive_path(path)
+    if archive not in _schema_ready:
+        with _schema_lock, write_connection(path=archive) as conn:
+            conn.execute(SCHEMA)
+            _schema_ready.add(archive)
+    return write_connection(path=archive)
+
+# ----------------- MOVING YEARS ------------------
+# Each partition moves in two commits: the merged partition is written to
+# the archive first, then the rows are deleted from expenses together with
+# the archived_years entry that makes reads look in the archive. A crash in
+# between leaves the rows in both places, which reads and the next run
+# both tolerate (rows are merged by id), so a run can stop anywhere and
+# simply be started again.
+def pending(path, before_year, user_id=None):
+    # (user_id, year, rows) of hot expenses in years before before_year
+    where, params = '', [f'{before_year}-01-01']
+    if user_id is not None:
+        where, params = ' AND user_id = ?', params + [user_id]
+    with read_connection(path=path) as conn:
+        return conn.execute(
+            f'''SELECT user_id, substr(date, 1, 4) AS year, COUNT(*) FROM expenses
+                WHERE date < ?{where} GROUP BY 1, 2 ORDER BY 1, 2''',
+            params
+        ).fetchall()
+
+def archive_partition(path, user_id, year):
+    # Returns the number of rows moved out of the hot file
+    window = (user_id, f'{year}-01-01', f'{int(year) + 1}-01-01')
+    with read_connection(path=path) as conn:
+        rows = conn.execute(
+            f'''SELECT {', '.join(COLUMNS)} FROM expenses
+                WHERE user_id = ? AND date >= ? AND date < ? ORDER BY id''',
+            window
+        ).fetchall()
+    if not rows:
+        return 0
+    rows = [tuple(row) for row in rows]
+    archived_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+    with _archive_connection(path) as conn:
+        existing = conn.execute(
+            'SELECT data FROM partitions WHERE user_id = ? AND year = ?', (user_id, year)
+        ).fetchone()
+        merged = {row[0]: row for row in decode(existing[0])} if existing else {}
+        merged.update((row[0], row) for row in rows)
+        merged = [merged[expense_id] for expense_id in sorted(merged)]
+        conn.execute(
+            'INSERT OR REPLACE INTO partitions (user_id, year, rows, data, archived_at) VALUES (?, ?, ?, ?, ?)',
+            (user_id, year, len(merged), encode(merged), archived_at)
+        )
+
+    with write_connection(path=path) as conn:
+        # Only the rows just archived; anything added since stays hot
+        conn.executemany('DELETE FROM expenses WHERE id = ?', [(row[0],) for row in rows])
+        # The delete trigger took them out of the search index; archived
+        # rows stay searchable, so put them back
+        index_expenses(conn, [(row[0], row[1], row[5]) for row in rows])
+        conn.execute(
+            '''INSERT OR REPLACE INTO archived_years (user_id, year, rows, total_amount, archived_at)
+               VALUES (?, ?, ?, ?, ?)''',
+            (user_id, year, len(merged), sum(row[4] for row in merged), archived_at)
+        )
+    return len(rows)
+
+@timed('archive')
+def run(before_year=None, user_id=None, stop=None):
+    # Archives every pending partition, one at a time; stop is an optional
+    # threading.Event checked between partitions
+    before_year = before_year or cutoff_year()
+    summary = {'partitions': 0, 'rows': 0, 'before_year': before_year}
+    paths = [path for path in database_paths() if os.path.exists(path)]
+    for path in paths:
+        for partition_user, year, _ in pending(path, before_year, user_id):
+            if stop is not None and stop.is_set():
+                return summary
+            summary['rows'] += archive_partition(path, partition_user, year)
+            summary['partitions'] += 1
+    return summary
+
+def restore(user_id, year=None):
+    # Moves archived years back into expenses (e.g. before split-shards);
+    # rollups already count them. Returns the number of rows restored.
+    path = database_path(user_id)
+    if not os.path.exists(archive_path(path)):
+        return 0
+    where, params = ('', (user_id,)) if year is None else (' AND year = ?', (user_id, str(year)))
+    with _archive_connection(path) as conn:
+        partitions = conn.execute(
+            f'SELECT year, data FROM partitions WHERE user_id = ?{where} ORDER BY year', params
+        ).fetchall()
+    restored = 0
+    for partition_year, data in partitions:
+        rows = decode(data)
+        with write_connection(path=path) as conn:
+            # Archived rows are still in the search index, so it needs no update
+            conn.executemany(
+                f'INSERT OR IGNORE INTO expenses ({", ".join(COLUMNS)}) VALUES ({", ".join("?" * len(COLUMNS))})',
+                rows
+            )
+            conn.execute('DELETE FROM archived_years WHERE user_id = ? AND year = ?', (user_id, partition_year))
+        with _archive_connection(path) as conn:
+            conn.execute('DELETE FROM partitions WHERE user_id = ? AND year = ?', (user_id, partition_year))
+        restored += len(rows)
+    return restored
+
+# ----------------- READING -----------------------
+_decoded = OrderedDict()  # (archive file, user_id, year, archived_at) -> rows
+_decoded_lock = threading.Lock()
+
+def _partition_rows(path, user_id, year, archived_at):
+    key = (archive_path(path), user_id, year, archived_at)
+    with _decoded_lock:
+        if key in _decoded:
+            _decoded.move_to_end(key)
+            return _decoded[key]
+    with read_connection(path=archive_path(path)) as conn:
+        row = conn.execute(
+            'SELECT data FROM partitions WHERE user_id = ? AND year = ?', (user_id, year)
+        ).fetchone()
+    rows = decode(row[0]) if row else []
+    with _decoded_lock:
+        _decoded[key] = rows
+        while len(_decoded) > DECODED_CACHE_SIZE:
+            _decoded.popitem(last=False)
+    return rows
+
+@timed('archive')
+def load_cold(conn, path, user_id, years):
+    # Fills temp.cold_expenses on this (reader) connection with the user's
+    # archived rows for the given archived_years entries. The table stays
+    # between reads, so repeated reads of the same years skip the reload.
+    conn.execute(
+        '''CREATE TEMP TABLE IF NOT EXISTS cold_expenses (
+            id INTEGER PRIMARY KEY, user_id INTEGER, date TEXT, category TEXT,
+            amount REAL, description TEXT, mood TEXT
+        )'''
+    )
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS cold_loaded (key TEXT)')
+    key = json.dumps([archive_path(path), user_id, [list(year) for year in years]])
+    if conn.execute('SELECT 1 FROM temp.cold_loaded WHERE key = ?', (key,)).fetchone():
+        return
+    conn.execute('DELETE FROM temp.cold_loaded')
+    conn.execute('DELETE FROM temp.cold_expenses')
+    for year, archived_at in years:
+        conn.executemany(
+            'INSERT OR IGNORE INTO temp.cold_expenses VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [row[:7] for row in _partition_rows(path, user_id, year, archived_at)]
+        )
+    conn.execute('INSERT INTO temp.cold_loaded VALUES (?)', (key,))
+
+def fingerprints(path, user_id, years):
+    # Import fingerprints among the user's archived rows, for de-duplication
+    return {
+        row[8] for year, archived_at in years
+        for row in _partition_rows(path, user_id, year, archived_at) if row[8] is not None
+    }
+
+def archived_rows(path, user_id=None):
+    # Every archived row of one hot file, straight from disk
+    archive = archive_path(path)
+    if not os.path.exists(archive):
+        return []
+    where, params = ('', ()) if user_id is None else (' WHERE user_id = ?', (user_id,))
+    uri = Path(archive).resolve().as_uri() + '?mode=ro'
+    with closing(sqlite3.connect(uri, uri=True)) as conn:
+        return [row for (data,) in conn.execute(f'SELECT data FROM partitions{where}', params) for row in decode(data)]
+
+def stats():
+    # Per file: partitions, archived rows and archive size on disk
+    result = []
+    for path in database_paths():
+        archive = archive_path(path)
+        if not os.path.exists(archive):
+            continue
+        with read_connection(path=archive) as conn:
+            partitions, rows = conn.execute('SELECT COUNT(*), COALESCE(SUM(rows), 0) FROM partitions').fetchone()
+        size = sum(os.path.getsize(archive + suffix) for suffix in ('', '-wal') if os.path.exists(archive + suffix))
+        result.append({'path': archive, 'partitions': partitions, 'rows': rows, 'bytes': size})
+    return result
+
+# ----------------- BACKGROUND --------------------
+_archiver = None
+_archiver_stop = threading.Event()
+
+def start_archiver(interval=None):
+    # Daemon thread running run() every interval seconds; idempotent
+    global _archiver
+    interval = interval or ARCHIVE_INTERVAL
+    if _archiver is not None or not interval:
+        return _archiver
+
+    def loop():
+        while not _archiver_stop.wait(interval):
+            try:
+                run(stop=_archiver_stop)
+            except sqlite3.Error:
+                pass  # e.g. busy during a long write; next interval resumes
+
+    _archiver = threading.Thread(target=loop, name='expense-archiver', daemon=True)
+    _archiver.start()
+    return _archiver
+
+def stop_archiver():
+    global _archiver
+    if _archiver is not None:
+        _archiver_stop.set()
+        _archiver.join()
+        _archiver = None
+        _archiver_stop.clear()
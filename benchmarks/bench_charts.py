@@ -0,0 +1,97 @@
+# python -m benchmarks.bench_charts [--years 1 5 10] [--per-day 5]
+#
+# What the time-series charts send to the browser, before and after
+# charts.py: one point per expense (charting the raw frame), one point per
+# day (the rollup as it comes out of SQL), and charts.time_series (adaptive
+# buckets, LTTB, payload cap). Reports points, Arrow payload bytes and the
+# server-side time Streamlit spends turning the frame into a chart element
+# (st.line_chart in bare mode: Vega-Lite spec plus Arrow serialization).
+# That time is mostly Altair validating the spec, about the same for any
+# number of points; the browser's parse and draw time, which grows with
+# the points, isn't measured here.
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import warnings
+from datetime import date
+
+from benchmarks import datagen
+import charts
+import database
+import eco
+
+
+def render_ms(frame, repeat):
+    import streamlit as st
+
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        st.line_chart(frame)
+        times.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(times), 2)
+
+
+def measure(frame, repeat):
+    return {"points": len(frame), "bytes": charts.payload_bytes(frame), "render_ms": render_ms(frame, repeat)}
+
+
+def run(db_path, years, args):
+    days = int(years * 365.25)
+    user_id = datagen.load(db_path, users=1, per_user=days * args.per_day, seed=args.seed,
+                           start=date(2000, 1, 1), days=days)[0]
+    expenses = database.get_expenses_frame.uncached(user_id)
+    daily = database.get_rollup.uncached(user_id, "daily", as_frame=True)
+    daily_impact = eco.get_eco_impact(user_id, "date", as_frame=True)
+
+    started = time.perf_counter()
+    prepared = charts.time_series(daily, "day", ["total_amount"])
+    prepare_ms = (time.perf_counter() - started) * 1000
+    result = {
+        "years": years,
+        "expenses": len(expenses),
+        "spending": {
+            "per_expense": measure(expenses.set_index("date")[["amount"]], args.repeat),
+            "per_day": measure(daily.set_index("day")[["total_amount"]], args.repeat),
+            "prepared": dict(measure(prepared, args.repeat), prepare_ms=round(prepare_ms, 2)),
+        },
+        "eco": {
+            "per_day": measure(daily_impact.set_index("date")[["co2_kg"]], args.repeat),
+            "prepared": measure(charts.time_series(daily_impact, "date", ["co2_kg"]), args.repeat),
+        },
+    }
+    for chart, variants in (("spending", result["spending"]), ("eco", result["eco"])):
+        for variant, stats in variants.items():
+            print(f"{years:>3}y {chart:<9} {variant:<12} {stats['points']:>9,} points "
+                  f"{stats['bytes'] / 1024:>10,.1f} KiB  {stats['render_ms']:>8.2f} ms", flush=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chart payload size and render time before and after charts.py")
+    parser.add_argument("--years", type=float, nargs="+", default=[1, 5, 10], help="history length")
+    parser.add_argument("--per-day", type=int, default=5, help="expenses per day")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    results = []
+    for years in args.years:
+        with tempfile.TemporaryDirectory() as tmp:
+            results.append(run(os.path.join(tmp, "bench.db"), years, args))
+            database.close_connections()
+            # Every run's user has the same id and data version
+            database.read_cache.clear()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
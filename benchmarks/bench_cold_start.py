@@ -0,0 +1,90 @@
+# python -m benchmarks.bench_cold_start [--runs N]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import ROOT
+import database
+
+# Runs in a fresh interpreter so nothing is already imported or cached
+CHILD = r"""
+import json, statistics, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+harness_import = time.perf_counter() - started
+
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+started = time.perf_counter()
+at.run()
+login_first_paint = time.perf_counter() - started
+loaded_on_login = sorted(m for m in ("pandas", "numpy", "sklearn", "pyarrow") if m in sys.modules)
+
+def rerun_times(count):
+    times = []
+    for _ in range(count):
+        started = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - started)
+    return times
+
+login_reruns = rerun_times(int(sys.argv[2]))
+
+at.session_state.logged_in = True
+at.session_state.user_id = int(sys.argv[3])
+at.session_state.username = "bench"
+started = time.perf_counter()
+at.run()
+dashboard_first_paint = time.perf_counter() - started
+dashboard_reruns = rerun_times(int(sys.argv[2]))
+
+print(json.dumps({
+    "harness_import_s": harness_import,
+    "login_first_paint_s": login_first_paint,
+    "login_rerun_median_s": statistics.median(login_reruns),
+    "modules_loaded_on_login": loaded_on_login,
+    "dashboard_first_paint_s": dashboard_first_paint,
+    "dashboard_rerun_median_s": statistics.median(dashboard_reruns),
+    "exceptions": [str(e.value) for e in at.exception],
+}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start and per-rerun overhead of app.py")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes to average over")
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--expenses", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        database.configure(db_path)
+        database.init_db()
+        user_id = database.create_user("bench", "bench")
+        database.add_expenses_bulk([
+            (user_id, f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}", database.CATEGORIES[i % 5], 10.0 + i % 90, "", database.MOODS[i % 5])
+            for i in range(args.expenses)
+        ])
+        database.close_connections()
+
+        env = dict(os.environ, EXPENSE_TRACKER_DB=db_path)
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, "-c", CHILD, os.path.join(ROOT, "app.py"), str(args.reruns), str(user_id)],
+                env=env, cwd=ROOT, capture_output=True, text=True, check=True,
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    result = {key: value for key, value in runs[0].items() if not key.endswith("_s")}
+    for key in runs[0]:
+        if key.endswith("_s"):
+            result[key] = round(sum(run[key] for run in runs) / len(runs), 4)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# python -m benchmarks.bench_frames [--rows 100000 1000000]
+#
+# Loading one user's expenses into a DataFrame: the old path (sqlite3.Row ->
+# dict per row -> pd.DataFrame -> pd.to_datetime) against the typed
+# columnar fetch behind get_expenses_frame. Reports time and peak traced
+# memory for building the frame, and the size of the result.
+import argparse
+import gc
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks import datagen
+import database
+
+
+def dict_path(user_id):
+    with database.read_connection(user_id) as conn:
+        rows = conn.execute(database.HOT_QUERIES["get_all_expenses"], (user_id,)).fetchall()
+    df = pd.DataFrame([dict(row) for row in rows])
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+def columnar_path(user_id):
+    return database.get_expenses_frame.uncached(user_id)
+
+
+def profile(fn, user_id, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn(user_id)
+        times.append(time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    df = fn(user_id)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "median_s": round(statistics.median(times), 4),
+        "peak_mb": round(peak / 2**20, 1),
+        "frame_mb": round(df.memory_usage(deep=True).sum() / 2**20, 1),
+        "dtypes": {column: str(dtype) for column, dtype in df.dtypes.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dict rows vs typed columnar DataFrame loading")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000], help="expenses for the user")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            user_id = datagen.load(os.path.join(tmp, "bench.db"), users=1, per_user=rows, seed=args.seed)[0]
+            result = {
+                "rows": rows,
+                "dicts": profile(dict_path, user_id, args.repeat),
+                "columnar": profile(columnar_path, user_id, args.repeat),
+            }
+            database.close_connections()
+        results.append(result)
+        old, new = result["dicts"], result["columnar"]
+        print(f"{rows:>10,} rows: {old['median_s']:.3f}s -> {new['median_s']:.3f}s, "
+              f"peak {old['peak_mb']:.0f} -> {new['peak_mb']:.0f} MB, "
+              f"frame {old['frame_mb']:.0f} -> {new['frame_mb']:.0f} MB", flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# python -m benchmarks.bench_group_commit [--writers 1 4 16 64] [--seconds 3]
+#
+# Inserts/sec of add_expense with one commit per call against the group
+# commit writer, with N threads adding at once (one user each), the way
+# concurrent Streamlit sessions share a process. Both paths run at the same
+# --synchronous level. The app itself does not: plain add_expense commits
+# under NORMAL (no fsync per commit, recent commits can be lost on power
+# loss), while group commits run under database.GROUP_COMMIT_SYNCHRONOUS
+# (FULL) and are on disk when acknowledged.
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks import datagen
+import database
+
+DEFAULT_WRITERS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def run(db_path, writers, seconds, group_commit, seed):
+    database.configure(db_path, group_commit=group_commit)
+    database.init_db()
+    user_ids = [database.create_user(f"writer{i}", "bench") for i in range(writers)]
+    latencies = [[] for _ in range(writers)]
+    barrier = threading.Barrier(writers + 1)
+
+    def writer(index):
+        rows = datagen.generate_user_expenses(user_ids[index], 1_000_000, seed, index)
+        barrier.wait()
+        deadline = time.perf_counter() + seconds
+        for row in rows:
+            started = time.perf_counter()
+            database.add_expense(*row)
+            latencies[index].append(time.perf_counter() - started)
+            if started > deadline:
+                break
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    transactions = sum(writer.transactions for writer in database._group_writers.values())
+    database.close_connections()
+
+    times = sorted(t * 1000 for per_writer in latencies for t in per_writer)
+    result = {
+        "inserts": len(times),
+        "inserts_per_sec": round(len(times) / elapsed, 1),
+        "p50_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[int(len(times) * 0.95)], 3),
+        "p99_ms": round(times[int(len(times) * 0.99)], 3),
+    }
+    if transactions:
+        result["rows_per_transaction"] = round(len(times) / transactions, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="add_expense throughput with and without group commit")
+    parser.add_argument("--writers", type=int, nargs="+", default=list(DEFAULT_WRITERS))
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--rows", type=int, default=database.GROUP_COMMIT_ROWS, help="group commit batch size")
+    parser.add_argument("--delay-ms", type=float, default=database.GROUP_COMMIT_MS, help="group commit wait")
+    parser.add_argument("--synchronous", choices=["NORMAL", "FULL"], default="FULL",
+                        help="for both paths; FULL (the group commit default) fsyncs the WAL on every commit, "
+                             "NORMAL (plain add_expense's) only at checkpoints")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    database.GROUP_COMMIT_ROWS = args.rows
+    database.GROUP_COMMIT_MS = args.delay_ms
+    database.PRAGMAS = [(name, args.synchronous if name == "synchronous" else value) for name, value in database.PRAGMAS]
+    database.GROUP_COMMIT_SYNCHRONOUS = args.synchronous
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for writers in args.writers:
+            row = {"writers": writers}
+            for mode, group_commit in (("per_call", False), ("group_commit", True)):
+                db_path = os.path.join(tmp, f"{mode}_{writers}.db")
+                row[mode] = run(db_path, writers, args.seconds, group_commit, args.seed)
+            row["speedup"] = round(row["group_commit"]["inserts_per_sec"] / row["per_call"]["inserts_per_sec"], 2)
+            results.append(row)
+            print(f"{writers:>3} writers: {row['per_call']['inserts_per_sec']:>9,.0f}/s per call, "
+                  f"{row['group_commit']['inserts_per_sec']:>9,.0f}/s group commit "
+                  f"(x{row['speedup']}, p95 {row['per_call']['p95_ms']:.2f} -> {row['group_commit']['p95_ms']:.2f} ms)",
+                  flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"synchronous": args.synchronous, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# python -m benchmarks.bench_import [--rows N]
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import datagen
+import database
+import importer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSV import throughput")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=importer.CHUNK_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "statement.csv")
+        datagen.write_csv(csv_path, args.rows)
+        database.configure(os.path.join(tmp, "bench.db"))
+        database.init_db()
+        user_id = database.create_user("bench", "bench")
+
+        result = importer.import_csv(user_id, csv_path, chunk_size=args.chunk_size)
+        print(f"import:   {result['inserted']:,} rows in {result['seconds']:.1f}s "
+              f"({result['rows_per_sec']:,.0f} rows/s)")
+
+        started = time.perf_counter()
+        again = importer.import_csv(user_id, csv_path, chunk_size=args.chunk_size)
+        print(f"re-import: {again['duplicates']:,} duplicates skipped in {time.perf_counter() - started:.1f}s")
+
+        # Baseline: the old one-commit-per-row path, on a sample
+        sample = min(args.rows, 2000)
+        started = time.perf_counter()
+        for i in range(sample):
+            database.add_expense(user_id, "2024-01-01", "Food", 10.0, f"single {i}", "Happy")
+        per_row = (time.perf_counter() - started) / sample
+        print(f"add_expense: {1 / per_row:,.0f} rows/s (sample of {sample:,})")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# python -m benchmarks.bench_search [--rows 1000000 5000000] [--users 100]
+#
+# Latency of description search: search_expenses (FTS5, ranked) against the
+# LIKE '%term%' filter over the user's rows it replaces, for common and rare
+# words, prefixes, phrases and with category/date filters. Read cache off.
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks import datagen
+import database
+
+# (label, search text, filters)
+QUERIES = (
+    ("common word", "coffee", {}),
+    ("rare word", "flight", {}),
+    ("prefix", "elec", {}),
+    ("two words", "train ticket", {}),
+    ("category + year", "dinner", {"category": "Food", "start": "2023-01-01", "end": "2023-12-31"}),
+    ("no match", "yacht", {}),
+)
+
+
+def like_search(user_id, text, limit, category=None, start=None, end=None):
+    clauses, params = database.date_window(start, end)
+    if category:
+        clauses.append("category = ?")
+        params.append(category)
+    for word in text.split():
+        clauses.append("description LIKE ?")
+        params.append(f"%{word}%")
+    with database.read_connection(user_id) as conn:
+        return conn.execute(
+            f"""SELECT id, date, category, amount, description, mood FROM expenses
+                WHERE user_id = ?{"".join(" AND " + clause for clause in clauses)}
+                ORDER BY date DESC LIMIT ?""",
+            [user_id] + params + [limit]
+        ).fetchall()
+
+
+def timings(fn, user_ids, repeat):
+    times = []
+    for _ in range(repeat):
+        for user_id in user_ids:
+            started = time.perf_counter()
+            fn(user_id)
+            times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    return {
+        "p50_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[int(len(times) * 0.95)], 3),
+    }
+
+
+def file_mb(db_path):
+    return sum(os.path.getsize(db_path + suffix) for suffix in ("", "-wal") if os.path.exists(db_path + suffix)) / 2**20
+
+
+def run(db_path, rows, args):
+    started = time.perf_counter()
+    user_ids = datagen.load(db_path, users=args.users, per_user=rows // args.users, seed=args.seed)
+    load_s = time.perf_counter() - started
+    with database.read_connection() as conn:
+        index_pages = conn.execute("SELECT COUNT(*) FROM dbstat WHERE name LIKE 'expenses_fts%'").fetchone()[0] \
+            if conn.execute("SELECT 1 FROM pragma_module_list WHERE name = 'dbstat'").fetchone() else None
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    sample = user_ids[:: max(1, len(user_ids) // args.sample)][: args.sample]
+
+    result = {"rows": rows, "users": args.users, "load_s": round(load_s, 1), "db_mb": round(file_mb(db_path), 1)}
+    if index_pages is not None:
+        result["fts_index_mb"] = round(index_pages * page_size / 2**20, 1)
+    result["queries"] = {}
+    for label, text, filters in QUERIES:
+        fts = timings(lambda user_id: database.search_expenses.uncached(user_id, text, limit=args.limit, **filters),
+                      sample, args.repeat)
+        like = timings(lambda user_id: like_search(user_id, text, args.limit, **filters), sample, args.repeat)
+        result["queries"][label] = {"fts": fts, "like": like}
+        print(f"{rows:>10,} rows  {label:<16} fts p50 {fts['p50_ms']:>8.2f} ms  p95 {fts['p95_ms']:>8.2f} ms   "
+              f"like p50 {like['p50_ms']:>8.2f} ms  p95 {like['p95_ms']:>8.2f} ms", flush=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FTS5 description search latency against LIKE scans")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 5_000_000], help="total expenses")
+    parser.add_argument("--users", type=int, default=100, help="rows are spread evenly over this many users")
+    parser.add_argument("--sample", type=int, default=20, help="users queried per search")
+    parser.add_argument("--limit", type=int, default=database.SEARCH_PAGE)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            results.append(run(os.path.join(tmp, "bench.db"), rows, args))
+            database.close_connections()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# python -m benchmarks.bench_shards [--shards 0 1 2 4 8] [--writers 8] [--seconds 3]
+#
+# Write throughput as the number of shard files grows. Each writer is its
+# own process (as separate app servers would be) adding expenses for its
+# own users, so writers only contend when their users share a shard.
+# --shards 0 is the unpartitioned single file.
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks import datagen
+import database
+
+DEFAULT_SHARDS = (0, 1, 2, 4, 8)
+
+
+def writer(db_path, shards, synchronous, user_ids, seconds, batch, seed, index, start, results):
+    database.PRAGMAS = [(name, synchronous if name == "synchronous" else value) for name, value in database.PRAGMAS]
+    database.configure(db_path, shards=shards)
+    database.init_db()
+    rows = [
+        datagen.generate_user_expenses(user_id, 10_000_000, seed, index * len(user_ids) + i)
+        for i, user_id in enumerate(user_ids)
+    ]
+    start.wait()
+    inserted = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for user_rows in rows:
+            if batch == 1:
+                database.add_expense(*next(user_rows))
+            else:
+                database.add_expenses_bulk([next(user_rows) for _ in range(batch)])
+            inserted += batch
+    results.put(inserted)
+    database.close_connections()
+
+
+def run(db_path, shards, args):
+    database.configure(db_path, shards=shards)
+    database.init_db()
+    user_ids = [database.create_user(f"user{i}", "bench") for i in range(args.writers * args.users_per_writer)]
+    database.close_connections()
+
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=writer, args=(
+            db_path, shards, args.synchronous,
+            user_ids[i * args.users_per_writer:(i + 1) * args.users_per_writer],
+            args.seconds, args.batch, args.seed, i, start, results,
+        ))
+        for i in range(args.writers)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(args.warmup)  # let every process import and open its connections
+    start.set()
+    inserted = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return {"shards": shards, "inserts": inserted, "inserts_per_sec": round(inserted / args.seconds, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write throughput against shard count")
+    parser.add_argument("--shards", type=int, nargs="+", default=list(DEFAULT_SHARDS))
+    parser.add_argument("--writers", type=int, default=8, help="writer processes")
+    parser.add_argument("--users-per-writer", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--batch", type=int, default=1, help="rows per transaction; 1 uses add_expense")
+    parser.add_argument("--synchronous", choices=["NORMAL", "FULL"], default="FULL",
+                        help="FULL fsyncs every commit, which is where one shared lock hurts most")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    results = []
+    for shards in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            result = run(os.path.join(tmp, "bench.db"), shards, args)
+        results.append(result)
+        print(f"{shards:>2} shards: {result['inserts_per_sec']:>9,.0f} inserts/s "
+              f"({args.writers} writers, {args.batch} rows per transaction)", flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import csv
+import hashlib
+import random
+from datetime import date, timedelta
+
+import database
+
+DEFAULT_CATEGORY_WEIGHTS = {"Food": 0.35, "Travel": 0.15, "Shopping": 0.2, "Bills": 0.2, "Other": 0.1}
+DEFAULT_MOOD_WEIGHTS = {"Happy": 0.3, "Sad": 0.15, "Neutral": 0.3, "Excited": 0.15, "Tired": 0.1}
+# Median spend per category (₹); amounts are log-normal around these
+MEDIAN_AMOUNT = {"Food": 250, "Travel": 600, "Shopping": 1200, "Bills": 1500, "Other": 400}
+DESCRIPTIONS = {
+    "Food": ["lunch", "groceries", "coffee", "dinner out", "snacks"],
+    "Travel": ["cab", "train ticket", "fuel", "metro card", "flight"],
+    "Shopping": ["clothes", "headphones", "books", "shoes", "gift"],
+    "Bills": ["electricity", "phone recharge", "internet", "rent", "water"],
+    "Other": ["donation", "haircut", "movie", "medicine", "misc"],
+}
+
+
+def user_rng(seed, user_index):
+    # Each user's data depends only on (seed, user), not on how many users
+    # are generated, so datasets of different sizes share their prefix
+    digest = hashlib.sha256(f"{seed}:{user_index}".encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def generate_user_expenses(user_id, count, seed=0, user_index=0, start=date(2020, 1, 1), days=5 * 365,
+                           category_weights=None, mood_weights=None):
+    category_weights = category_weights or DEFAULT_CATEGORY_WEIGHTS
+    mood_weights = mood_weights or DEFAULT_MOOD_WEIGHTS
+    categories, category_p = list(category_weights), list(category_weights.values())
+    moods, mood_p = list(mood_weights), list(mood_weights.values())
+    rng = user_rng(seed, user_index)
+    for _ in range(count):
+        category = rng.choices(categories, category_p)[0]
+        yield (
+            user_id,
+            (start + timedelta(days=rng.randrange(days))).isoformat(),
+            category,
+            round(rng.lognormvariate(0, 0.6) * MEDIAN_AMOUNT.get(category, 300), 2),
+            rng.choice(DESCRIPTIONS.get(category, ["misc"])),
+            rng.choices(moods, mood_p)[0],
+        )
+
+
+def load(db_path, users=10, per_user=100, seed=0, chunk_size=50_000, **distribution):
+    # Creates the real schema through the migrations and writes through the
+    # bulk insert path, so rollups and statistics are populated as in prod.
+    # Returns the list of user ids.
+    database.configure(db_path)
+    database.init_db()
+    user_ids = []
+    for index in range(users):
+        user_ids.append(database.create_user(f"user{index}", f"password{index}"))
+
+    batch = []
+    for index, user_id in enumerate(user_ids):
+        for expense in generate_user_expenses(user_id, per_user, seed, index, **distribution):
+            batch.append(expense)
+            if len(batch) >= chunk_size:
+                database.add_expenses_bulk(batch)
+                batch.clear()
+    if batch:
+        database.add_expenses_bulk(batch)
+    return user_ids
+
+
+def write_csv(path, count, seed=0, **distribution):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "category", "amount", "description", "mood"])
+        for expense in generate_user_expenses(0, count, seed, **distribution):
+            writer.writerow(expense[1:])
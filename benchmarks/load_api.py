@@ -0,0 +1,182 @@
+# python -m benchmarks.load_api [--url http://127.0.0.1:8000] [--threads 16] [--seconds 10]
+#
+# Without --url, starts uvicorn on a temporary database and tears it down
+# afterwards. Each thread logs in as its own user and loops over a weighted
+# mix of single adds, batch adds and reads.
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks import ROOT
+
+# (name, weight)
+MIX = (
+    ("add", 40),
+    ("batch", 5),
+    ("page", 20),
+    ("totals", 15),
+    ("mood", 10),
+    ("forecast", 10),
+)
+CATEGORIES = ("Food", "Travel", "Shopping", "Bills", "Other")
+MOODS = ("Happy", "Sad", "Neutral", "Excited", "Tired")
+
+
+class Client:
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self.headers = {"Content-Type": "application/json"}
+
+    def request(self, method, path, body=None, params=None):
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        self.conn.request(method, path, json.dumps(body) if body is not None else None, self.headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        return response.status, json.loads(data) if data else None
+
+    def login(self, username, password):
+        self.request("POST", "/users", {"username": username, "password": password})
+        status, body = self.request("POST", "/token", {"username": username, "password": password})
+        if status != 200:
+            raise RuntimeError(f"login failed for {username}: {status} {body}")
+        self.headers["Authorization"] = f"Bearer {body['access_token']}"
+
+
+def expense(rng):
+    return {
+        "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "category": rng.choice(CATEGORIES),
+        "amount": round(rng.lognormvariate(5, 1), 2),
+        "description": "load test",
+        "mood": rng.choice(MOODS),
+    }
+
+
+def worker(url, index, deadline, batch_size, results, seed):
+    rng = random.Random(seed * 1_000 + index)
+    client = Client(url)
+    client.login(f"load{seed}_{index}", "load")
+    names = [name for name, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        if name == "add":
+            status, _ = client.request("POST", "/expenses", expense(rng))
+        elif name == "batch":
+            status, _ = client.request("POST", "/expenses/batch", {"expenses": [expense(rng) for _ in range(batch_size)]})
+        elif name == "page":
+            status, _ = client.request("GET", "/expenses", params={"limit": 50})
+        elif name == "totals":
+            status, _ = client.request("GET", "/totals")
+        elif name == "mood":
+            status, _ = client.request("GET", "/spending/mood")
+        else:
+            status, _ = client.request("GET", "/forecast", params={"horizon": 7})
+        results[name].append((time.perf_counter() - started, status))
+
+
+def start_server(db_path, port):
+    env = dict(os.environ, EXPENSE_TRACKER_DB=db_path)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def summarize(results, seconds, batch_size):
+    report = {}
+    for name, samples in results.items():
+        if not samples:
+            continue
+        times = sorted(elapsed * 1000 for elapsed, _ in samples)
+        report[name] = {
+            "requests": len(samples),
+            "errors": sum(1 for _, status in samples if status >= 400),
+            "per_sec": round(len(samples) / seconds, 1),
+            "p50_ms": round(statistics.median(times), 2),
+            "p95_ms": round(times[int(len(times) * 0.95)], 2),
+            "p99_ms": round(times[int(len(times) * 0.99)], 2),
+        }
+    total = sum(len(samples) for samples in results.values())
+    rows = len(results["add"]) + len(results["batch"]) * batch_size
+    report["overall"] = {
+        "requests": total,
+        "per_sec": round(total / seconds, 1),
+        "rows_written_per_sec": round(rows / seconds, 1),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the JSON API")
+    parser.add_argument("--url", help="running API to test; default starts a local one on a temp database")
+    parser.add_argument("--threads", type=int, default=16, help="concurrent clients, one user each")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = None
+        url = args.url
+        if url is None:
+            port = free_port()
+            server = start_server(os.path.join(tmp, "load.db"), port)
+            url = f"http://127.0.0.1:{port}"
+        try:
+            results = {name: [] for name, _ in MIX}
+            deadline = time.perf_counter() + args.seconds
+            threads = [
+                threading.Thread(target=worker, args=(url, i, deadline, args.batch_size, results, args.seed))
+                for i in range(args.threads)
+            ]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            report = summarize(results, time.perf_counter() - started, args.batch_size)
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+
+    report["config"] = {"url": args.url or "local", "threads": args.threads, "seconds": args.seconds,
+                        "batch_size": args.batch_size}
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# python -m benchmarks.load_sessions [--processes 1 4] [--threads 8] [--seconds 20] [--rows 2000]
+#
+# Many people using the Streamlit app at once, without a browser or network:
+# every simulated session is its own headless AppTest of app.py, logging in
+# through the login form (verify_user) as its own user, then looping over
+# Add Expense and every analytics page. Sessions run as threads inside one
+# or more processes (--processes 1 is one app server; more processes share
+# the database file the way several app servers would). Each configuration
+# reports p50/p95/p99 per step, throughput and the share of steps that
+# failed with "database is locked".
+#
+# The login step includes the one-second welcome pause in app.py.
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks import ROOT, datagen
+import database
+
+APP = os.path.join(ROOT, "app.py")
+# (step, weight) for the loop after login
+MIX = (
+    ("add", 30),
+    ("📊 Dashboard", 20),
+    ("📋 View Expenses", 15),
+    ("🔮 Predict Spending", 10),
+    ("😊 Mood Analysis", 15),
+    ("🌍 Eco Impact", 10),
+)
+LOCKED = "database is locked"
+
+
+def outcome(at, error=None):
+    # "ok", "locked" or "error" for the run just made
+    messages = [str(error)] if error is not None else [exception.message for exception in at.exception]
+    if not messages:
+        return "ok"
+    return "locked" if any(LOCKED in message for message in messages) else "error"
+
+
+def timed_run(at, results, step, action=None):
+    started = time.perf_counter()
+    error = None
+    try:
+        if action:
+            action()
+        at.run()
+    except Exception as e:  # the harness itself, e.g. a run timing out
+        error = e
+    result = outcome(at, error)
+    results.append((step, time.perf_counter() - started, result))
+    return result
+
+
+def session(index, deadline, seed, results):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed * 1_000 + index)
+    at = AppTest.from_file(APP, default_timeout=120)
+    at.run()
+
+    def login():
+        # datagen.load creates user<i> with password<i>
+        next(field for field in at.text_input if "Username" in field.label).set_value(f"user{index}")
+        next(field for field in at.text_input if "Password" in field.label).set_value(f"password{index}")
+        next(button for button in at.button if "Login" in button.label).click()
+
+    if timed_run(at, results, "login", login) != "ok" or not at.session_state.logged_in:
+        return
+
+    steps = [step for step, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    while time.perf_counter() < deadline:
+        step = rng.choices(steps, weights)[0]
+        if step == "add":
+            if at.sidebar.radio[0].value != "➕ Add Expense":
+                # Opening the form isn't timed, but its failures count
+                opened = []
+                if timed_run(at, opened, step, lambda: at.sidebar.radio[0].set_value("➕ Add Expense")) != "ok":
+                    results.extend(opened)
+                    continue
+
+            def add():
+                for select in at.selectbox:
+                    if select.label in ("📂 Category", "😊 Your Mood"):
+                        select.set_value(rng.choice(select.options))
+                at.number_input[0].set_value(round(rng.lognormvariate(5, 1), 2))
+                next(button for button in at.button if "Save" in button.label).click()
+            timed_run(at, results, step, add)
+        else:
+            # Opening the page, or rerunning it if already there
+            timed_run(at, results, step, lambda: at.sidebar.radio[0].set_value(step))
+
+
+def process(db_path, threads, first, deadline, seed, queue):
+    # One app server: `threads` sessions sharing this interpreter's
+    # connection pools, for users first .. first + threads - 1
+    database.configure(db_path)
+    results = []
+    workers = [
+        threading.Thread(target=session, args=(first + i, deadline, seed, results))
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    database.close_connections()
+    queue.put(results)
+
+
+def _process_main(db_path, threads, first, seconds, seed, queue):
+    from streamlit.testing.v1 import AppTest  # noqa: F401 (import before the clock starts)
+
+    process(db_path, threads, first, time.perf_counter() + seconds, seed, queue)
+
+
+def run(db_path, processes, args):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    # perf_counter isn't shared between processes; each gets a duration
+    # and starts its own clock once it has imported everything
+    workers = [
+        context.Process(target=_process_main, args=(db_path, args.threads, p * args.threads, args.seconds, args.seed, queue))
+        for p in range(processes)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    results = [sample for _ in workers for sample in queue.get()]
+    for worker in workers:
+        worker.join()
+    return summarize(results, args.seconds, processes, args.threads, time.perf_counter() - started)
+
+
+def summarize(results, seconds, processes, threads, wall_s):
+    report = {"processes": processes, "threads": threads, "sessions": processes * threads, "steps": {}}
+    for step in ["login"] + [step for step, _ in MIX]:
+        samples = [(elapsed, result) for name, elapsed, result in results if name == step]
+        if not samples:
+            continue
+        times = sorted(elapsed * 1000 for elapsed, _ in samples)
+        locked = sum(1 for _, result in samples if result == "locked")
+        report["steps"][step] = {
+            "runs": len(samples),
+            "locked": locked,
+            "locked_rate": round(locked / len(samples), 4),
+            "errors": sum(1 for _, result in samples if result == "error"),
+            "p50_ms": round(statistics.median(times), 1),
+            "p95_ms": round(times[int(len(times) * 0.95)], 1),
+            "p99_ms": round(times[int(len(times) * 0.99)], 1),
+        }
+    locked = sum(1 for _, _, result in results if result == "locked")
+    report["overall"] = {
+        "runs": len(results),
+        "runs_per_sec": round(len(results) / seconds, 1),
+        "expenses_added_per_sec": round(sum(1 for name, _, result in results if name == "add" and result == "ok") / seconds, 1),
+        "locked_rate": round(locked / len(results), 4) if results else 0.0,
+        "errors": sum(1 for _, _, result in results if result == "error"),
+        "wall_s": round(wall_s, 1),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent Streamlit sessions against one database")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 4],
+                        help="app server processes to try; sessions are threads inside each")
+    parser.add_argument("--threads", type=int, default=8, help="sessions per process")
+    parser.add_argument("--seconds", type=float, default=20, help="how long each session keeps going after login")
+    parser.add_argument("--rows", type=int, default=2_000, help="expenses preloaded per user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    reports = []
+    for processes in args.processes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "load.db")
+            datagen.load(db_path, users=processes * args.threads, per_user=args.rows, seed=args.seed)
+            database.close_connections()
+            report = run(db_path, processes, args)
+        reports.append(report)
+        overall = report["overall"]
+        print(f"{processes} x {args.threads} sessions: {overall['runs_per_sec']:>7.1f} runs/s, "
+              f"locked {overall['locked_rate']:.2%}, errors {overall['errors']}", flush=True)
+        for step, stats in report["steps"].items():
+            print(f"    {step:<20} p50 {stats['p50_ms']:>8.1f} ms  p95 {stats['p95_ms']:>8.1f} ms  "
+                  f"p99 {stats['p99_ms']:>8.1f} ms  locked {stats['locked_rate']:.2%}", flush=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"config": vars(args), "results": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# python -m benchmarks.run [--sizes 1000 100000 10000000] [--out results.json] [--baseline old.json]
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import ROOT, datagen
+import database
+import forecast
+
+DEFAULT_SIZES = (1_000, 100_000)
+
+
+def measure(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    return {
+        "median_ms": round(statistics.median(times), 4),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 4),
+        "min_ms": round(times[0], 4),
+        "runs": repeat,
+    }
+
+
+def uncached(func):
+    return getattr(func, "uncached", func)
+
+
+def bench_database(user_id, repeat):
+    import eco
+
+    version = eco.current_factor_version()
+    first_page, cursor = database.get_expenses_page.uncached(user_id, limit=50)
+    # Jump ten pages in, to show a deep page costs the same as the first
+    for _ in range(9):
+        if cursor is None:
+            break
+        _, cursor = database.get_expenses_page.uncached(user_id, after=cursor, limit=50)
+
+    reads = {
+        "verify_user": lambda: database.verify_user("user0", "password0"),
+        "get_all_expenses": lambda: uncached(database.get_all_expenses)(user_id),
+        "get_expenses_frame": lambda: uncached(database.get_expenses_frame)(user_id),
+        "get_expense_totals": lambda: uncached(database.get_expense_totals)(user_id),
+        "get_expenses_page": lambda: uncached(database.get_expenses_page)(user_id, limit=50),
+        "get_expenses_page_deep": lambda: uncached(database.get_expenses_page)(user_id, after=cursor, limit=50),
+        "get_expenses_summary_filtered": lambda: uncached(database.get_expenses_summary)(user_id, category="Food", min_amount=100),
+        "get_spending_by_mood": lambda: uncached(database.get_spending_by_mood)(user_id),
+        "get_spending_by_category_mood": lambda: uncached(database.get_spending_by_category_mood)(user_id),
+        "get_eco_impact_by_mood": lambda: eco._get_eco_impact.uncached(user_id, "category_mood", version),
+        "get_eco_impact_by_month": lambda: eco._get_eco_impact.uncached(user_id, "month", version),
+        "get_rollup_daily": lambda: uncached(database.get_rollup)(user_id, "daily"),
+        "cache_hit_get_expenses_frame": lambda: database.get_expenses_frame(user_id),
+    }
+    results = {f"db.{name}": measure(fn, repeat) for name, fn in reads.items()}
+
+    # Writes last, they change the data the reads above measured
+    counter = iter(range(10**9))
+    results["db.add_expense"] = measure(
+        lambda: database.add_expense(user_id, "2024-06-01", "Food", 99.0, f"bench {next(counter)}", "Happy"), repeat
+    )
+    batch = [(user_id, "2024-06-02", "Bills", 10.0, "bulk", "Tired")] * 1000
+    results["db.add_expenses_bulk_1000"] = measure(lambda: database.add_expenses_bulk(batch), max(1, repeat // 5))
+    return results
+
+
+def bench_forecast(user_id, repeat):
+    def rebuild():
+        with database.write_connection(user_id) as conn:
+            database.rebuild_forecast_stats(conn, user_id)
+
+    return {
+        "forecast.predict_7d": measure(lambda: forecast.forecast(user_id, 7), repeat, setup=database.read_cache.clear),
+        "forecast.predict_30d_category": measure(
+            lambda: forecast.forecast(user_id, 30, "Food"), repeat, setup=database.read_cache.clear
+        ),
+        "forecast.rebuild_stats": measure(rebuild, max(1, repeat // 5)),
+        # The nightly job over every user, then a read of its stored output
+        "forecast.batch_all_users": measure(lambda: forecast.run_batch(force=True), max(1, repeat // 5)),
+        "forecast.predict_7d_stored": measure(lambda: forecast.forecast(user_id, 7), repeat),
+    }
+
+
+def bench_pages(user_id, repeat):
+    # Every main_app() page through Streamlit's headless test harness, with
+    # a cold read cache (first visit) and a warm one (rerun)
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=600)
+    at.session_state.logged_in = True
+    at.session_state.user_id = user_id
+    at.session_state.username = "user0"
+    at.run()
+    results = {}
+    for page in at.sidebar.radio[0].options:
+        name = page.split(" ", 1)[-1].replace(" ", "_")
+        at.sidebar.radio[0].set_value(page)
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"{page} raised: {at.exception[0].value}")
+        results[f"page.{name}.cold"] = measure(at.run, repeat, setup=database.read_cache.clear)
+        results[f"page.{name}.warm"] = measure(at.run, repeat)
+    return results
+
+
+def run_size(size, users, repeat, seed, db_dir, skip_pages):
+    per_user = max(1, size // users)
+    db_path = os.path.join(db_dir, f"bench_{size}_{users}_{seed}.db")
+    started = time.perf_counter()
+    if os.path.exists(db_path):
+        database.configure(db_path)
+        database.init_db()
+        user_id = database.verify_user("user0", "password0")["id"]
+    else:
+        user_id = datagen.load(db_path, users=users, per_user=per_user, seed=seed)[0]
+    load_seconds = time.perf_counter() - started
+    database.read_cache.clear()
+
+    results = bench_database(user_id, repeat)
+    results.update(bench_forecast(user_id, repeat))
+    if not skip_pages:
+        results.update(bench_pages(user_id, max(1, repeat // 4)))
+    results["dataset.load"] = {"seconds": round(load_seconds, 2), "rows": per_user * users, "rows_per_user": per_user}
+    database.close_connections()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(current, baseline, threshold):
+    regressions = []
+    for size, results in current["results"].items():
+        for name, stats in results.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if not old or "median_ms" not in stats or not old.get("median_ms"):
+                continue
+            ratio = stats["median_ms"] / old["median_ms"]
+            flag = "  REGRESSION" if ratio > 1 + threshold else ""
+            print(f"{size:>10} {name:<40} {old['median_ms']:>10.3f} -> {stats['median_ms']:>10.3f} ms  x{ratio:.2f}{flag}")
+            if flag:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark database.py, app pages and forecasting on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="total expense rows")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db-dir", help="keep generated databases here and reuse them on later runs")
+    parser.add_argument("--skip-pages", action="store_true", help="don't render pages through AppTest")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "users": args.users,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        db_dir = args.db_dir or tmp
+        os.makedirs(db_dir, exist_ok=True)
+        for size in args.sizes:
+            print(f"size {size:,}...", file=sys.stderr, flush=True)
+            report["results"][str(size)] = run_size(size, args.users, args.repeat, args.seed, db_dir, args.skip_pages)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
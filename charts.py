@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Chart data is shaped on the server before Streamlit serializes it:
+# time series are summed into day, week or month buckets picked from the
+# span they cover, anything still longer than MAX_POINTS is thinned with
+# LTTB, and every frame given to a chart or table is capped at
+# MAX_PAYLOAD_BYTES of Arrow data, the format Streamlit sends it in.
+MAX_POINTS = int(os.environ.get('EXPENSE_TRACKER_CHART_POINTS', 200))
+MAX_PAYLOAD_BYTES = int(os.environ.get('EXPENSE_TRACKER_CHART_BYTES', 256 * 1024))
+# Finest first: (name, pandas period, approximate days)
+BUCKETS = (('day', 'D', 1), ('week', 'W', 7), ('month', 'M', 30.44))
+
+def pick_bucket(first, last, max_points=MAX_POINTS):
+    # The finest bucket that keeps the span within max_points
+    span = (pd.Timestamp(last) - pd.Timestamp(first)).days + 1
+    for name, _, days in BUCKETS:
+        if span / days <= max_points:
+            return name
+    return BUCKETS[-1][0]
+
+def bucketize(frame, date_column, columns, bucket):
+    # Sums of columns per bucket, indexed by the date each bucket starts on
+    period = {name: code for name, code, _ in BUCKETS}[bucket]
+    starts = pd.to_datetime(frame[date_column]).dt.to_period(period).dt.start_time
+    return frame[columns].groupby(starts.rename(date_column)).sum()
+
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: positions of `threshold` points that
+    # keep the visual shape of the series (peaks and troughs survive,
+    # unlike averaging). Always keeps the first and last point.
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        # The next bucket's average is the third corner of the triangle
+        following = slice(stop, edges[i + 2] if i + 2 < len(edges) else n)
+        mean_x, mean_y = x[following].mean(), y[following].mean()
+        areas = np.abs((x[previous] - mean_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (mean_y - y[previous]))
+        previous = start + int(areas.argmax())
+        keep[i + 1] = previous
+    return keep
+
+def thin(frame, column=None, max_points=MAX_POINTS):
+    # frame (indexed by date or position) cut to max_points rows with LTTB
+    # on column, the first one by default
+    if len(frame) <= max_points:
+        return frame
+    index = frame.index
+    x = index.asi8 if isinstance(index, pd.DatetimeIndex) else np.arange(len(frame))
+    return frame.iloc[lttb(x, frame[column or frame.columns[0]].to_numpy(), max_points)]
+
+def time_series(frame, date_column, columns, max_points=MAX_POINTS):
+    # Bucketed, thinned and capped frame indexed by date, for line charts
+    if frame.empty:
+        return frame.set_index(date_column)[columns]
+    dates = pd.to_datetime(frame[date_column])
+    bucket = pick_bucket(dates.min(), dates.max(), max_points)
+    return capped(thin(bucketize(frame, date_column, columns, bucket), max_points=max_points))
+
+def payload_bytes(frame):
+    # Size of frame as an Arrow IPC stream
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().size
+
+def capped(frame, max_bytes=MAX_PAYLOAD_BYTES):
+    # The leading rows of frame that fit in max_bytes
+    if frame.memory_usage(index=True, deep=True).sum() <= max_bytes:
+        # Arrow is no bigger than the frame in memory, give or take its
+        # schema; most frames stop here without being serialized twice
+        return frame
+    size = payload_bytes(frame)
+    while size > max_bytes and len(frame) > 1:
+        # Rows cost about the same each; the schema is a fixed overhead,
+        # so this settles within a couple of rounds
+        frame = frame.head(max(1, min(len(frame) - 1, int(len(frame) * max_bytes / size))))
+        size = payload_bytes(frame)
+    return frame
@@ -1,30 +1,218 @@
+import os
+import queue
+import re
 import sqlite3
+import sys
 import hashlib
-from datetime import datetime
+import heapq
+import math
+import secrets
+import threading
+import functools
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+
+import metrics
+from metrics import timed
+
+# ----------------- CONNECTION SETTINGS -----------
+DB_PATH = os.environ.get('EXPENSE_TRACKER_DB', 'expense_tracker.db')
+# Partitioned mode: with SHARDS > 0, DB_PATH only serves the users
+# directory (users, API tokens, eco factors) and every user's expenses and
+# derived tables live in one of SHARDS files next to it, picked by shard_of().
+SHARDS = int(os.environ.get('EXPENSE_TRACKER_SHARDS', '0'))
+SHARD_ID_BITS = 40
+READER_POOL_SIZE = int(os.environ.get('EXPENSE_TRACKER_READERS', '8'))
+POOL_TIMEOUT = 30.0
+CACHE_MAX_USERS = int(os.environ.get('EXPENSE_TRACKER_CACHE_USERS', '2048'))
+CACHE_MAX_ENTRIES_PER_USER = 32
+# Memory budget of the read cache; one entry can be a user's whole history
+CACHE_MAX_BYTES = int(os.environ.get('EXPENSE_TRACKER_CACHE_BYTES', str(64 * 1024 * 1024)))
+# Write-behind mode for add_expense, off by default; see GROUP COMMIT below
+GROUP_COMMIT = os.environ.get('EXPENSE_TRACKER_GROUP_COMMIT', '') == '1'
+GROUP_COMMIT_ROWS = int(os.environ.get('EXPENSE_TRACKER_GROUP_COMMIT_ROWS', '500'))
+GROUP_COMMIT_MS = float(os.environ.get('EXPENSE_TRACKER_GROUP_COMMIT_MS', '0'))
+# synchronous level of group commit transactions; see GROUP COMMIT below
+GROUP_COMMIT_SYNCHRONOUS = os.environ.get('EXPENSE_TRACKER_GROUP_COMMIT_SYNCHRONOUS', 'FULL')
+
+# Applied to every connection we open. journal_mode=WAL is persistent in the
+# database file, the rest are per-connection.
+PRAGMAS = [
+    ('busy_timeout', 5000),
+    ('synchronous', 'NORMAL'),   # safe with WAL, skips the fsync per commit
+    ('cache_size', -16000),      # ~16 MB page cache
+    ('mmap_size', 268435456),    # 256 MB memory-mapped reads
+    ('temp_store', 'MEMORY'),
+]
+
+class ConnectionPool:
+    def __init__(self, factory, size):
+        self._factory = factory
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def acquire(self, timeout=POOL_TIMEOUT):
+        if not self._slots.acquire(timeout=timeout):
+            raise sqlite3.OperationalError('timed out waiting for a database connection')
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            conn = self._factory()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def release(self, conn):
+        self._idle.put(conn)
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._idle = queue.LifoQueue()
+
+def _apply_pragmas(conn):
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+
+def _open_writer(path):
+    # BEGIN IMMEDIATE takes the write lock up front, so a writer waits on
+    # busy_timeout instead of failing halfway through its transaction.
+    conn = sqlite3.connect(path, isolation_level='IMMEDIATE', check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    _apply_pragmas(conn)
+    return conn
+
+def _open_reader(path):
+    uri = Path(path).resolve().as_uri() + '?mode=ro'
+    # Autocommit, so readers never hold a WAL snapshot open between queries
+    conn = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    _apply_pragmas(conn)
+    return conn
+
+_pools_lock = threading.Lock()
+_pools = {}  # path -> (writer pool, reader pool)
+
+def _get_pools(path=None):
+    path = path or DB_PATH
+    pools = _pools.get(path)
+    if pools is None:
+        with _pools_lock:
+            pools = _pools.get(path)
+            if pools is None:
+                # A single writer: SQLite only allows one at a time anyway,
+                # queueing in-process is cheaper than spinning on the lock.
+                writer_pool = ConnectionPool(functools.partial(_open_writer, path), 1)
+                # The database file must exist (in WAL mode) before a
+                # read-only connection can open it.
+                writer_pool.release(writer_pool.acquire())
+                reader_pool = ConnectionPool(functools.partial(_open_reader, path), READER_POOL_SIZE)
+                pools = _pools[path] = (writer_pool, reader_pool)
+    return pools
+
+def shard_of(user_id):
+    # crc32 rather than hash(): stable across processes and restarts
+    return zlib.crc32(str(user_id).encode()) % SHARDS
+
+def shard_path(index):
+    root, ext = os.path.splitext(DB_PATH)
+    return f'{root}.shard{index}{ext or ".db"}'
+
+def database_path(user_id=None):
+    # File holding this user's expenses; None means the users directory
+    if not SHARDS or user_id is None:
+        return DB_PATH
+    return shard_path(shard_of(user_id))
+
+def database_paths():
+    # The directory first, then every shard
+    return [DB_PATH] + [shard_path(index) for index in range(SHARDS)]
+
+def configure(path=None, readers=None, group_commit=None, shards=None):
+    global DB_PATH, READER_POOL_SIZE, GROUP_COMMIT, SHARDS
+    close_connections()
+    # The files may be new or replaced, so init_db checks them again
+    _migrated_paths.clear()
+    if group_commit is not None:
+        GROUP_COMMIT = group_commit
+    if shards is not None:
+        SHARDS = shards
+    if path is not None:
+        DB_PATH = path
+    if readers is not None:
+        READER_POOL_SIZE = readers
+
+def close_connections():
+    stop_group_commit()  # flushes queued writes first
+    with _pools_lock:
+        for pools in _pools.values():
+            for pool in pools:
+                pool.close()
+        _pools.clear()
+
+# Pass the user_id for anything touching expenses or the per-user derived
+# tables; without one (or path) these open the users directory.
+@contextmanager
+def write_connection(user_id=None, path=None, synchronous=None):
+    # synchronous overrides PRAGMAS for this transaction only
+    pool = _get_pools(path or database_path(user_id))[0]
+    conn = pool.acquire()
+    try:
+        if synchronous:
+            conn.execute(f'PRAGMA synchronous = {synchronous}')
+        with conn:  # commit on success, rollback on error
+            yield conn
+    finally:
+        if synchronous:
+            conn.execute(f'PRAGMA synchronous = {dict(PRAGMAS)["synchronous"]}')
+        pool.release(conn)
+
+@contextmanager
+def read_connection(user_id=None, path=None):
+    pool = _get_pools(path or database_path(user_id))[1]
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
 
 def get_db_connection():
-    conn = sqlite3.connect('expense_tracker.db')
+    # Standalone (unpooled) connection for scripts; the caller closes it
+    conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    _apply_pragmas(conn)
     return conn
 
-def create_table():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
+# ----------------- SCHEMA MIGRATIONS -------------
+# Ordered and append-only: never edit a released step, add a new one.
+# Every statement must also be safe against databases created before
+# schema_version existed, hence IF NOT EXISTS everywhere.
+MIGRATIONS = [
+    (1, 'users and expenses tables', [
+        '''CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
             password TEXT NOT NULL,
             email TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create expenses table with user_id
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS expenses (
+        )''',
+        '''CREATE TABLE IF NOT EXISTS expenses (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             date TEXT NOT NULL,
@@ -34,114 +222,1441 @@ def create_table():
             mood TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+    ]),
+    (2, 'per-user covering indexes on expenses', [
+        # Serves date-ordered listings and every aggregate over a date range
+        'CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date, category, amount, mood)',
+        # Serves GROUP BY mood / mood, category without touching the table
+        'CREATE INDEX IF NOT EXISTS idx_expenses_user_mood_category ON expenses (user_id, mood, category, amount)',
+    ]),
+    (3, 'per-user data versions for read cache invalidation', [
+        '''CREATE TABLE IF NOT EXISTS data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )''',
+    ]),
+    (4, 'keyset pagination indexes on (date, id) and (amount, id)', [
+        # Same columns as before plus id right after date, so ORDER BY
+        # date, id walks the index without a sort step
+        'DROP INDEX IF EXISTS idx_expenses_user_date',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_user_date_id ON expenses (user_id, date, id, category, amount, mood)',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_user_amount ON expenses (user_id, amount)',
+    ]),
+    (5, 'per-user rollup tables', [
+        '''CREATE TABLE IF NOT EXISTS rollup_daily (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            total_amount REAL NOT NULL,
+            expense_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS rollup_monthly (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            total_amount REAL NOT NULL,
+            expense_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, month)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS rollup_category (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            total_amount REAL NOT NULL,
+            expense_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, category)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS rollup_mood (
+            user_id INTEGER NOT NULL,
+            mood TEXT NOT NULL,
+            total_amount REAL NOT NULL,
+            expense_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, mood)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS rollup_category_mood (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            mood TEXT NOT NULL,
+            total_amount REAL NOT NULL,
+            expense_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, category, mood)
+        ) WITHOUT ROWID''',
+        lambda conn: rebuild_rollups(conn),
+    ]),
+    (6, 'versioned eco impact factors', [
+        '''CREATE TABLE IF NOT EXISTS eco_factor_versions (
+            version INTEGER PRIMARY KEY,
+            note TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS eco_factors (
+            version INTEGER NOT NULL REFERENCES eco_factor_versions (version),
+            category TEXT NOT NULL,
+            kg_co2_per_100 REAL NOT NULL,
+            PRIMARY KEY (version, category)
+        ) WITHOUT ROWID''',
+        "INSERT OR IGNORE INTO eco_factor_versions (version, note) VALUES (1, 'initial factors')",
+        '''INSERT OR IGNORE INTO eco_factors (version, category, kg_co2_per_100) VALUES
+            (1, 'Food', 2.0), (1, 'Travel', 3.0), (1, 'Shopping', 1.5), (1, 'Bills', 0.5), (1, 'Other', 1.0)''',
+    ]),
+    (7, 'forecast sufficient statistics', [
+        '''CREATE TABLE IF NOT EXISTS forecast_stats (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            sum_x INTEGER NOT NULL,
+            sum_y REAL NOT NULL,
+            sum_xy REAL NOT NULL,
+            sum_xx INTEGER NOT NULL,
+            max_x INTEGER NOT NULL,
+            PRIMARY KEY (user_id, category)
+        ) WITHOUT ROWID''',
+        lambda conn: rebuild_forecast_stats(conn),
+    ]),
+    (8, 'import fingerprints for de-duplicating bulk imports', [
+        lambda conn: _add_column(conn, 'expenses', 'fingerprint', 'TEXT'),
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_user_fingerprint
+           ON expenses (user_id, fingerprint) WHERE fingerprint IS NOT NULL''',
+    ]),
+    (9, 'API tokens', [
+        # Only a hash of each token is stored
+        '''CREATE TABLE IF NOT EXISTS api_tokens (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_api_tokens_user ON api_tokens (user_id)',
+    ]),
+    (10, 'precomputed forecasts', [
+        # One row per user per batch run, recording the data_versions value
+        # it saw; the stored forecast is only used while that still matches.
+        '''CREATE TABLE IF NOT EXISTS forecast_runs (
+            user_id INTEGER PRIMARY KEY,
+            data_version INTEGER NOT NULL,
+            horizon INTEGER NOT NULL,
+            generated_at TIMESTAMP NOT NULL
+        )''',
+        '''CREATE TABLE IF NOT EXISTS forecasts (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            amount REAL NOT NULL,
+            PRIMARY KEY (user_id, category, day)
+        ) WITHOUT ROWID''',
+    ]),
+    (11, 'full-text search over descriptions', [
+        lambda conn: create_search_index(conn),
+        lambda conn: rebuild_search_index(conn),
+    ]),
+    (12, 'archived years', [
+        # (user, year) partitions that archive.py has moved to the archive
+        # file; written in the transaction that drops them from expenses
+        '''CREATE TABLE IF NOT EXISTS archived_years (
+            user_id INTEGER NOT NULL,
+            year TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            total_amount REAL NOT NULL,
+            archived_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (user_id, year)
+        ) WITHOUT ROWID''',
+    ]),
+    (13, 'spending anomaly statistics', [
+        '''CREATE TABLE IF NOT EXISTS anomaly_stats (
+            user_id INTEGER NOT NULL,
+            mood TEXT NOT NULL,
+            category TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            m2 REAL NOT NULL,
+            ewma REAL NOT NULL,
+            ewm_var REAL NOT NULL,
+            PRIMARY KEY (user_id, mood, category)
+        ) WITHOUT ROWID''',
+        # Expenses that scored ANOMALY_Z or more when they were inserted,
+        # with the group's mean and deviation at the time
+        '''CREATE TABLE IF NOT EXISTS spending_anomalies (
+            expense_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            mood TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            mean REAL NOT NULL,
+            std REAL NOT NULL,
+            z REAL NOT NULL,
+            recent_z REAL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_spending_anomalies_user_date ON spending_anomalies (user_id, date)',
+        lambda conn: rebuild_anomaly_stats(conn),
+    ]),
+    (14, 'search words split like queries', [
+        # Index words are now split in Python on every non-word character,
+        # as search_terms() does; the SQL replace() chain missed e.g. ₹ and —
+        'DROP TRIGGER IF EXISTS expenses_fts_insert',
+        'DROP TRIGGER IF EXISTS expenses_fts_delete',
+        'DROP TRIGGER IF EXISTS expenses_fts_update',
+        lambda conn: create_search_index(conn),
+        lambda conn: rebuild_search_index(conn),
+    ]),
+    (15, 'archived expenses searchable', [
+        # Archiving used to drop rows from the search index with the hot row
+        lambda conn: rebuild_search_index(conn),
+    ]),
+    (16, 'search index without SQL functions', [
+        # The triggers called a Python function, so writes from any other
+        # SQLite client failed; the app now indexes rows itself
+        'DROP TRIGGER IF EXISTS expenses_fts_insert',
+        'DROP TRIGGER IF EXISTS expenses_fts_delete',
+        'DROP TRIGGER IF EXISTS expenses_fts_update',
+        lambda conn: rebuild_search_index(conn),
+    ]),
+]
+
+def _add_column(conn, table, column, definition):
+    # ALTER TABLE has no IF NOT EXISTS
+    columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+_migrated_paths = set()
+_migrate_lock = threading.Lock()
+
+def schema_version(conn):
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def migrate(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    
     conn.commit()
-    conn.close()
+    if schema_version(conn) >= MIGRATIONS[-1][0]:
+        return
+
+    for version, description, steps in MIGRATIONS:
+        # One transaction per step; re-check inside it in case another
+        # process applied the same step while we waited for the lock.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            applied = conn.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,)).fetchone()
+            if not applied:
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute(
+                    'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                    (version, description)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def _reserve_shard_ids(conn, index):
+    # Shard k hands out expense ids from (k + 1) << SHARD_ID_BITS, so ids
+    # stay unique across shards and above any id from before the split
+    base = (index + 1) << SHARD_ID_BITS
+    with conn:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'expenses'").fetchone()
+        if row is None:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('expenses', ?)", (base,))
+        elif row[0] < base:
+            conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'expenses'", (base,))
+
+def init_db():
+    # Streamlit re-executes app.py on every interaction; only the first run
+    # in this process (per database file) needs to touch the schema.
+    paths = database_paths()
+    if all(path in _migrated_paths for path in paths):
+        return
+    with _migrate_lock:
+        for index, path in enumerate(paths):
+            if path in _migrated_paths:
+                continue
+            pool = _get_pools(path)[0]
+            conn = pool.acquire()
+            try:
+                migrate(conn)
+                if index:
+                    _reserve_shard_ids(conn, index - 1)
+            finally:
+                pool.release(conn)
+            _migrated_paths.add(path)
+
+# ----------------- QUERY PLAN CHECKS -------------
+# The per-user queries below must be answered from an index. A plan step
+# that starts with "SCAN" means a full table (or full index) scan. These
+# are representative statements for checking a live database (manage.py
+# check-plans); tests/test_query_plans.py checks the statements every read
+# function actually builds, windows and archived years included.
+HOT_QUERIES = {
+    'get_all_expenses': 'SELECT date, category, amount, description, mood FROM expenses WHERE user_id = ? ORDER BY date DESC',
+    'get_expenses_page': 'SELECT id, date, category, amount, description, mood FROM expenses WHERE user_id = ? AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?',
+    'get_expense_totals': 'SELECT COALESCE(SUM(expense_count), 0) AS count, COALESCE(SUM(total_amount), 0) AS total_amount FROM rollup_category WHERE user_id = ?',
+    'get_spending_by_mood': 'SELECT mood, total_amount FROM rollup_mood WHERE user_id = ? ORDER BY mood',
+    'get_spending_by_category_mood': 'SELECT mood, category, total_amount FROM rollup_category_mood WHERE user_id = ? ORDER BY mood, category',
+    'get_rollup': 'SELECT * FROM rollup_daily WHERE user_id = ?',
+    'get_expense_totals_window': 'SELECT SUM(expense_count), SUM(total_amount) FROM rollup_daily WHERE user_id = ? AND day >= ? AND day <= ?',
+    'search_expenses': '''SELECT e.id, bm25(expenses_fts) FROM expenses_fts JOIN expenses e ON e.id = expenses_fts.rowid
+                          WHERE expenses_fts MATCH ? AND e.user_id = ? ORDER BY 2, e.id LIMIT ?''',
+    'get_anomalies': '''SELECT expense_id, date, mood, category, amount, mean, std, z, recent_z FROM spending_anomalies
+                        WHERE user_id = ? AND date >= ? ORDER BY date DESC, expense_id DESC LIMIT ?''',
+    'get_anomaly_stats': 'SELECT mood, category, n, mean, m2, ewma, ewm_var FROM anomaly_stats WHERE user_id = ?',
+    'get_spending_by_mood_window': 'SELECT mood, SUM(amount) FROM expenses INDEXED BY idx_expenses_user_date_id WHERE user_id = ? AND date >= ? AND date <= ? GROUP BY mood',
+}
+
+def explain_query_plan(sql, params=()):
+    with read_connection() as conn:
+        return [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+def check_query_plans():
+    problems = {}
+    for name, sql in HOT_QUERIES.items():
+        plan = explain_query_plan(sql, (0,) * sql.count('?'))
+        # FTS5 answers MATCH from its own index but always reports a SCAN
+        if any(detail.startswith('SCAN ') and 'VIRTUAL TABLE' not in detail for detail in plan):
+            problems[name] = plan
+    if problems:
+        raise RuntimeError(f'queries fall back to full scans: {problems}')
+
+# ----------------- READ CACHE --------------------
+# Results of the per-user read functions, keyed by the user's data version.
+# Every write bumps the version in the same transaction, so a cached value
+# is served only while it still matches the database. Values are shared
+# between callers and must be treated as read-only. Entries are accounted
+# by their approximate size and evicted, least recently used user first,
+# to stay within max_bytes; a result larger than that is not cached.
+def result_size(value):
+    # Approximate bytes held by a read function's result
+    if hasattr(value, 'memory_usage'):  # DataFrame or Series
+        usage = value.memory_usage(index=True, deep=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        return size + sum(result_size(key) + result_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return size + sum(result_size(item) for item in value)
+    return size
+
+class ReadCache:
+    def __init__(self, max_users=CACHE_MAX_USERS, max_entries_per_user=CACHE_MAX_ENTRIES_PER_USER,
+                 max_bytes=CACHE_MAX_BYTES):
+        self.max_users = max_users
+        self.max_entries_per_user = max_entries_per_user
+        self.max_bytes = max_bytes
+        self._users = OrderedDict()  # user_id -> (version, OrderedDict of key -> (result, size))
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id, version, key):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[0] == version and key in entry[1]:
+                self._users.move_to_end(user_id)
+                entry[1].move_to_end(key)
+                self.hits += 1
+                return True, entry[1][key][0]
+            self.misses += 1
+            return False, None
+
+    def put(self, user_id, version, key, value):
+        size = result_size(value)  # outside the lock, it walks the whole result
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry[0] < version:
+                if entry is not None:
+                    self.bytes -= sum(cached_size for _, cached_size in entry[1].values())
+                entry = (version, OrderedDict())
+                self._users[user_id] = entry
+            elif entry[0] > version:
+                return  # a newer write already landed, don't store stale data
+            if key in entry[1]:
+                self.bytes -= entry[1][key][1]
+            entry[1][key] = (value, size)
+            entry[1].move_to_end(key)
+            self.bytes += size
+            if len(entry[1]) > self.max_entries_per_user:
+                self.bytes -= entry[1].popitem(last=False)[1][1]
+                self.evictions += 1
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                _, (_, results) = self._users.popitem(last=False)
+                self.bytes -= sum(cached_size for _, cached_size in results.values())
+                self.evictions += len(results)
+            while self.bytes > self.max_bytes:
+                # Oldest entries of the least recently used user first
+                evicted_user, (_, results) = next(iter(self._users.items()))
+                self.bytes -= results.popitem(last=False)[1][1]
+                self.evictions += 1
+                if not results:
+                    del self._users[evicted_user]
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self.bytes = self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'users': len(self._users),
+                'entries': sum(len(results) for _, results in self._users.values()),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+read_cache = ReadCache()
+
+def get_data_version(user_id):
+    with read_connection(user_id) as conn:
+        row = conn.execute('SELECT version FROM data_versions WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else 0
+
+def _bump_data_version(conn, user_id):
+    conn.execute(
+        '''INSERT INTO data_versions (user_id, version) VALUES (?, 1)
+           ON CONFLICT (user_id) DO UPDATE SET version = version + 1''',
+        (user_id,)
+    )
+
+def cached(func):
+    # For read functions whose first argument is the user_id
+    @functools.wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        key = (func.__name__, args, tuple(sorted(kwargs.items())))
+        wait_for_writes(user_id)  # read-your-writes in group commit mode
+        # Read the version before the data: if a write lands in between we
+        # store newer data under the older version, which only costs a miss.
+        # A hit still costs this one primary-key read: other processes (the
+        # API, other app servers) bump versions too, so they can't be kept
+        # in memory here.
+        version = get_data_version(user_id)
+        found, value = read_cache.get(user_id, version, key)
+        metrics.registry.count('cache_lookups', func.__name__, 'hit' if found else 'miss')
+        if found:
+            return value
+        value = func(user_id, *args, **kwargs)
+        read_cache.put(user_id, version, key, value)
+        return value
+    wrapper.uncached = func
+    return wrapper
+
+def cache_stats():
+    return read_cache.stats()
+
+metrics.registry.register_collector(
+    lambda: {f'read_cache_{name}': value for name, value in cache_stats().items()}
+)
+
+# ----------------- COLUMNAR RESULTS --------------
+# Readers fetch plain tuples and build either dicts (for JSON and simple
+# callers) or a typed DataFrame straight from the columns, without a dict
+# per row in between. Types are by result column name.
+FRAME_TYPES = {
+    'id': 'int',
+    'expense_count': 'int',
+    'count': 'int',
+    'amount': 'float',
+    'total_amount': 'float',
+    'co2_kg': 'float',
+    'date': 'date',
+    'day': 'date',
+    'category': 'category',
+    'mood': 'category',
+    'score': 'float',
+    'expense_id': 'int',
+    'n': 'int',
+    'mean': 'float',
+    'std': 'float',
+    'z': 'float',
+    'recent_z': 'float',
+    'ewma': 'float',
+}
+
+def fetch_all(conn, sql, params=(), as_frame=False):
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    names = [column[0] for column in cursor.description]
+    rows = cursor.fetchall()
+    if as_frame:
+        return to_frame(names, rows)
+    return [dict(zip(names, row)) for row in rows]
+
+def _categorical(pd, np, name, values):
+    # factorize is a single hash pass; the codes are then remapped so the
+    # known categories always come first, in their usual order
+    codes, uniques = pd.factorize(values)
+    known = {'category': CATEGORIES, 'mood': MOODS}.get(name, ())
+    categories = list(known) + sorted(set(uniques).difference(known))
+    positions = np.array([categories.index(value) for value in uniques] + [-1], dtype=np.int32)
+    return pd.Categorical.from_codes(positions[codes], categories)
+
+def to_frame(names, rows):
+    import numpy as np
+    import pandas as pd
+
+    # One 2-D object array instead of transposing tuples in Python
+    table = np.array(rows, dtype=object).reshape(len(rows), len(names))
+    data = {}
+    for index, name in enumerate(names):
+        values = table[:, index]
+        kind = FRAME_TYPES.get(name)
+        if kind == 'float':
+            data[name] = values.astype(np.float64)
+        elif kind == 'int':
+            data[name] = values.astype(np.int64)
+        elif kind == 'date':
+            # numpy parses ISO dates itself, no per-value Timestamp objects
+            data[name] = values.astype('datetime64[D]').astype('datetime64[ns]')
+        elif kind == 'category':
+            data[name] = _categorical(pd, np, name, values)
+        else:
+            data[name] = values
+    return pd.DataFrame(data, columns=names)
+
+# ----------------- ROLLUPS -----------------------
+# Per-user sums and counts maintained in the same transaction as every
+# insert, so dashboard aggregates cost O(groups) instead of O(expenses).
+# name -> (table, key columns, key SQL over expenses, key from a row)
+ROLLUPS = {
+    'daily': ('rollup_daily', ('day',), ('date',), lambda row: (row[1],)),
+    'monthly': ('rollup_monthly', ('month',), ('substr(date, 1, 7)',), lambda row: (row[1][:7],)),
+    'category': ('rollup_category', ('category',), ('category',), lambda row: (row[2],)),
+    'mood': ('rollup_mood', ('mood',), ('mood',), lambda row: (row[4],)),
+    'category_mood': ('rollup_category_mood', ('category', 'mood'), ('category', 'mood'), lambda row: (row[2], row[4])),
+}
+
+def _apply_rollups(conn, rows):
+    # rows are (user_id, date, category, amount, mood); aggregate the batch
+    # first so a bulk insert costs one upsert per touched group
+    for table, keys, _, key_of in ROLLUPS.values():
+        deltas = {}
+        for row in rows:
+            group = (row[0],) + key_of(row)
+            total, count = deltas.get(group, (0.0, 0))
+            deltas[group] = (total + row[3], count + 1)
+        conn.executemany(
+            f'''INSERT INTO {table} (user_id, {', '.join(keys)}, total_amount, expense_count)
+                VALUES ({', '.join('?' * (len(keys) + 3))})
+                ON CONFLICT (user_id, {', '.join(keys)}) DO UPDATE SET
+                    total_amount = total_amount + excluded.total_amount,
+                    expense_count = expense_count + excluded.expense_count''',
+            [group + delta for group, delta in deltas.items()]
+        )
+
+def rebuild_rollups(conn, user_id=None):
+    # Recompute from expenses, for backfills or after editing rows directly
+    where, params = ('user_id = ?', (user_id,)) if user_id is not None else ('true', ())
+    # Every user whose rollups may change: rows in the old rollups, in
+    # expenses, or only in archived years
+    sources = [table for table, _, _, _ in ROLLUPS.values()] + ['expenses']
+    if schema_version(conn) >= 12:
+        sources.append('archived_years')
+    user_ids = {row[0] for source in sources
+                for row in conn.execute(f'SELECT DISTINCT user_id FROM {source} WHERE {where}', params)}
+    for table, keys, exprs, _ in ROLLUPS.values():
+        conn.execute(f'DELETE FROM {table} WHERE {where}', params)
+        conn.execute(
+            f'''INSERT INTO {table} (user_id, {', '.join(keys)}, total_amount, expense_count)
+                SELECT user_id, {', '.join(exprs)}, SUM(amount), COUNT(*)
+                FROM expenses WHERE {where} GROUP BY user_id, {', '.join(exprs)}''',
+            params
+        )
+    for changed in sorted(user_ids):
+        _bump_data_version(conn, changed)
+    rows = _archived_rows(conn, user_id)
+    if rows:
+        _apply_rollups(conn, [(row[1], row[2], row[3], row[4], row[6]) for row in rows])
+
+# ----------------- DATE WINDOWS ------------------
+# start/end are inclusive ISO dates (or date objects), either may be None.
+# The all-time rollups can't answer a window, so windowed reads use range
+# scans instead: (user_id, day) on rollup_daily for totals per day or
+# month, and (user_id, date) on the covering idx_expenses_user_date_id for
+# anything grouped by category or mood.
+def date_window(start=None, end=None, column='date'):
+    clauses, params = [], []
+    if start:
+        clauses.append(f'{column} >= ?')
+        params.append(str(start))
+    if end:
+        clauses.append(f'{column} <= ?')
+        params.append(str(end))
+    return clauses, params
+
+def _window_sql(start, end, column='date'):
+    clauses, params = date_window(start, end, column)
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+def _windowed_group_sql(keys, where, source):
+    # Grouped spend over a date range of the user's expenses; INDEXED BY
+    # keeps the planner on the date range instead of the mood index
+    return f'''SELECT {', '.join(keys)}, SUM(amount) AS total_amount, COUNT(*) AS expense_count
+               FROM {source}
+               WHERE user_id = ?{where} GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}'''
+
+# ----------------- HOT / COLD --------------------
+# archive.py moves whole years of old expenses into a compressed archive
+# file. Rollups and forecast sums keep counting them; reads that need the
+# rows take their FROM clause from expenses_source(), which unions the
+# archived rows back in when the date window reaches an archived year.
+EXPENSE_COLUMNS = 'id, user_id, date, category, amount, description, mood'
+
+def archived_years(conn, user_id, start=None, end=None):
+    clauses, params = date_window(start and str(start)[:4], end and str(end)[:4], 'year')
+    return conn.execute(
+        f'''SELECT year, archived_at FROM archived_years
+            WHERE user_id = ?{''.join(f' AND {clause}' for clause in clauses)} ORDER BY year''',
+        [user_id] + params
+    ).fetchall()
+
+def expenses_source(conn, user_id, start=None, end=None, alias='expenses', indexed=False):
+    # FROM clause item for the user's expenses between start and end
+    if not archived_years(conn, user_id, start, end):
+        return f'expenses AS {alias}' + (' INDEXED BY idx_expenses_user_date_id' if indexed else '')
+    import archive
+
+    # All of the user's archived years, not just the window's: the temp
+    # table is then reused by the next read whatever its window
+    archive.load_cold(conn, database_path(user_id), user_id, archived_years(conn, user_id))
+    # While archive.py is moving a year, rows can be in both; hot wins
+    return f'''(SELECT {EXPENSE_COLUMNS} FROM expenses
+                UNION ALL
+                SELECT {EXPENSE_COLUMNS} FROM temp.cold_expenses c
+                WHERE NOT EXISTS (SELECT 1 FROM expenses h WHERE h.id = c.id)) AS {alias}'''
+
+def _archived_rows(conn, user_id=None):
+    # Archived rows of this connection's file, for rebuilding derived tables
+    if schema_version(conn) < 12 or not conn.execute('SELECT 1 FROM archived_years LIMIT 1').fetchone():
+        return []
+    import archive
+
+    return archive.archived_rows(conn.execute('PRAGMA database_list').fetchone()[2], user_id)
+
+# ----------------- FORECAST STATISTICS -----------
+# Running sums for an ordinary least squares fit of amount against day
+# number, per user overall (category '') and per category. x is a whole
+# number of days, so n, sum_x and sum_xx stay exact integers.
+FORECAST_EPOCH = date(2000, 1, 1)
+ALL_CATEGORIES = ''
+
+def day_number(value):
+    return (date.fromisoformat(str(value)[:10]) - FORECAST_EPOCH).days
+
+def _apply_forecast_stats(conn, rows):
+    deltas = {}
+    for user_id, day, category, amount, _ in rows:
+        x = day_number(day)
+        for group in ((user_id, ALL_CATEGORIES), (user_id, category)):
+            n, sx, sy, sxy, sxx, mx = deltas.get(group, (0, 0, 0.0, 0.0, 0, x))
+            deltas[group] = (n + 1, sx + x, sy + amount, sxy + x * amount, sxx + x * x, max(mx, x))
+    conn.executemany(
+        '''INSERT INTO forecast_stats (user_id, category, n, sum_x, sum_y, sum_xy, sum_xx, max_x)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT (user_id, category) DO UPDATE SET
+               n = n + excluded.n,
+               sum_x = sum_x + excluded.sum_x,
+               sum_y = sum_y + excluded.sum_y,
+               sum_xy = sum_xy + excluded.sum_xy,
+               sum_xx = sum_xx + excluded.sum_xx,
+               max_x = MAX(max_x, excluded.max_x)''',
+        [group + delta for group, delta in deltas.items()]
+    )
+
+def rebuild_forecast_stats(conn, user_id=None):
+    where, params = ('user_id = ?', (user_id,)) if user_id is not None else ('true', ())
+    conn.execute(f'DELETE FROM forecast_stats WHERE {where}', params)
+    points = f'''SELECT user_id, category, amount,
+                        CAST(julianday(date) - julianday('{FORECAST_EPOCH}') AS INTEGER) AS x
+                 FROM expenses WHERE {where}'''
+    for category in (repr(ALL_CATEGORIES), 'category'):
+        conn.execute(
+            f'''INSERT INTO forecast_stats (user_id, category, n, sum_x, sum_y, sum_xy, sum_xx, max_x)
+                SELECT user_id, {category}, COUNT(*), SUM(x), SUM(amount), SUM(x * amount), SUM(x * x), MAX(x)
+                FROM ({points}) GROUP BY user_id, {category}''',
+            params
+        )
+    rows = _archived_rows(conn, user_id)
+    if rows:
+        _apply_forecast_stats(conn, [(row[1], row[2], row[3], row[4], None) for row in rows])
+
+@timed('db')
+@cached
+def get_forecast_stats(user_id, category=ALL_CATEGORIES, start=None, end=None):
+    if not (start or end):
+        with read_connection(user_id) as conn:
+            row = conn.execute(
+                'SELECT n, sum_x, sum_y, sum_xy, sum_xx, max_x FROM forecast_stats WHERE user_id = ? AND category = ?',
+                (user_id, category)
+            ).fetchone()
+        return dict(row) if row else None
+
+    # The same sums over a window, straight from a date range of expenses
+    where, params = _window_sql(start, end)
+    if category != ALL_CATEGORIES:
+        where += ' AND category = ?'
+        params.append(category)
+    with read_connection(user_id) as conn:
+        source = expenses_source(conn, user_id, start, end, indexed=True)
+        row = conn.execute(
+            f'''SELECT COUNT(*) AS n, SUM(x) AS sum_x, SUM(amount) AS sum_y, SUM(x * amount) AS sum_xy,
+                       SUM(x * x) AS sum_xx, MAX(x) AS max_x
+                FROM (SELECT amount, CAST(julianday(date) - julianday('{FORECAST_EPOCH}') AS INTEGER) AS x
+                      FROM {source} WHERE user_id = ?{where})''',
+            [user_id] + params
+        ).fetchone()
+    return dict(row) if row['n'] else None
+
+# ----------------- ANOMALY STATISTICS ------------
+# Per user, mood and category: Welford's running mean and variance of the
+# amount, and an exponentially weighted mean and variance (EWMA) that
+# follows recent habits. Every insert updates them in its own transaction
+# and scores each new expense against the state from before it, so spotting
+# unusual spending never rescans history. Expenses ANOMALY_Z or more
+# standard deviations from their group's mean go into spending_anomalies.
+ANOMALY_ALPHA = 0.1  # weight of the newest expense in the EWMA
+ANOMALY_MIN_COUNT = 5  # expenses a group needs before anything is scored
+ANOMALY_Z = 3.0
+ANOMALY_PAGE = 20
+ANOMALY_STATS = ('n', 'mean', 'm2', 'ewma', 'ewm_var')
+
+def anomaly_step(state, amount):
+    # Adds one amount to (n, mean, m2, ewma, ewm_var), None for an empty
+    # group. Returns the new state and the amount's z-scores against the old
+    # one, long-run and recent; None while the group is small or has no spread.
+    n, mean, m2, ewma, ewm_var = state or (0, 0.0, 0.0, amount, 0.0)
+    z = recent_z = None
+    if n >= ANOMALY_MIN_COUNT:
+        if m2 > 0:
+            z = (amount - mean) / math.sqrt(m2 / (n - 1))
+        if ewm_var > 0:
+            recent_z = (amount - ewma) / math.sqrt(ewm_var)
+    delta = amount - mean
+    mean += delta / (n + 1)
+    m2 += delta * (amount - mean)
+    diff = amount - ewma
+    ewma += ANOMALY_ALPHA * diff
+    ewm_var = (1 - ANOMALY_ALPHA) * (ewm_var + ANOMALY_ALPHA * diff * diff)
+    return (n + 1, mean, m2, ewma, ewm_var), z, recent_z
+
+def _score_anomalies(states, rows):
+    # rows are (id, user_id, date, category, amount, mood) in the order they
+    # happen; updates states in place and returns the spending_anomalies rows
+    anomalies = []
+    for expense_id, user_id, day, category, amount, mood in rows:
+        key = (user_id, mood, category)
+        before = states.get(key)
+        states[key], z, recent_z = anomaly_step(before, amount)
+        if z is not None and abs(z) >= ANOMALY_Z:
+            n, mean, m2 = before[:3]
+            anomalies.append((expense_id, user_id, str(day)[:10], mood, category, amount,
+                              mean, math.sqrt(m2 / (n - 1)), z, recent_z))
+    return anomalies
+
+def _write_anomalies(conn, states, anomalies):
+    conn.executemany(
+        f'''INSERT OR REPLACE INTO anomaly_stats (user_id, mood, category, {', '.join(ANOMALY_STATS)})
+            VALUES ({', '.join('?' * (3 + len(ANOMALY_STATS)))})''',
+        [key + state for key, state in states.items()]
+    )
+    conn.executemany(
+        '''INSERT OR REPLACE INTO spending_anomalies
+               (expense_id, user_id, date, mood, category, amount, mean, std, z, recent_z)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        anomalies
+    )
+
+def _apply_anomaly_stats(conn, rows):
+    # rows as for _score_anomalies; one read and one write per touched group
+    states = {}
+    for _, user_id, _, category, _, mood in rows:
+        key = (user_id, mood, category)
+        if key not in states:
+            row = conn.execute(
+                f'SELECT {", ".join(ANOMALY_STATS)} FROM anomaly_stats WHERE user_id = ? AND mood = ? AND category = ?',
+                key
+            ).fetchone()
+            states[key] = tuple(row) if row else None
+    _write_anomalies(conn, states, _score_anomalies(states, rows))
+
+def _history(hot, archived):
+    # Two (id, user_id, date, category, amount, mood) streams in (date, id)
+    # order as one; rows caught mid-move are in both and the hot copy wins
+    previous = None
+    for row in heapq.merge(hot, archived, key=lambda row: (row[2], row[0])):
+        if row[0] != previous:
+            yield row
+        previous = row[0]
+
+def rebuild_anomaly_stats(conn, user_id=None):
+    # Replays the history in date order, archived years included, so the
+    # EWMA ends on the latest expenses by date rather than by entry. One user
+    # at a time, streamed off the (user_id, date, id) index.
+    where, params = ('user_id = ?', (user_id,)) if user_id is not None else ('true', ())
+    conn.execute(f'DELETE FROM anomaly_stats WHERE {where}', params)
+    conn.execute(f'DELETE FROM spending_anomalies WHERE {where}', params)
+    archived = {row[0] for row in conn.execute(f'SELECT DISTINCT user_id FROM archived_years WHERE {where}', params)}
+    user_ids = [user_id] if user_id is not None else sorted(
+        {row[0] for row in conn.execute('SELECT DISTINCT user_id FROM expenses')} | archived
+    )
+    for history_user in user_ids:
+        hot = conn.execute(
+            '''SELECT id, user_id, date, category, amount, mood FROM expenses INDEXED BY idx_expenses_user_date_id
+               WHERE user_id = ? ORDER BY date, id''',
+            (history_user,)
+        )
+        cold = sorted(
+            ((row[0], row[1], row[2], row[3], row[4], row[6])
+             for row in (_archived_rows(conn, history_user) if history_user in archived else ())),
+            key=lambda row: (row[2], row[0])
+        )
+        states = {}
+        anomalies = _score_anomalies(states, _history(hot, cold))
+        _write_anomalies(conn, states, anomalies)
+    conn.execute(
+        f'''INSERT INTO data_versions (user_id, version)
+            SELECT DISTINCT user_id, 1 FROM anomaly_stats WHERE {where}
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1''',
+        params
+    )
+
+@timed('db')
+@cached
+def get_anomalies(user_id, as_frame=False, start=None, end=None, limit=ANOMALY_PAGE):
+    # The most recent unusual expenses, newest first
+    where, params = _window_sql(start, end)
+    with read_connection(user_id) as conn:
+        return fetch_all(
+            conn,
+            f'''SELECT expense_id, date, mood, category, amount, mean, std, z, recent_z FROM spending_anomalies
+                WHERE user_id = ?{where} ORDER BY date DESC, expense_id DESC LIMIT ?''',
+            [user_id] + params + [limit],
+            as_frame
+        )
+
+@timed('db')
+@cached
+def get_anomaly_stats(user_id, as_frame=False):
+    with read_connection(user_id) as conn:
+        return fetch_all(conn, HOT_QUERIES['get_anomaly_stats'], (user_id,), as_frame)
 
 # User management functions
+@timed('db')
 def create_user(username, password, email=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     hashed_password = hashlib.sha256(password.encode()).hexdigest()
-    
+
     try:
-        cursor.execute(
-            'INSERT INTO users (username, password, email) VALUES (?, ?, ?)',
-            (username, hashed_password, email)
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-        conn.close()
-        return user_id
+        with write_connection() as conn:
+            cursor = conn.execute(
+                'INSERT INTO users (username, password, email) VALUES (?, ?, ?)',
+                (username, hashed_password, email)
+            )
+            return cursor.lastrowid
     except sqlite3.IntegrityError:
-        conn.close()
         return None
 
+@timed('db')
 def verify_user(username, password):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     hashed_password = hashlib.sha256(password.encode()).hexdigest()
-    
-    cursor.execute(
-        'SELECT id, username FROM users WHERE username = ? AND password = ?',
-        (username, hashed_password)
-    )
-    
-    user = cursor.fetchone()
-    conn.close()
-    
+
+    with read_connection() as conn:
+        user = conn.execute(
+            'SELECT id, username FROM users WHERE username = ? AND password = ?',
+            (username, hashed_password)
+        ).fetchone()
+
     return dict(user) if user else None
 
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+@timed('db')
+def create_api_token(user_id):
+    # The plain token is returned once and never stored
+    token = secrets.token_urlsafe(32)
+    with write_connection() as conn:
+        conn.execute('INSERT INTO api_tokens (token_hash, user_id) VALUES (?, ?)', (_token_hash(token), user_id))
+    return token
+
+@timed('db')
+def get_token_user(token):
+    with read_connection() as conn:
+        row = conn.execute('SELECT user_id FROM api_tokens WHERE token_hash = ?', (_token_hash(token),)).fetchone()
+
+    return row[0] if row else None
+
+@timed('db')
+def revoke_api_token(token):
+    with write_connection() as conn:
+        return conn.execute('DELETE FROM api_tokens WHERE token_hash = ?', (_token_hash(token),)).rowcount > 0
+
 # Updated expense functions with user_id
+CATEGORIES = ('Food', 'Travel', 'Shopping', 'Bills', 'Other')
+MOODS = ('Happy', 'Sad', 'Neutral', 'Excited', 'Tired')
+FINGERPRINT_BATCH = 500
+
+def _insert_rows(conn, expenses):
+    # expenses are (user_id, date, category, amount, description, mood,
+    # fingerprint) tuples. Rows whose fingerprint the user already has are
+    # skipped; returns the rows actually inserted.
+    fingerprinted = {}
+    for expense in expenses:
+        if expense[6] is not None:
+            fingerprinted.setdefault(expense[0], []).append(expense[6])
+    existing = set()
+    for user_id, fingerprints in fingerprinted.items():
+        for start in range(0, len(fingerprints), FINGERPRINT_BATCH):
+            chunk = fingerprints[start:start + FINGERPRINT_BATCH]
+            existing.update(
+                (user_id, row[0]) for row in conn.execute(
+                    f'''SELECT fingerprint FROM expenses
+                        WHERE user_id = ? AND fingerprint IN ({', '.join('?' * len(chunk))})''',
+                    [user_id] + chunk
+                )
+            )
+        years = archived_years(conn, user_id)
+        if years:
+            import archive
+
+            archived = archive.fingerprints(database_path(user_id), user_id, years)
+            existing.update((user_id, fingerprint) for fingerprint in fingerprints if fingerprint in archived)
+    if existing:
+        expenses = [expense for expense in expenses if (expense[0], expense[6]) not in existing]
+    if expenses:
+        conn.executemany(
+            '''INSERT INTO expenses (user_id, date, category, amount, description, mood, fingerprint)
+               VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            expenses
+        )
+    return expenses
+
+def _apply_derived(conn, expenses):
+    # Rollups, forecast sums, anomaly statistics, search entries and cache
+    # versions for rows just inserted. Their ids are consecutive and end at the last insert:
+    # AUTOINCREMENT and we hold the only writer.
+    last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+    rows = [(user_id, date, category, amount, mood) for user_id, date, category, amount, _, mood, _ in expenses]
+    ids = range(last_id - len(rows) + 1, last_id + 1)
+    _apply_rollups(conn, rows)
+    _apply_forecast_stats(conn, rows)
+    _apply_anomaly_stats(conn, [(expense_id,) + row for expense_id, row in zip(ids, rows)])
+    index_expenses(conn, [(expense_id, expense[0], expense[4]) for expense_id, expense in zip(ids, expenses)])
+    for user_id in {expense[0] for expense in expenses}:
+        _bump_data_version(conn, user_id)
+
+def _insert_expenses(conn, expenses):
+    # Inserts together with the derived tables; returns the number inserted
+    expenses = _insert_rows(conn, expenses)
+    if expenses:
+        _apply_derived(conn, expenses)
+    return len(expenses)
+
+@timed('db')
 def add_expense(user_id, date, category, amount, description, mood):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        'INSERT INTO expenses (user_id, date, category, amount, description, mood) VALUES (?, ?, ?, ?, ?, ?)',
-        (user_id, date, category, amount, description, mood)
+    if GROUP_COMMIT:
+        return add_expense_async(user_id, date, category, amount, description, mood).result()
+    with write_connection(user_id) as conn:
+        _insert_expenses(conn, [(user_id, date, category, amount, description, mood, None)])
+        # Still inside the write transaction, so the newest id is ours
+        return conn.execute('SELECT MAX(id) FROM expenses').fetchone()[0]
+
+@timed('db')
+def add_expenses_bulk(expenses):
+    # One transaction for the whole batch (per shard); returns the number inserted
+    by_path = {}
+    for expense in expenses:
+        by_path.setdefault(database_path(expense[0]), []).append(tuple(expense) + (None,) * (7 - len(expense)))
+    inserted = 0
+    for path, rows in by_path.items():
+        with write_connection(path=path) as conn:
+            inserted += _insert_expenses(conn, rows)
+    return inserted
+
+# ----------------- GROUP COMMIT ------------------
+# Write-behind for small inserts: one thread takes submissions from a queue
+# and commits everything queued so far (up to GROUP_COMMIT_ROWS rows, waiting
+# up to GROUP_COMMIT_MS for more) in a single transaction. Submissions that
+# arrive while a commit runs form the next batch. Each caller gets a Future
+# that resolves once its rows are committed and on disk: these transactions
+# run with GROUP_COMMIT_SYNCHRONOUS (FULL), so the WAL is synced before the
+# Futures resolve, and the one fsync is shared by the whole batch. Plain
+# add_expense and every other write acknowledge under PRAGMAS' NORMAL:
+# committed, but the last commits can be lost on power loss. Reads for a
+# user wait until that user's queued writes are in (wait_for_writes).
+class GroupCommitWriter:
+    # One per database file; every submission must belong to that file
+    def __init__(self, path, max_rows=GROUP_COMMIT_ROWS, max_delay_ms=GROUP_COMMIT_MS,
+                 synchronous=GROUP_COMMIT_SYNCHRONOUS):
+        self.path = path
+        self.synchronous = synchronous
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.Queue()
+        self._pending = {}  # user_id -> submissions not yet committed
+        self._settled = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+        self.transactions = 0
+        self.rows = 0
+
+    def submit(self, expenses):
+        # expenses as for _insert_expenses; resolves to the new ids, in order
+        # (duplicates by fingerprint are left out)
+        future = Future()
+        users = {expense[0] for expense in expenses}
+        with self._settled:
+            for user_id in users:
+                self._pending[user_id] = self._pending.get(user_id, 0) + 1
+        self._queue.put((expenses, users, future))
+        return future
+
+    def wait(self, user_id, timeout=POOL_TIMEOUT):
+        with self._settled:
+            return self._settled.wait_for(lambda: not self._pending.get(user_id), timeout)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            rows = len(item[0])
+            deadline = time.monotonic() + self.max_delay
+            while rows < self.max_rows:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                rows += len(item[0])
+            self._commit(batch)
+
+    def _commit(self, batch):
+        try:
+            results = self._insert(batch)
+        except Exception:
+            # Retry one by one so a single bad submission fails alone
+            results = []
+            for submission in batch:
+                try:
+                    results.extend(self._insert([submission]))
+                except Exception as e:
+                    results.append(e)
+        with self._settled:
+            for _, users, _ in batch:
+                for user_id in users:
+                    self._pending[user_id] -= 1
+                    if not self._pending[user_id]:
+                        del self._pending[user_id]
+            self._settled.notify_all()
+        for (_, _, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _insert(self, batch):
+        results = []
+        inserted = []
+        with write_connection(path=self.path, synchronous=self.synchronous) as conn:
+            for expenses, _, _ in batch:
+                rows = _insert_rows(conn, [tuple(expense) + (None,) * (7 - len(expense)) for expense in expenses])
+                # Ids are consecutive: AUTOINCREMENT and we hold the only writer
+                last = conn.execute('SELECT last_insert_rowid()').fetchone()[0] if rows else 0
+                results.append(list(range(last - len(rows) + 1, last + 1)))
+                inserted.extend(rows)
+            if inserted:
+                _apply_derived(conn, inserted)
+        self.transactions += 1
+        self.rows += len(inserted)
+        return results
+
+_group_writers = {}  # path -> GroupCommitWriter
+_group_writer_lock = threading.Lock()
+
+def start_group_commit(user_id=None, max_rows=None, max_delay_ms=None):
+    # The writer for this user's database file, started on first use
+    path = database_path(user_id)
+    with _group_writer_lock:
+        writer = _group_writers.get(path)
+        if writer is None:
+            writer = _group_writers[path] = GroupCommitWriter(
+                path,
+                GROUP_COMMIT_ROWS if max_rows is None else max_rows,
+                GROUP_COMMIT_MS if max_delay_ms is None else max_delay_ms,
+                GROUP_COMMIT_SYNCHRONOUS,
+            )
+        return writer
+
+def stop_group_commit():
+    with _group_writer_lock:
+        writers = list(_group_writers.values())
+        _group_writers.clear()
+    for writer in writers:
+        writer.close()
+
+def wait_for_writes(user_id):
+    if _group_writers:
+        writer = _group_writers.get(database_path(user_id))
+        if writer is not None:
+            writer.wait(user_id)
+
+def add_expense_async(user_id, date, category, amount, description, mood):
+    # Future resolving to the new expense id
+    future = Future()
+    submitted = start_group_commit(user_id).submit([(user_id, date, category, amount, description, mood)])
+    submitted.add_done_callback(
+        lambda done: future.set_exception(done.exception()) if done.exception() else future.set_result(done.result()[0])
     )
-    
-    conn.commit()
-    conn.close()
+    return future
 
-def get_all_expenses(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        'SELECT date, category, amount, description, mood FROM expenses WHERE user_id = ? ORDER BY date DESC',
-        (user_id,)
+@timed('db')
+@cached
+def get_all_expenses(user_id, start=None, end=None):
+    with read_connection(user_id) as conn:
+        return fetch_all(conn, *_all_expenses_sql(conn, user_id, start, end))
+
+@timed('db')
+@cached
+def get_expenses_frame(user_id, start=None, end=None):
+    # Typed columns: datetime64 date, categorical category/mood, float amount
+    with read_connection(user_id) as conn:
+        return fetch_all(conn, *_all_expenses_sql(conn, user_id, start, end), as_frame=True)
+
+def _all_expenses_sql(conn, user_id, start, end):
+    where, params = _window_sql(start, end)
+    return (
+        f'''SELECT date, category, amount, description, mood FROM {expenses_source(conn, user_id, start, end)}
+            WHERE user_id = ?{where} ORDER BY date DESC''',
+        [user_id] + params,
     )
-    
-    expenses = cursor.fetchall()
-    conn.close()
-    
-    return [dict(expense) for expense in expenses]
-
-def get_spending_by_mood(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        'SELECT mood, SUM(amount) as total_amount FROM expenses WHERE user_id = ? GROUP BY mood',
-        (user_id,)
+
+@timed('db')
+@cached
+def get_expense_totals(user_id, start=None, end=None):
+    if start or end:
+        where, params = _window_sql(start, end, 'day')
+        sql = f'''SELECT COALESCE(SUM(expense_count), 0) AS count, COALESCE(SUM(total_amount), 0) AS total_amount
+                  FROM rollup_daily WHERE user_id = ?{where}'''
+    else:
+        sql, params = HOT_QUERIES['get_expense_totals'], []
+    with read_connection(user_id) as conn:
+        row = conn.execute(sql, [user_id] + params).fetchone()
+
+    return dict(row)
+
+# ----------------- PAGINATED EXPENSES ------------
+# Keyset pagination: a page is identified by the (sort value, id) of the
+# last row of the previous page, so page N costs the same as page 1.
+PAGE_SORT_COLUMNS = ('date', 'amount')
+
+def _expense_filters(user_id, category=None, mood=None, min_amount=None, max_amount=None, start=None, end=None):
+    clauses, params = date_window(start, end)
+    clauses.insert(0, 'user_id = ?')
+    params.insert(0, user_id)
+    if category:
+        clauses.append('category = ?')
+        params.append(category)
+    if mood:
+        clauses.append('mood = ?')
+        params.append(mood)
+    if min_amount is not None:
+        clauses.append('amount >= ?')
+        params.append(min_amount)
+    if max_amount is not None:
+        clauses.append('amount <= ?')
+        params.append(max_amount)
+    return clauses, params
+
+@timed('db')
+@cached
+def get_expenses_page(user_id, after=None, limit=50, sort='date', descending=True, as_frame=False, **filters):
+    if sort not in PAGE_SORT_COLUMNS:
+        raise ValueError(f'cannot sort expenses by {sort!r}')
+    clauses, params = _expense_filters(user_id, **filters)
+    if after is not None:
+        clauses.append(f'({sort}, id) {"<" if descending else ">"} (?, ?)')
+        params.extend(after)
+    direction = 'DESC' if descending else 'ASC'
+
+    names = ['id', 'date', 'category', 'amount', 'description', 'mood']
+    with read_connection(user_id) as conn:
+        def page(source):
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            return cursor.execute(
+                f'''SELECT {', '.join(names)} FROM {source}
+                    WHERE {' AND '.join(clauses)}
+                    ORDER BY {sort} {direction}, id {direction} LIMIT ?''',
+                params + [limit + 1]
+            ).fetchall()
+
+        years = archived_years(conn, user_id, filters.get('start'), filters.get('end'))
+        rows = page('expenses')
+        # Newest-first pages that end after the last archived year, the
+        # common case, never need the archive
+        if years and not (sort == 'date' and descending and len(rows) > limit and rows[limit][1][:4] > years[-1][0]):
+            rows = page(expenses_source(conn, user_id, filters.get('start'), filters.get('end')))
+
+    # One extra row tells us whether there is a next page
+    next_cursor = (rows[limit - 1][names.index(sort)], rows[limit - 1][0]) if len(rows) > limit else None
+    rows = rows[:limit]
+    if as_frame:
+        return to_frame(names, rows), next_cursor
+    return [dict(zip(names, row)) for row in rows], next_cursor
+
+@timed('db')
+@cached
+def get_expenses_summary(user_id, **filters):
+    if all(filters.get(name) is None for name in ('category', 'mood', 'min_amount', 'max_amount')):
+        # Only a date window: the rollups have the same count and total
+        return get_expense_totals.uncached(user_id, filters.get('start'), filters.get('end'))
+    clauses, params = _expense_filters(user_id, **filters)
+
+    with read_connection(user_id) as conn:
+        source = expenses_source(conn, user_id, filters.get('start'), filters.get('end'))
+        row = conn.execute(
+            f'''SELECT COUNT(*) AS count, COALESCE(SUM(amount), 0) AS total_amount
+                FROM {source} WHERE {' AND '.join(clauses)}''',
+            params
+        ).fetchone()
+
+    return dict(row)
+
+@timed('db')
+@cached
+def get_rollup(user_id, name, as_frame=False, start=None, end=None):
+    table, keys = ROLLUPS[name][:2]
+    if not (start or end):
+        sql = f'''SELECT {', '.join(keys)}, total_amount, expense_count FROM {table}
+                  WHERE user_id = ? ORDER BY {', '.join(keys)}'''
+        params = []
+    elif name in ('daily', 'monthly'):
+        # Days and months are a range of rollup_daily
+        where, params = _window_sql(start, end, 'day')
+        key = 'day' if name == 'daily' else 'substr(day, 1, 7) AS month'
+        sql = f'''SELECT {key}, SUM(total_amount) AS total_amount, SUM(expense_count) AS expense_count
+                  FROM rollup_daily WHERE user_id = ?{where} GROUP BY 1 ORDER BY 1'''
+    else:
+        where, params = _window_sql(start, end)
+        sql = None
+    with read_connection(user_id) as conn:
+        if sql is None:
+            sql = _windowed_group_sql(keys, where, expenses_source(conn, user_id, start, end, indexed=True))
+        return fetch_all(conn, sql, [user_id] + params, as_frame)
+
+@timed('db')
+@cached
+def get_spending_by_mood(user_id, as_frame=False, start=None, end=None):
+    sql, params = HOT_QUERIES['get_spending_by_mood'], []
+    with read_connection(user_id) as conn:
+        if start or end:
+            where, params = _window_sql(start, end)
+            source = expenses_source(conn, user_id, start, end, indexed=True)
+            sql = f'SELECT mood, total_amount FROM ({_windowed_group_sql(("mood",), where, source)})'
+        return fetch_all(conn, sql, [user_id] + params, as_frame)
+
+@timed('db')
+@cached
+def get_spending_by_category_mood(user_id, as_frame=False, start=None, end=None):
+    sql, params = HOT_QUERIES['get_spending_by_category_mood'], []
+    with read_connection(user_id) as conn:
+        if start or end:
+            where, params = _window_sql(start, end)
+            source = expenses_source(conn, user_id, start, end, indexed=True)
+            sql = f'SELECT mood, category, total_amount FROM ({_windowed_group_sql(("mood", "category"), where, source)})'
+        return fetch_all(conn, sql, [user_id] + params, as_frame)
+
+@timed('db')
+def get_eco_impact_by_mood(user_id, as_frame=False, start=None, end=None):
+    import eco
+
+    return eco.get_eco_impact(user_id, 'category_mood', as_frame=as_frame, start=start, end=end)
+
+# ----------------- SEARCH ------------------------
+# expenses_fts indexes each description as user-scoped tokens ("Coffee at
+# Starbucks" -> "u7_Coffee u7_at u7_Starbucks"), so a search only touches
+# the postings of its own user. With one shared index and a user column,
+# both matching and bm25's document frequencies cost O(rows of all users).
+# Rows are read back from expenses by rowid.
+#
+# The write paths add entries in Python (index_expenses), since the words
+# are split by SEARCH_WORD; the triggers only delete them, in plain SQL, so
+# any SQLite client can still write to expenses. Rows it inserts or edits
+# stay out of search until rebuild_search_index (manage.py rebuild-search).
+SEARCH_PAGE = 50
+# Words for both the index and queries: runs of letters and digits, so
+# "Paid ₹500 for uber—airport" indexes 500 and airport as words of their
+# own, and "foo_bar" is found by "bar"
+SEARCH_WORD = re.compile(r'[^\W_]+')
+
+def search_text(user_id, description):
+    # The indexed text of one expense
+    return ' '.join(f'u{user_id}_{word}' for word in SEARCH_WORD.findall(description or ''))
+
+def index_expenses(conn, rows):
+    # Adds (id, user_id, description) rows to the search index
+    conn.executemany(
+        'INSERT INTO expenses_fts (rowid, terms) VALUES (?, ?)',
+        ((expense_id, search_text(user_id, description)) for expense_id, user_id, description in rows if description)
     )
-    
-    results = cursor.fetchall()
-    conn.close()
-    
-    return [dict(result) for result in results]
-
-def get_spending_by_category_mood(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        'SELECT mood, category, SUM(amount) as total_amount FROM expenses WHERE user_id = ? GROUP BY mood, category',
-        (user_id,)
+
+def create_search_index(conn):
+    # The table keeps its text, so an entry can be deleted by rowid alone
+    conn.execute(
+        """CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+               terms, tokenize="unicode61 remove_diacritics 2 tokenchars '_'"
+           )"""
     )
-    
-    results = cursor.fetchall()
-    conn.close()
-    
-    return [dict(result) for result in results]
-
-def get_eco_impact_by_mood(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        '''SELECT mood, category, SUM(amount) as total_amount 
-           FROM expenses WHERE user_id = ? GROUP BY mood, category''',
-        (user_id,)
+    delete = 'DELETE FROM expenses_fts WHERE rowid = old.id;'
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN {delete} END')
+    conn.execute(
+        f'CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF user_id, description ON expenses '
+        f'BEGIN {delete} END'
     )
-    
-    results = cursor.fetchall()
-    conn.close()
-    
-    return [dict(result) for result in results]
\ No newline at end of file
+
+def rebuild_search_index(conn):
+    # Re-index every description in this file, e.g. after restoring a backup
+    # or writing expenses from another client. Recreated rather than emptied,
+    # which also converts indexes from older schema versions.
+    conn.execute('DROP TABLE IF EXISTS expenses_fts')
+    create_search_index(conn)
+    index_expenses(conn, conn.execute("SELECT id, user_id, description FROM expenses WHERE description <> ''"))
+    # Archived rows are indexed too; rows caught mid-move are hot already
+    index_expenses(conn, [
+        (row[0], row[1], row[5]) for row in _archived_rows(conn)
+        if row[5] and not conn.execute('SELECT 1 FROM expenses WHERE id = ?', (row[0],)).fetchone()
+    ])
+
+def search_terms(user_id, text):
+    # Free text to an FTS5 expression over one user's tokens: every word
+    # must appear, matched as a prefix, so "cof star" finds "Coffee at
+    # Starbucks". Quoting keeps FTS5 operators in the input from being parsed.
+    return ' '.join(f'"u{user_id}_{word}"*' for word in SEARCH_WORD.findall(text))
+
+@timed('db')
+@cached
+def search_expenses(user_id, text, offset=0, limit=SEARCH_PAGE, category=None, start=None, end=None, as_frame=False):
+    # Best matches first (lowest bm25 score). Returns (rows, next_offset),
+    # next_offset being None on the last page. Offsets rather than a cursor:
+    # the ranking is computed over all of the user's matches either way, and
+    # scores shift as other rows are indexed, so a score cursor would drift.
+    names = ['id', 'date', 'category', 'amount', 'description', 'mood', 'score']
+    terms = search_terms(user_id, text)
+    rows = []
+    if terms:
+        rows = _search(user_id, terms, offset, limit + 1, category, start, end)
+
+    next_offset = offset + limit if len(rows) > limit else None
+    rows = rows[:limit]
+    if as_frame:
+        return to_frame(names, rows), next_offset
+    return [dict(zip(names, row)) for row in rows], next_offset
+
+def _search(user_id, terms, offset, limit, category, start, end):
+    where, params = _window_sql(start, end, 'e.date')
+    if category:
+        where += ' AND e.category = ?'
+        params.append(category)
+    with read_connection(user_id) as conn:
+        # Archived rows stay in the index, so archived years are searched too
+        source = expenses_source(conn, user_id, start, end, alias='e')
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(
+            f'''SELECT e.id, e.date, e.category, e.amount, e.description, e.mood,
+bm25(expenses_fts) AS score
+                FROM expenses_fts JOIN {source} ON e.id = expenses_fts.rowid
+                WHERE expenses_fts MATCH ? AND e.user_id = ?{where}
+                ORDER BY score, e.id LIMIT ? OFFSET ?''',
+            [terms, user_id] + params + [limit, offset]
+        )
+        return cursor.fetchall()
+
+# ----------------- PARTITIONING ------------------
+# Moves an unpartitioned database to SHARDS files: DB_PATH stays as the
+# users directory and each user's rows are copied into their shard.
+DERIVED_TABLES = ('data_versions', 'forecast_stats', 'forecast_runs', 'forecasts', 'anomaly_stats',
+                  'spending_anomalies') + tuple(table for table, *_ in ROLLUPS.values())
+
+def split_into_shards(prune=False):
+    # Returns the number of expenses copied into each shard. With prune, the
+    # copies are then removed from the directory file.
+    if not SHARDS:
+        raise ValueError('partitioning is off; set EXPENSE_TRACKER_SHARDS or pass shards to configure()')
+    init_db()
+    source = str(Path(DB_PATH).resolve())
+    with read_connection() as conn:
+        expected = conn.execute('SELECT COUNT(*) FROM expenses').fetchone()[0]
+        if conn.execute('SELECT 1 FROM archived_years LIMIT 1').fetchone():
+            raise ValueError('the database has archived years; restore them first (manage.py archive --restore)')
+
+    copied = []
+    for index in range(SHARDS):
+        pool = _get_pools(shard_path(index))[0]
+        conn = pool.acquire()
+        try:
+            if conn.execute('SELECT 1 FROM expenses LIMIT 1').fetchone():
+                raise ValueError(f'{shard_path(index)} already has expenses')
+            conn.create_function('shard_of', 1, shard_of, deterministic=True)
+            # ATTACH has to happen outside a transaction
+            conn.execute('ATTACH DATABASE ? AS source', (source,))
+            try:
+                with conn:
+                    columns = 'id, user_id, date, category, amount, description, mood, created_at, fingerprint'
+                    count = conn.execute(
+                        f'''INSERT INTO main.expenses ({columns})
+                            SELECT {columns} FROM source.expenses WHERE shard_of(user_id) = ?''',
+                        (index,)
+                    ).rowcount
+                    conn.execute(
+                        '''INSERT INTO main.data_versions (user_id, version)
+                           SELECT user_id, version FROM source.data_versions WHERE shard_of(user_id) = ?''',
+                        (index,)
+                    )
+                    rebuild_rollups(conn)
+                    rebuild_forecast_stats(conn)
+                    rebuild_anomaly_stats(conn)
+                    rebuild_search_index(conn)
+            finally:
+                conn.execute('DETACH DATABASE source')
+        finally:
+            pool.release(conn)
+        copied.append(count)
+
+    if sum(copied) != expected:
+        raise RuntimeError(f'copied {sum(copied)} expenses into shards but the directory has {expected}')
+    if prune:
+        with write_connection() as conn:
+            for table in ('expenses',) + DERIVED_TABLES:
+                conn.execute(f'DELETE FROM {table}')
+        conn = get_db_connection()
+        try:
+            conn.execute('VACUUM')
+        finally:
+            conn.close()
+    read_cache.clear()
+    return copied
@@ -0,0 +1,104 @@
+from database import cached, database_paths, date_window, expenses_source, fetch_all, read_connection, write_connection
+from metrics import timed
+
+# kg CO2 per ₹100 for categories missing from the factor table
+FALLBACK_FACTOR = 1.0
+
+# CO2 is never stored, it is derived at read time from the spend totals and
+# one version of the factor table. Publishing a new version therefore
+# recomputes the whole history, and older versions stay queryable.
+_IMPACT = 'SUM({amount} * COALESCE(f.kg_co2_per_100, ?) / 100) AS co2_kg'
+IMPACT_QUERIES = {
+    # Served from the rollups: one row per group
+    'category': f'''SELECT r.category, SUM(r.total_amount) AS total_amount, {_IMPACT.format(amount='r.total_amount')}
+                    FROM rollup_category r LEFT JOIN eco_factors f ON f.version = ? AND f.category = r.category
+                    WHERE r.user_id = ? GROUP BY r.category ORDER BY r.category''',
+    'mood': f'''SELECT r.mood, SUM(r.total_amount) AS total_amount, {_IMPACT.format(amount='r.total_amount')}
+                FROM rollup_category_mood r LEFT JOIN eco_factors f ON f.version = ? AND f.category = r.category
+                WHERE r.user_id = ? GROUP BY r.mood ORDER BY r.mood''',
+    'category_mood': f'''SELECT r.mood, r.category, SUM(r.total_amount) AS total_amount, {_IMPACT.format(amount='r.total_amount')}
+                         FROM rollup_category_mood r LEFT JOIN eco_factors f ON f.version = ? AND f.category = r.category
+                         WHERE r.user_id = ? GROUP BY r.mood, r.category ORDER BY r.mood, r.category''',
+    # Need the category of each day's spend: a range read of the covering
+    # index. {source} is the user's expenses, archived years included.
+    'date': f'''SELECT e.date, SUM(e.amount) AS total_amount, {_IMPACT.format(amount='e.amount')}
+                FROM {{source}} LEFT JOIN eco_factors f ON f.version = ? AND f.category = e.category
+                WHERE e.user_id = ? GROUP BY e.date ORDER BY e.date''',
+    'month': f'''SELECT substr(e.date, 1, 7) AS month, SUM(e.amount) AS total_amount, {_IMPACT.format(amount='e.amount')}
+                 FROM {{source}} LEFT JOIN eco_factors f ON f.version = ? AND f.category = e.category
+                 WHERE e.user_id = ? GROUP BY month ORDER BY month''',
+}
+
+# The same groupings over a date window: a range of the user's expenses on
+# the (user_id, date) covering index. {window} takes the date clauses.
+_GROUPS = {
+    'category': ('e.category',),
+    'mood': ('e.mood',),
+    'category_mood': ('e.mood', 'e.category'),
+    'date': ('e.date',),
+    'month': ('substr(e.date, 1, 7) AS month',),
+}
+WINDOW_IMPACT_QUERY = '''SELECT {columns}, SUM(e.amount) AS total_amount, {impact}
+                         FROM {source}
+                         LEFT JOIN eco_factors f ON f.version = ? AND f.category = e.category
+                         WHERE e.user_id = ?{window} GROUP BY {keys} ORDER BY {keys}'''
+
+def _window_impact_sql(by, start, end, source):
+    where, params = date_window(start, end, 'e.date')
+    columns = _GROUPS[by]
+    keys = ', '.join(str(i + 1) for i in range(len(columns)))
+    sql = WINDOW_IMPACT_QUERY.format(
+        columns=', '.join(columns), impact=_IMPACT.format(amount='e.amount'),
+        window=''.join(f' AND {clause}' for clause in where), keys=keys, source=source,
+    )
+    return sql, params
+
+def current_factor_version():
+    with read_connection() as conn:
+        return conn.execute('SELECT MAX(version) FROM eco_factor_versions').fetchone()[0]
+
+def get_factors(version=None):
+    version = version or current_factor_version()
+    with read_connection() as conn:
+        rows = conn.execute(
+            'SELECT category, kg_co2_per_100 FROM eco_factors WHERE version = ?', (version,)
+        ).fetchall()
+    return {row['category']: row['kg_co2_per_100'] for row in rows}
+
+def publish_factors(factors, note=None):
+    # Factors are kg CO2 per ₹100 spent; returns the new version number.
+    # Every shard joins against its own copy; the users directory, which
+    # current_factor_version() reads, is written last.
+    with read_connection() as conn:
+        version = conn.execute('SELECT COALESCE(MAX(version), 0) + 1 FROM eco_factor_versions').fetchone()[0]
+    for path in reversed(database_paths()):
+        with write_connection(path=path) as conn:
+            conn.execute('INSERT INTO eco_factor_versions (version, note) VALUES (?, ?)', (version, note))
+            conn.executemany(
+                'INSERT INTO eco_factors (version, category, kg_co2_per_100) VALUES (?, ?, ?)',
+                [(version, category, factor) for category, factor in factors.items()]
+            )
+    return version
+
+def get_eco_impact(user_id, by='category', version=None, as_frame=False, start=None, end=None):
+    if by not in IMPACT_QUERIES:
+        raise ValueError(f'cannot group eco impact by {by!r}')
+    # Resolved here so the cache key changes when a new version is published
+    return _get_eco_impact(user_id, by, version or current_factor_version(), as_frame, start, end)
+
+# Timed here rather than on get_eco_impact, so latency and cache hits are
+# recorded under the same name
+@timed('db')
+@cached
+def _get_eco_impact(user_id, by, version, as_frame=False, start=None, end=None):
+    sql, params = IMPACT_QUERIES[by], []
+    with read_connection(user_id) as conn:
+        if start or end:
+            sql, params = _window_impact_sql(by, start, end, expenses_source(conn, user_id, start, end, 'e', indexed=True))
+        elif '{source}' in sql:
+            sql = sql.format(source=expenses_source(conn, user_id, alias='e'))
+        return fetch_all(conn, sql, [FALLBACK_FACTOR, version, user_id] + params, as_frame)
+
+@timed('db')
+def get_total_impact(user_id, version=None, start=None, end=None):
+    return sum(row['co2_kg'] for row in get_eco_impact(user_id, 'category', version, start=start, end=end))
@@ -0,0 +1,104 @@
+import csv
+import io
+import time
+
+from database import expenses_source, read_connection
+
+EXPORT_COLUMNS = ('date', 'category', 'amount', 'description', 'mood')
+CHUNK_SIZE = 5000
+FORMATS = ('csv', 'parquet')
+
+def iter_expense_chunks(user_id, start=None, end=None, categories=None, chunk_size=CHUNK_SIZE):
+    # Yields lists of at most chunk_size plain tuples, oldest first, straight
+    # off the cursor. Memory stays at one chunk whatever the history size.
+    clauses = ['user_id = ?']
+    params = [user_id]
+    if start:
+        clauses.append('date >= ?')
+        params.append(str(start))
+    if end:
+        clauses.append('date <= ?')
+        params.append(str(end))
+    if categories:
+        clauses.append(f'category IN ({", ".join("?" * len(categories))})')
+        params.extend(categories)
+
+    with read_connection(user_id) as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None  # tuples, no per-row Row/dict objects
+        cursor.execute(
+            f'''SELECT {', '.join(EXPORT_COLUMNS)} FROM {expenses_source(conn, user_id, start, end)}
+                WHERE {' AND '.join(clauses)} ORDER BY date, id''',
+            params
+        )
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+def _parquet_schema():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError('Parquet export needs pyarrow: pip install pyarrow') from None
+    return pa.schema([
+        ('date', pa.string()),
+        ('category', pa.dictionary(pa.int8(), pa.string())),
+        ('amount', pa.float64()),
+        ('description', pa.string()),
+        ('mood', pa.dictionary(pa.int8(), pa.string())),
+    ])
+
+def parquet_available():
+    try:
+        _parquet_schema()
+    except ImportError:
+        return False
+    return True
+
+def export_expenses(user_id, out, format='csv', chunk_size=CHUNK_SIZE, progress=None, **filters):
+    # out is a path or a binary file object; returns row count and rows/sec
+    if format not in FORMATS:
+        raise ValueError(f'unknown export format {format!r}')
+    stats = {'rows': 0}
+    started = time.perf_counter()
+    chunks = iter_expense_chunks(user_id, chunk_size=chunk_size, **filters)
+
+    if format == 'csv':
+        f = open(out, 'wb') if isinstance(out, str) else out
+        text = io.TextIOWrapper(f, encoding='utf-8', newline='', write_through=True)
+        try:
+            writer = csv.writer(text)
+            writer.writerow(EXPORT_COLUMNS)
+            for rows in chunks:
+                writer.writerows(rows)
+                stats['rows'] += len(rows)
+                if progress:
+                    progress(dict(stats))
+        finally:
+            text.detach()  # leave the caller's file object open
+            if f is not out:
+                f.close()
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = _parquet_schema()
+        with pq.ParquetWriter(out, schema, compression='zstd') as writer:
+            for rows in chunks:
+                columns = list(zip(*rows))
+                writer.write_table(pa.table(
+                    [pa.array(column).cast(field.type) for column, field in zip(columns, schema)],
+                    schema=schema,
+                ))
+                stats['rows'] += len(rows)
+                if progress:
+                    progress(dict(stats))
+
+    stats['seconds'] = time.perf_counter() - started
+    stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta, timezone
+
+from database import (ALL_CATEGORIES, FORECAST_EPOCH, database_paths, get_forecast_stats, read_connection,
+                      wait_for_writes, write_connection)
+from metrics import timed
+
+MIN_POINTS = 3
+DEFAULT_HORIZON = 7
+# Days stored per series by run_batch; covers every horizon the UI offers
+BATCH_HORIZON = 30
+# Users refitted per write transaction, so app writes are not held up long
+BATCH_USERS = 500
+
+def fit(stats):
+    # Closed-form simple linear regression from the running sums; gives the
+    # same line as sklearn's LinearRegression on (day, amount) points.
+    n = stats['n']
+    sxx = n * stats['sum_xx'] - stats['sum_x'] ** 2
+    if sxx == 0:
+        # Every point on the same day: flat line through the mean
+        return 0.0, stats['sum_y'] / n
+    slope = (n * stats['sum_xy'] - stats['sum_x'] * stats['sum_y']) / sxx
+    intercept = (stats['sum_y'] - slope * stats['sum_x']) / n
+    return slope, intercept
+
+def predict(stats, horizon=DEFAULT_HORIZON):
+    slope, intercept = fit(stats)
+    last = stats['max_x']
+    return [
+        {
+            'day': i,
+            'date': (FORECAST_EPOCH + timedelta(days=last + i)).isoformat(),
+            'amount': intercept + slope * (last + i),
+        }
+        for i in range(1, horizon + 1)
+    ]
+
+def fit_all(n, sum_x, sum_y, sum_xy, sum_xx):
+    # fit() for many series at once, one array element per series.
+    # n * sum_xx overflows int64 for long series, and float64 loses the
+    # difference, so the denominator is worked out in extended precision.
+    # Imported here: app.py imports this module, and the login page loads
+    # no numpy
+    import numpy as np
+
+    sxx = n.astype(np.longdouble) * sum_xx - sum_x.astype(np.longdouble) ** 2
+    flat = sxx == 0
+    slope = np.zeros(len(n))
+    slope[~flat] = (n * sum_xy - sum_x * sum_y)[~flat] / sxx[~flat].astype(np.float64)
+    intercept = (sum_y - slope * sum_x) / n
+    return slope, intercept
+
+def _refit(conn, user_ids, horizon, generated_at):
+    # Replaces the stored forecasts of these users inside the caller's
+    # transaction; returns the number of series written.
+    marks = ','.join('?' * len(user_ids))
+    versions = conn.execute(f'SELECT user_id, version FROM data_versions WHERE user_id IN ({marks})', user_ids).fetchall()
+    rows = conn.execute(
+        f'''SELECT user_id, category, n, sum_x, sum_y, sum_xy, sum_xx, max_x FROM forecast_stats
+            WHERE user_id IN ({marks}) AND n >= ?''',
+        user_ids + [MIN_POINTS]
+    ).fetchall()
+    conn.execute(f'DELETE FROM forecasts WHERE user_id IN ({marks})', user_ids)
+    conn.executemany(
+        '''INSERT INTO forecast_runs (user_id, data_version, horizon, generated_at) VALUES (?, ?, ?, ?)
+           ON CONFLICT (user_id) DO UPDATE SET
+               data_version = excluded.data_version,
+               horizon = excluded.horizon,
+               generated_at = excluded.generated_at''',
+        [(user_id, version, horizon, generated_at) for user_id, version in versions]
+    )
+    if not rows:
+        return 0
+
+    import numpy as np
+
+    users, categories, *sums, max_x = zip(*rows)
+    n, sum_x, sum_y, sum_xy, sum_xx = (
+        np.array(column, dtype=np.int64 if i in (0, 1, 4) else np.float64) for i, column in enumerate(sums)
+    )
+    slope, intercept = fit_all(n, sum_x, sum_y, sum_xy, sum_xx)
+    # One row per series, one column per day ahead
+    days = np.arange(1, horizon + 1)
+    x = np.array(max_x, dtype=np.int64)[:, None] + days
+    amounts = intercept[:, None] + slope[:, None] * x
+    dates = (np.datetime64(FORECAST_EPOCH, 'D') + x).astype(str)
+    conn.executemany(
+        'INSERT INTO forecasts (user_id, category, day, date, amount) VALUES (?, ?, ?, ?, ?)',
+        zip(
+            np.repeat(users, horizon).tolist(),
+            np.repeat(categories, horizon).tolist(),
+            np.tile(days, len(rows)).tolist(),
+            dates.ravel().tolist(),
+            amounts.ravel().tolist(),
+        )
+    )
+    return len(rows)
+
+@timed('forecast')
+def run_batch(horizon=BATCH_HORIZON, force=False):
+    # Nightly job: store the next `horizon` days of every user's forecasts
+    # (overall and per category). Only users with new expenses since their
+    # last run are refitted unless force is set.
+    generated_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    summary = {'users': 0, 'series': 0, 'generated_at': generated_at}
+    stale = '' if force else 'WHERE r.data_version IS NOT d.version OR r.horizon < ?'
+    for path in database_paths():
+        with read_connection(path=path) as conn:
+            user_ids = [row[0] for row in conn.execute(
+                f'''SELECT d.user_id FROM data_versions d LEFT JOIN forecast_runs r USING (user_id)
+                    {stale} ORDER BY d.user_id''',
+                () if force else (horizon,)
+            )]
+        for i in range(0, len(user_ids), BATCH_USERS):
+            chunk = user_ids[i:i + BATCH_USERS]
+            with write_connection(path=path) as conn:
+                # Versions and sums are read under the write lock, so a run
+                # never records a version newer than the sums it fitted
+                conn.execute('BEGIN IMMEDIATE')
+                summary['series'] += _refit(conn, chunk, horizon, generated_at)
+            summary['users'] += len(chunk)
+    return summary
+
+def last_run(user_id):
+    # The batch run behind this user's stored forecasts, or None when there
+    # is none or it predates their latest expenses
+    wait_for_writes(user_id)
+    with read_connection(user_id) as conn:
+        row = conn.execute(
+            '''SELECT r.horizon, r.generated_at FROM forecast_runs r
+               JOIN data_versions d ON d.user_id = r.user_id AND d.version = r.data_version
+               WHERE r.user_id = ?''',
+            (user_id,)
+        ).fetchone()
+    return dict(row) if row else None
+
+def stored_forecast(user_id, horizon=DEFAULT_HORIZON, category=ALL_CATEGORIES):
+    # run_batch's output, in forecast()'s format; None if it is out of date
+    run = last_run(user_id)
+    if run is None or run['horizon'] < horizon:
+        return None
+    with read_connection(user_id) as conn:
+        rows = conn.execute(
+            'SELECT day, date, amount FROM forecasts WHERE user_id = ? AND category = ? AND day <= ? ORDER BY day',
+            (user_id, category, horizon)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+@timed('forecast')
+def forecast(user_id, horizon=DEFAULT_HORIZON, category=None, start=None, end=None):
+    # Predicted spend for each of the next `horizon` days after the latest
+    # expense; empty until there are MIN_POINTS expenses in the series.
+    # With start/end the line is fitted to that window only. Otherwise the
+    # nightly batch's results are used while they are still current.
+    if not (start or end):
+        stored = stored_forecast(user_id, horizon, category or ALL_CATEGORIES)
+        if stored is not None:
+            return stored
+    stats = get_forecast_stats(user_id, category or ALL_CATEGORIES, start, end)
+    if not stats or stats['n'] < MIN_POINTS:
+        return []
+    return predict(stats, horizon)
@@ -0,0 +1,136 @@
+import csv
+import functools
+import hashlib
+import io
+import math
+import time
+from datetime import date, datetime
+
+from database import CATEGORIES, MOODS, add_expenses_bulk
+
+# Our own export format; bank statements need a mapping onto these fields
+DEFAULT_MAPPING = {
+    'date': 'date',
+    'category': 'category',
+    'amount': 'amount',
+    'description': 'description',
+    'mood': 'mood',
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d %b %Y', '%d-%b-%Y', '%Y/%m/%d')
+DEFAULT_CATEGORY = 'Other'
+DEFAULT_MOOD = 'Neutral'
+CHUNK_SIZE = 10000
+
+_categories = {category.lower(): category for category in CATEGORIES}
+_moods = {mood.lower(): mood for mood in MOODS}
+
+def normalize_label(value, known, default):
+    # Same cleaning as the Add Expense form: drop a leading emoji, then
+    # match case-insensitively against the known labels
+    value = (value or '').strip()
+    value = value.split(' ')[-1] if ' ' in value else value
+    return known.get(value.lower(), default)
+
+@functools.lru_cache(maxsize=8192)  # statements repeat the same few dates
+def parse_date(value, date_format=None):
+    value = value.strip()
+    if not date_format:
+        try:
+            return date.fromisoformat(value).isoformat()
+        except ValueError:
+            pass
+    for fmt in (date_format,) if date_format else DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f'unrecognised date {value!r}')
+
+def parse_amount(value):
+    value = value.strip().replace(',', '').replace('₹', '').replace('$', '').replace(' ', '')
+    if value.startswith('(') and value.endswith(')'):
+        value = '-' + value[1:-1]
+    amount = float(value)
+    # float() also takes "nan" and "inf", which no amount column can hold
+    if not math.isfinite(amount):
+        raise ValueError(f'unrecognised amount {value!r}')
+    return amount
+
+def normalize_row(record, mapping, date_format=None, expenses_negative=False):
+    # Returns (date, category, amount, description, mood), None for rows
+    # that are not expenses (credits, zero amounts), or raises ValueError
+    amount = parse_amount(record.get(mapping['amount']) or '')
+    if expenses_negative:
+        amount = -amount
+    if amount <= 0:
+        return None
+    return (
+        parse_date(record.get(mapping['date']) or '', date_format),
+        normalize_label(record.get(mapping.get('category', '')), _categories, DEFAULT_CATEGORY),
+        round(amount, 2),
+        (record.get(mapping.get('description', '')) or '').strip(),
+        normalize_label(record.get(mapping.get('mood', '')), _moods, DEFAULT_MOOD),
+    )
+
+def row_digest(row):
+    return hashlib.blake2b('|'.join(str(part) for part in row).encode(), digest_size=16).digest()
+
+def _open_text(source):
+    if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        return open(source, newline='', encoding='utf-8-sig')
+    if isinstance(source, io.TextIOBase):
+        return source
+    return io.TextIOWrapper(source, newline='', encoding='utf-8-sig')  # e.g. an upload
+
+def import_csv(user_id, source, mapping=None, date_format=None, expenses_negative=False,
+               delimiter=',', chunk_size=CHUNK_SIZE, progress=None):
+    mapping = {**DEFAULT_MAPPING, **(mapping or {})}
+    stats = {'read': 0, 'inserted': 0, 'duplicates': 0, 'skipped': 0, 'invalid': 0, 'errors': []}
+    occurrences = {}
+    batch = []
+    started = time.perf_counter()
+
+    def flush():
+        inserted = add_expenses_bulk(batch)
+        stats['inserted'] += inserted
+        stats['duplicates'] += len(batch) - inserted
+        batch.clear()
+        if progress:
+            progress(dict(stats))
+
+    f = _open_text(source)
+    try:
+        reader = csv.DictReader(f, delimiter=delimiter)
+        missing = [column for column in (mapping['date'], mapping['amount']) if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f'CSV has no column named {", ".join(map(repr, missing))}')
+
+        for line, record in enumerate(reader, start=2):
+            stats['read'] += 1
+            try:
+                row = normalize_row(record, mapping, date_format, expenses_negative)
+            except ValueError as e:
+                stats['invalid'] += 1
+                if len(stats['errors']) < 20:
+                    stats['errors'].append(f'line {line}: {e}')
+                continue
+            if row is None:
+                stats['skipped'] += 1
+                continue
+            # Identical rows in one file (two coffees on the same day) stay
+            # distinct through their occurrence number, while importing the
+            # same file again reproduces the same fingerprints.
+            digest = row_digest(row)
+            occurrence = occurrences[digest] = occurrences.get(digest, 0) + 1
+            batch.append((user_id,) + row + (f'{digest.hex()}:{occurrence}',))
+            if len(batch) >= chunk_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        if f is not source:
+            f.close()
+
+    stats['seconds'] = time.perf_counter() - started
+    stats['rows_per_sec'] = stats['read'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
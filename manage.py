@@ -0,0 +1,163 @@
+import argparse
+import sqlite3
+
+import database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Expense Tracker maintenance commands")
+    parser.add_argument("--db", help="database file (defaults to EXPENSE_TRACKER_DB or expense_tracker.db)")
+    parser.add_argument("--shards", type=int, help="partitioned mode with N shard files (defaults to EXPENSE_TRACKER_SHARDS)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("migrate", help="apply pending schema migrations")
+    commands.add_parser("check-plans", help="fail if a hot query falls back to a full scan")
+
+    rebuild = commands.add_parser("rebuild-rollups", help="recompute rollup tables and forecast statistics from expenses")
+    rebuild.add_argument("--user", type=int, help="only rebuild this user's rollups")
+
+    imports = commands.add_parser("import-csv", help="bulk import a CSV or bank statement for one user")
+    imports.add_argument("file")
+    imports.add_argument("--user", type=int, required=True)
+    imports.add_argument("--map", action="append", default=[], metavar="FIELD=COLUMN",
+                         help="column mapping, e.g. --map date='Txn Date' --map amount=Debit")
+    imports.add_argument("--date-format", help="strptime format, e.g. %%d/%%m/%%Y")
+    imports.add_argument("--expenses-negative", action="store_true", help="debits are negative amounts")
+    imports.add_argument("--delimiter", default=",")
+
+    exports = commands.add_parser("export", help="stream one user's expenses to CSV or Parquet")
+    exports.add_argument("file")
+    exports.add_argument("--user", type=int, required=True)
+    exports.add_argument("--format", choices=["csv", "parquet"], help="defaults to the file extension")
+    exports.add_argument("--start", help="first date, YYYY-MM-DD")
+    exports.add_argument("--end", help="last date, YYYY-MM-DD")
+    exports.add_argument("--category", action="append", dest="categories", help="repeat for several")
+
+    commands.add_parser("rebuild-search", help="re-index every description, e.g. after writing expenses from another client")
+
+    anomalies = commands.add_parser("rebuild-anomalies", help="recompute spending anomaly statistics by replaying history")
+    anomalies.add_argument("--user", type=int, help="only rebuild this user's statistics")
+
+    split = commands.add_parser("split-shards", help="copy an unpartitioned database's expenses into --shards files")
+    split.add_argument("--prune", action="store_true", help="then delete the copied rows from the directory file")
+
+    batch = commands.add_parser("forecast-batch", help="precompute every user's forecasts; run nightly, e.g. from cron")
+    batch.add_argument("--horizon", type=int, help="days ahead to store (default 30)")
+    batch.add_argument("--force", action="store_true", help="refit users with no new expenses too")
+
+    archiving = commands.add_parser("archive", help="move old years of expenses into the compressed archive file")
+    archiving.add_argument("--before-year", help="archive years before this one (default: older than "
+                           "EXPENSE_TRACKER_ARCHIVE_DAYS, 730 days)")
+    archiving.add_argument("--user", type=int, help="only this user")
+    archiving.add_argument("--restore", action="store_true", help="move --user's archived years back instead")
+    archiving.add_argument("--year", help="with --restore, only this year")
+    archiving.add_argument("--vacuum", action="store_true", help="then VACUUM to give the freed pages back to the OS")
+
+    factors = commands.add_parser("eco-factors", help="show eco factors, or publish a new version")
+    factors.add_argument("factors", nargs="*", metavar="CATEGORY=KG", help="kg CO2 per ₹100, e.g. Food=2.2")
+    factors.add_argument("--note", help="why the factors changed")
+
+    args = parser.parse_args()
+    if args.db or args.shards is not None:
+        database.configure(args.db, shards=args.shards)
+    database.init_db()
+
+    if args.command == "migrate":
+        with database.read_connection() as conn:
+            print(f"schema version {database.schema_version(conn)}")
+    elif args.command == "check-plans":
+        database.check_query_plans()
+        print("all hot queries use an index")
+    elif args.command == "rebuild-rollups":
+        paths = [database.database_path(args.user)] if args.user else database.database_paths()
+        for path in paths:
+            with database.write_connection(path=path) as conn:
+                database.rebuild_rollups(conn, args.user)
+                database.rebuild_forecast_stats(conn, args.user)
+        print("rollups rebuilt")
+    elif args.command == "rebuild-search":
+        for path in database.database_paths():
+            with database.write_connection(path=path) as conn:
+                database.rebuild_search_index(conn)
+                # Cached search results predate the new entries
+                conn.execute("UPDATE data_versions SET version = version + 1")
+        print("search index rebuilt")
+    elif args.command == "rebuild-anomalies":
+        import anomaly
+        anomaly.rebuild(args.user)
+        print("anomaly statistics rebuilt")
+    elif args.command == "split-shards":
+        try:
+            copied = database.split_into_shards(prune=args.prune)
+        except ValueError as e:
+            parser.exit(1, f"error: {e}\n")
+        for index, count in enumerate(copied):
+            print(f"  {database.shard_path(index)}: {count:,} expenses")
+        print(f"split {sum(copied):,} expenses into {len(copied)} shards"
+              + ("" if args.prune else "; run again with --prune to drop them from the directory file"))
+    elif args.command == "import-csv":
+        import importer
+        mapping = dict(item.split("=", 1) for item in args.map)
+        try:
+            result = importer.import_csv(
+                args.user, args.file, mapping=mapping, date_format=args.date_format,
+                expenses_negative=args.expenses_negative, delimiter=args.delimiter,
+                progress=lambda stats: print(f"  {stats['read']:,} rows read, {stats['inserted']:,} inserted", flush=True),
+            )
+        except ValueError as e:
+            parser.exit(1, f"error: {e}\n")
+        for error in result["errors"]:
+            print(f"  {error}")
+        print(f"imported {result['inserted']:,} of {result['read']:,} rows "
+              f"({result['duplicates']:,} duplicates, {result['skipped']:,} skipped, {result['invalid']:,} invalid) "
+              f"in {result['seconds']:.1f}s, {result['rows_per_sec']:,.0f} rows/s")
+    elif args.command == "export":
+        import exporter
+        export_format = args.format or ("parquet" if args.file.endswith(".parquet") else "csv")
+        result = exporter.export_expenses(
+            args.user, args.file, format=export_format,
+            start=args.start, end=args.end, categories=args.categories,
+        )
+        print(f"exported {result['rows']:,} rows in {result['seconds']:.1f}s, {result['rows_per_sec']:,.0f} rows/s")
+    elif args.command == "forecast-batch":
+        import forecast
+        summary = forecast.run_batch(args.horizon or forecast.BATCH_HORIZON, force=args.force)
+        print(f"refitted {summary['users']:,} users ({summary['series']:,} series) at {summary['generated_at']} UTC")
+    elif args.command == "archive":
+        import archive
+        if args.restore:
+            if args.user is None:
+                parser.exit(1, "error: --restore needs --user\n")
+            print(f"restored {archive.restore(args.user, args.year):,} expenses")
+        else:
+            # Safe to interrupt; the next run picks up where this one stopped
+            summary = archive.run(args.before_year, args.user)
+            print(f"archived {summary['rows']:,} expenses in {summary['partitions']:,} user-years "
+                  f"before {summary['before_year']}")
+        if args.vacuum:
+            database.close_connections()
+            for path in database.database_paths():
+                conn = sqlite3.connect(path, isolation_level=None)
+                try:
+                    conn.execute("VACUUM")
+                finally:
+                    conn.close()
+        for stat in archive.stats():
+            print(f"  {stat['path']}: {stat['rows']:,} expenses in {stat['partitions']:,} partitions, "
+                  f"{stat['bytes'] / 2**20:.1f} MB")
+    elif args.command == "eco-factors":
+        import eco
+        if args.factors:
+            # Unlisted categories carry over from the current version
+            factors = eco.get_factors()
+            for item in args.factors:
+                category, _, value = item.partition("=")
+                factors[category] = float(value)
+            print(f"published eco factors version {eco.publish_factors(factors, args.note)}")
+        version = eco.current_factor_version()
+        for category, factor in sorted(eco.get_factors(version).items()):
+            print(f"v{version}  {category:<10} {factor:g} kg CO2 / ₹100")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import bisect
+import os
+import threading
+import time
+import functools
+
+# Upper bounds in seconds, 100µs to 10s; the last bucket is +Inf
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = 'expense_tracker'
+# Set to have a background thread keep a Prometheus textfile up to date
+TEXTFILE = os.environ.get('EXPENSE_TRACKER_METRICS_FILE')
+TEXTFILE_INTERVAL = float(os.environ.get('EXPENSE_TRACKER_METRICS_INTERVAL', '15'))
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.rows = None  # stays None for timers that return no rows
+
+    def observe(self, seconds, rows=None):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if rows is not None:
+            self.rows = (self.rows or 0) + rows
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket, as Prometheus does
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if seen + n >= rank and n:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (kind, name) -> Histogram
+        self._counters = {}    # (metric, name, label) -> int
+        self._collectors = []
+
+    def observe(self, kind, name, seconds, rows=None):
+        with self._lock:
+            histogram = self._histograms.get((kind, name))
+            if histogram is None:
+                histogram = self._histograms[(kind, name)] = Histogram()
+            histogram.observe(seconds, rows)
+
+    def count(self, metric, name, label, amount=1):
+        key = (metric, name, label)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_collector(self, collect):
+        # collect() returns {metric name: value} gauges read at export time
+        self._collectors.append(collect)
+
+    def snapshot(self):
+        with self._lock:
+            rows = []
+            for (kind, name), h in sorted(self._histograms.items()):
+                rows.append({
+                    'kind': kind,
+                    'name': name,
+                    'calls': h.count,
+                    'total_s': h.sum,
+                    'mean_ms': h.sum / h.count * 1000 if h.count else 0.0,
+                    'p50_ms': h.quantile(0.5) * 1000,
+                    'p95_ms': h.quantile(0.95) * 1000,
+                    'p99_ms': h.quantile(0.99) * 1000,
+                    'rows': h.rows or 0,
+                })
+            return rows
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def prometheus_text(self):
+        lines = [
+            f'# HELP {PREFIX}_latency_seconds Latency of database calls and page renders.',
+            f'# TYPE {PREFIX}_latency_seconds histogram',
+        ]
+        with self._lock:
+            histograms = [(key, list(h.buckets), h.sum, h.count, h.rows) for key, h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+        for (kind, name), buckets, total, count, _ in histograms:
+            labels = f'kind="{kind}",name="{name}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float('inf'),), buckets):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{PREFIX}_latency_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{PREFIX}_latency_seconds_sum{{{labels}}} {total}')
+            lines.append(f'{PREFIX}_latency_seconds_count{{{labels}}} {count}')
+
+        lines.append(f'# HELP {PREFIX}_rows_total Rows returned by database calls.')
+        lines.append(f'# TYPE {PREFIX}_rows_total counter')
+        for (kind, name), _, _, _, rows in histograms:
+            if rows is not None:
+                lines.append(f'{PREFIX}_rows_total{{kind="{kind}",name="{name}"}} {rows}')
+
+        metrics = sorted({metric for metric, _, _ in (key for key, _ in counters)})
+        for metric in metrics:
+            lines.append(f'# TYPE {PREFIX}_{metric}_total counter')
+            for (m, name, label), value in counters:
+                if m == metric:
+                    lines.append(f'{PREFIX}_{metric}_total{{name="{name}",result="{label}"}} {value}')
+
+        for collect in self._collectors:
+            for metric, value in sorted(collect().items()):
+                lines.append(f'# TYPE {PREFIX}_{metric} gauge')
+                lines.append(f'{PREFIX}_{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+def row_count(result):
+    if result is None or isinstance(result, (int, float, str, bool)):
+        return None
+    if isinstance(result, tuple) and result and hasattr(result[0], '__len__'):
+        return len(result[0])  # (page, cursor), as a list or a DataFrame
+    if isinstance(result, dict):
+        return 1
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+def timed(kind):
+    def decorator(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            registry.observe(kind, name, time.perf_counter() - started, row_count(result))
+            return result
+        return wrapper
+    return decorator
+
+def write_textfile(path):
+    # Atomic replace, so a node_exporter textfile collector never reads a
+    # half-written file
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(registry.prometheus_text())
+    os.replace(tmp, path)
+
+_exporter = None
+
+def start_textfile_exporter(path=TEXTFILE, interval=TEXTFILE_INTERVAL):
+    global _exporter
+    if _exporter is not None:
+        return _exporter
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_textfile(path)
+            except OSError:
+                pass  # keep serving requests; try again next interval
+
+    _exporter = threading.Thread(target=run, name='metrics-textfile', daemon=True)
+    _exporter.start()
+    return _exporter
@@ -0,0 +1,67 @@
+import statistics
+
+import pytest
+
+import database
+
+USUAL = [100.0, 110.0, 90.0, 105.0, 95.0, 100.0, 102.0, 98.0, 100.0, 100.0]
+
+@pytest.fixture
+def user_id(tmp_path):
+    database.configure(str(tmp_path / 'anomalies.db'), shards=0)
+    database.init_db()
+    yield database.create_user('user', 'password')
+    database.close_connections()
+    database.read_cache.clear()
+
+def add(user_id, amounts, first_day=1, mood='Sad', category='Shopping'):
+    for day, amount in enumerate(amounts, first_day):
+        database.add_expense(user_id, f'2024-01-{day:02d}', category, amount, 'shoes', mood)
+
+def stats(user_id):
+    return {(row['mood'], row['category']): row for row in database.get_anomaly_stats(user_id)}
+
+def test_running_stats_match_the_history(user_id):
+    add(user_id, USUAL)
+    state = stats(user_id)[('Sad', 'Shopping')]
+    assert state['n'] == len(USUAL)
+    assert state['mean'] == pytest.approx(statistics.mean(USUAL))
+    assert state['m2'] / (state['n'] - 1) == pytest.approx(statistics.variance(USUAL))
+    ewma, ewm_var = USUAL[0], 0.0
+    for amount in USUAL[1:]:
+        diff = amount - ewma
+        ewma += database.ANOMALY_ALPHA * diff
+        ewm_var = (1 - database.ANOMALY_ALPHA) * (ewm_var + database.ANOMALY_ALPHA * diff * diff)
+    assert (state['ewma'], state['ewm_var']) == (pytest.approx(ewma), pytest.approx(ewm_var))
+
+def test_an_expense_above_the_band_is_flagged(user_id):
+    add(user_id, USUAL)
+    std = statistics.stdev(USUAL)
+    mean = statistics.mean(USUAL)
+    # Just inside the band, then well above it
+    add(user_id, [mean + 2.9 * std], first_day=11)
+    assert database.get_anomalies(user_id) == []
+    add(user_id, [250.0], first_day=12)
+    [anomaly] = database.get_anomalies(user_id)
+    assert (anomaly['date'], anomaly['mood'], anomaly['category'], anomaly['amount']) == ('2024-01-12', 'Sad', 'Shopping', 250.0)
+    assert anomaly['z'] >= database.ANOMALY_Z and anomaly['recent_z'] >= database.ANOMALY_Z
+    # Other moods and categories have their own groups
+    add(user_id, [250.0], first_day=13, mood='Happy')
+    add(user_id, [250.0], first_day=14, category='Food')
+    assert len(database.get_anomalies(user_id)) == 1
+
+def test_small_groups_are_not_scored(user_id):
+    add(user_id, USUAL[:database.ANOMALY_MIN_COUNT - 1] + [10_000.0])
+    assert database.get_anomalies(user_id) == []
+
+def test_rebuild_matches_incremental_updates(user_id):
+    add(user_id, USUAL + [250.0])
+    add(user_id, [20.0, 25.0, 30.0], mood='Happy', category='Food')
+    before = (stats(user_id), database.get_anomalies(user_id))
+    with database.write_connection(user_id) as conn:
+        database.rebuild_anomaly_stats(conn)
+    after = (stats(user_id), database.get_anomalies(user_id))
+    assert after[1] == before[1]
+    assert after[0].keys() == before[0].keys()
+    for key, row in before[0].items():
+        assert after[0][key] == {name: pytest.approx(value) for name, value in row.items()}
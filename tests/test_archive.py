@@ -0,0 +1,78 @@
+import io
+import os
+import threading
+
+import pytest
+
+import archive
+import database
+import eco
+import importer
+
+CSV = '\n'.join(['date,category,amount,description,mood'] + [
+    f'20{year}-{month:02d}-{day:02d},{category},{amount},{category.lower()} {day},{mood}'
+    for year in (19, 20, 24) for month in (1, 6, 11) for day, category, amount, mood in
+    [(3, 'Food', 12.5, 'Happy'), (14, 'Travel', 80.0, 'Sad'), (27, 'Bills', 240.0, 'Neutral')]
+]) + '\n'
+
+@pytest.fixture
+def user_id(tmp_path):
+    database.configure(str(tmp_path / 'archive.db'), shards=0)
+    database.init_db()
+    user_id = database.create_user('user', 'password')
+    assert importer.import_csv(user_id, io.StringIO(CSV))['inserted'] == 27
+    yield user_id
+    database.close_connections()
+    database.read_cache.clear()
+
+def reads(user_id):
+    # Archiving doesn't change what reads return, so it bumps no data
+    # version; start cold to read the union of hot and archived rows
+    database.read_cache.clear()
+    window = {'start': '2019-05-01', 'end': '2020-08-31'}
+    return (
+        database.get_all_expenses(user_id),
+        database.get_all_expenses(user_id, **window),
+        database.get_expense_totals(user_id, **window),
+        database.get_expenses_page(user_id, limit=100)[0],
+        database.get_expenses_summary(user_id, category='Travel'),
+        [database.get_rollup(user_id, name, **window) for name in database.ROLLUPS],
+        database.get_spending_by_mood(user_id, **window),
+        database.get_forecast_stats(user_id),
+        database.get_anomaly_stats(user_id),
+        eco.get_eco_impact(user_id, 'month'),
+        [row['id'] for row in database.search_expenses(user_id, 'travel')[0]],
+    )
+
+def hot_count(user_id):
+    with database.read_connection(user_id) as conn:
+        return conn.execute('SELECT COUNT(*) FROM expenses WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+def test_archive_and_restore_keep_every_read(user_id):
+    before = reads(user_id)
+    summary = archive.run(before_year='2024')
+    assert (summary['partitions'], summary['rows']) == (2, 18)
+    assert hot_count(user_id) == 9
+    assert os.path.exists(archive.archive_path(database.DB_PATH))
+    assert reads(user_id) == before
+    assert archive.restore(user_id) == 18
+    assert hot_count(user_id) == 27
+    assert reads(user_id) == before
+
+def test_reimport_after_archiving_inserts_nothing(user_id):
+    archive.run(before_year='2024')
+    stats = importer.import_csv(user_id, io.StringIO(CSV))
+    assert (stats['inserted'], stats['duplicates']) == (0, 27)
+    assert database.get_expense_totals(user_id)['count'] == 27
+
+def test_runs_resume_where_they_stopped(user_id):
+    stop = threading.Event()
+    stop.set()
+    assert archive.run(before_year='2024', stop=stop)['partitions'] == 0
+    assert archive.run(before_year='2020')['partitions'] == 1
+    assert archive.run(before_year='2024')['partitions'] == 1
+    assert archive.run(before_year='2024')['partitions'] == 0
+    # Rows added to an archived year later are merged into its partition
+    database.add_expense(user_id, '2019-12-31', 'Food', 5.0, 'late', 'Happy')
+    assert archive.run(before_year='2024')['rows'] == 1
+    assert hot_count(user_id) == 9 and database.get_expense_totals(user_id)['count'] == 28
@@ -0,0 +1,60 @@
+from collections import defaultdict
+
+import pytest
+
+import database
+import eco
+
+ROWS = [
+    ('2024-01-05', 'Food', 200.0, 'Happy'),
+    ('2024-01-05', 'Travel', 150.0, 'Sad'),
+    ('2024-02-10', 'Food', 50.0, 'Sad'),
+    ('2024-03-01', 'Gifts', 80.0, 'Happy'),
+]
+KEYS = {
+    'category': lambda row: (row[1],),
+    'mood': lambda row: (row[3],),
+    'category_mood': lambda row: (row[3], row[1]),
+    'date': lambda row: (row[0],),
+    'month': lambda row: (row[0][:7],),
+}
+
+@pytest.fixture
+def user_id(tmp_path):
+    database.configure(str(tmp_path / 'eco.db'), shards=0)
+    database.init_db()
+    user_id = database.create_user('user', 'password')
+    database.add_expenses_bulk([(user_id, date, category, amount, 'row', mood) for date, category, amount, mood in ROWS])
+    yield user_id
+    database.close_connections()
+    database.read_cache.clear()
+
+def expected(by, factors, start=None, end=None):
+    groups = defaultdict(float)
+    for row in ROWS:
+        if (start is None or row[0] >= start) and (end is None or row[0] <= end):
+            groups[KEYS[by](row)] += row[2] * factors.get(row[1], eco.FALLBACK_FACTOR) / 100
+    return {key: pytest.approx(co2) for key, co2 in groups.items()}
+
+def impact(user_id, by, **kwargs):
+    return {tuple(row.values())[:-2]: row['co2_kg'] for row in eco.get_eco_impact(user_id, by, **kwargs)}
+
+@pytest.mark.parametrize('by', list(KEYS))
+def test_impact_is_spend_times_the_category_factor(user_id, by):
+    factors = eco.get_factors()
+    assert 'Gifts' not in factors  # falls back to FALLBACK_FACTOR
+    assert impact(user_id, by) == expected(by, factors)
+    assert impact(user_id, by, start='2024-01-06', end='2024-03-01') == expected(by, factors, '2024-01-06', '2024-03-01')
+
+def test_publishing_factors_recomputes_history(user_id):
+    first = eco.current_factor_version()
+    before = eco.get_total_impact(user_id)
+    factors = {'Food': 10.0, 'Travel': 20.0, 'Gifts': 1.5}
+    version = eco.publish_factors(factors, note='test')
+    assert version == first + 1 and eco.current_factor_version() == version
+    assert impact(user_id, 'category') == expected('category', factors)
+    assert eco.get_total_impact(user_id) == pytest.approx(20.0 + 30.0 + 5.0 + 1.2)
+    # Older versions stay queryable
+    assert eco.get_total_impact(user_id, version=first) == pytest.approx(before)
+    with pytest.raises(ValueError):
+        eco.get_eco_impact(user_id, 'weekday')
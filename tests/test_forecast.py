@@ -0,0 +1,68 @@
+import random
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import database
+import forecast
+
+@pytest.fixture
+def users(tmp_path):
+    database.configure(str(tmp_path / 'forecast.db'), shards=0)
+    database.init_db()
+    yield lambda name: database.create_user(name, 'password')
+    database.close_connections()
+    database.read_cache.clear()
+
+def history(rng, same_day=False):
+    first = date(2019, 1, 1) + timedelta(days=rng.randrange(2000))
+    days = [0] * rng.randint(3, 30) if same_day else [rng.randrange(1000) for _ in range(rng.randint(3, 300))]
+    return [
+        ((first + timedelta(days=day)).isoformat(), rng.choice(database.CATEGORIES), round(rng.uniform(1, 5000), 2))
+        for day in days
+    ]
+
+def lstsq_forecast(expenses, horizon, category=None):
+    # The same line fitted by numpy: least squares of amount on day number
+    points = [(date.fromisoformat(day), amount) for day, expense_category, amount in expenses
+              if category in (None, expense_category)]
+    if len(points) < forecast.MIN_POINTS:
+        return []
+    x = np.array([(day - database.FORECAST_EPOCH).days for day, _ in points], dtype=np.float64)
+    y = np.array([amount for _, amount in points])
+    if np.ptp(x) == 0:
+        # One day only: the slope is undetermined, fit the mean alone
+        intercept, = np.linalg.lstsq(np.ones((len(x), 1)), y, rcond=None)[0]
+        slope = 0.0
+    else:
+        slope, intercept = np.linalg.lstsq(np.column_stack([x, np.ones(len(x))]), y, rcond=None)[0]
+    last = int(x.max())
+    return [
+        ((database.FORECAST_EPOCH + timedelta(days=last + i)).isoformat(), intercept + slope * (last + i))
+        for i in range(1, horizon + 1)
+    ]
+
+def check(user_id, expenses, horizon, category=None):
+    expected = lstsq_forecast(expenses, horizon, category)
+    predicted = forecast.forecast(user_id, horizon, category)
+    assert [row['date'] for row in predicted] == [day for day, _ in expected]
+    assert [row['amount'] for row in predicted] == pytest.approx([amount for _, amount in expected], rel=1e-6, abs=1e-6)
+
+@pytest.mark.parametrize('same_day', [False, True], ids=['spread', 'same_day'])
+@pytest.mark.parametrize('batch', [False, True], ids=['on_demand', 'batch'])
+def test_forecast_matches_least_squares(users, same_day, batch):
+    rng = random.Random(7)
+    histories = {}
+    for index in range(20):
+        user_id = users(f'user{index}')
+        histories[user_id] = history(rng, same_day)
+        database.add_expenses_bulk([(user_id, day, category, amount, '', 'Neutral')
+                                    for day, category, amount in histories[user_id]])
+    if batch:
+        # Stored forecasts come from the vectorized fit_all()
+        forecast.run_batch()
+    for user_id, expenses in histories.items():
+        check(user_id, expenses, forecast.DEFAULT_HORIZON)
+        for category in database.CATEGORIES:
+            check(user_id, expenses, 14, category)
@@ -0,0 +1,21 @@
+import io
+
+import pytest
+
+import database
+import importer
+
+@pytest.fixture
+def user_id(tmp_path):
+    database.configure(str(tmp_path / 'import.db'), shards=0)
+    database.init_db()
+    yield database.create_user('user', 'password')
+    database.close_connections()
+    database.read_cache.clear()
+
+@pytest.mark.parametrize('amount', ['nan', 'NaN', 'inf', '-inf', '(inf)', '1e400'])
+def test_non_finite_amounts_are_invalid_rows(user_id, amount):
+    source = io.StringIO(f'date,amount,description\n2024-01-02,{amount},bad\n2024-01-03,120.50,good\n')
+    stats = importer.import_csv(user_id, source)
+    assert (stats['inserted'], stats['invalid']) == (1, 1)
+    assert [row['description'] for row in database.get_all_expenses(user_id)] == ['good']
@@ -0,0 +1,37 @@
+import pandas as pd
+
+import database
+import eco
+import metrics
+
+def test_row_count_of_pages():
+    rows = [{'id': 1}, {'id': 2}, {'id': 3}]
+    assert metrics.row_count((rows, ('2024-01-01', 3))) == 3
+    assert metrics.row_count((pd.DataFrame(rows), ('2024-01-01', 3))) == 3
+    assert metrics.row_count((pd.DataFrame(rows), None)) == 3
+    assert metrics.row_count((rows, 50)) == 3
+
+def test_row_count_of_other_results():
+    assert metrics.row_count(pd.DataFrame({'id': [1, 2]})) == 2
+    assert metrics.row_count([1, 2, 3, 4]) == 4
+    assert metrics.row_count({'count': 2, 'total_amount': 5.0}) == 1
+    assert metrics.row_count(None) is None
+    assert metrics.row_count(7) is None
+
+def test_cache_lookups_share_the_latency_name(tmp_path):
+    database.configure(str(tmp_path / 'metrics.db'), shards=0)
+    database.init_db()
+    try:
+        user_id = database.create_user('user', 'password')
+        database.add_expense(user_id, '2024-01-01', 'Food', 10.0, 'lunch', 'Happy')
+        metrics.registry.reset()
+        eco.get_eco_impact(user_id)
+        eco.get_eco_impact(user_id)
+        timed = {row['name']: row['calls'] for row in metrics.registry.snapshot()}
+        for metric, name, _ in metrics.registry.counters():
+            assert metric != 'cache_lookups' or name in timed
+        assert timed['_get_eco_impact'] == 2
+        assert metrics.registry.counters()[('cache_lookups', '_get_eco_impact', 'hit')] == 1
+    finally:
+        database.close_connections()
+        database.read_cache.clear()
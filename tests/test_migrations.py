@@ -0,0 +1,21 @@
+import os
+
+import database
+
+def test_configure_migrates_a_replaced_file(tmp_path):
+    path = str(tmp_path / 'migrations.db')
+    try:
+        database.configure(path, shards=0)
+        database.init_db()
+        assert database.create_user('user', 'password')
+        database.close_connections()
+        os.remove(path)
+        # Same path, new empty file: configure must not trust the old run
+        database.configure(path, shards=0)
+        database.init_db()
+        with database.read_connection() as conn:
+            assert database.schema_version(conn) == database.MIGRATIONS[-1][0]
+        assert database.create_user('user', 'password')
+    finally:
+        database.close_connections()
+        database.read_cache.clear()
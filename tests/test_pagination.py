@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+import archive
+import database
+
+FILTERS = [{}, {'category': 'Food'}, {'mood': 'Happy', 'min_amount': 20, 'max_amount': 400},
+           {'start': '2021-06-01', 'end': '2023-03-31', 'category': 'Travel'}]
+
+@pytest.fixture
+def expenses(tmp_path):
+    database.configure(str(tmp_path / 'pages.db'), shards=0)
+    database.init_db()
+    user_id = database.create_user('user', 'password')
+    other = database.create_user('other', 'password')
+    rng = random.Random(7)
+    rows = [(user_id, f'202{rng.randint(0, 4)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+             rng.choice(['Food', 'Travel', 'Bills']), float(rng.choice([5, 20, 99.5, 250, 400, 1000])),
+             'row', rng.choice(['Happy', 'Sad', 'Neutral'])) for _ in range(400)]
+    database.add_expenses_bulk(rows + [(other,) + row[1:] for row in rows[:50]])
+    yield user_id
+    database.close_connections()
+    database.read_cache.clear()
+
+def matching(expenses, category=None, mood=None, min_amount=None, max_amount=None, start=None, end=None):
+    return [row for row in expenses
+            if (category is None or row['category'] == category) and (mood is None or row['mood'] == mood)
+            and (min_amount is None or row['amount'] >= min_amount) and (max_amount is None or row['amount'] <= max_amount)
+            and (start is None or row['date'] >= start) and (end is None or row['date'] <= end)]
+
+def walk(user_id, limit, sort, descending, filters):
+    pages, after = [], None
+    while True:
+        page, after = database.get_expenses_page(user_id, after, limit, sort, descending, **filters)
+        pages.append(page)
+        if after is None:
+            return pages
+
+@pytest.mark.parametrize('archived', [False, True])
+def test_pages_walk_the_filtered_expenses_in_order(expenses, archived):
+    if archived:
+        assert archive.run(before_year='2022')['rows'] > 0
+    with database.read_connection(expenses) as conn:
+        everything = [dict(row) for row in conn.execute(
+            f'SELECT id, date, category, amount, mood FROM {database.expenses_source(conn, expenses)} WHERE user_id = ?',
+            (expenses,)
+        )]
+    assert len(everything) == 400
+    for filters in FILTERS:
+        wanted = matching(everything, **filters)
+        assert wanted
+        for sort in database.PAGE_SORT_COLUMNS:
+            for descending in (True, False):
+                pages = walk(expenses, 7, sort, descending, filters)
+                assert all(len(page) == 7 for page in pages[:-1]) and len(pages[-1]) <= 7
+                rows = [row for page in pages for row in page]
+                expected = sorted(wanted, key=lambda row: (row[sort], row['id']), reverse=descending)
+                assert [row['id'] for row in rows] == [row['id'] for row in expected]
+        summary = database.get_expenses_summary(expenses, **filters)
+        assert summary['count'] == len(wanted)
+        assert summary['total_amount'] == pytest.approx(sum(row['amount'] for row in wanted))
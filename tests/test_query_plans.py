@@ -0,0 +1,104 @@
+import re
+
+import pytest
+
+import archive
+import database
+import eco
+
+# Every read function with the arguments the app and API call it with;
+# HOT_QUERIES only holds fixed-text stand-ins, these are the real statements
+WINDOWS = [{}, {'start': '2021-03-01', 'end': '2021-09-30'}, {'start': '2019-01-01'}]
+
+def reads(user_id, window):
+    yield database.get_all_expenses, (user_id,), window
+    yield database.get_expenses_frame, (user_id,), window
+    yield database.get_expense_totals, (user_id,), window
+    for sort in database.PAGE_SORT_COLUMNS:
+        for descending in (True, False):
+            yield database.get_expenses_page, (user_id, None, 10, sort, descending), window
+            yield database.get_expenses_page, (user_id, ('2021-06-01' if sort == 'date' else 100.0, 5), 10, sort, descending), window
+    yield database.get_expenses_page, (user_id,), dict(window, category='Food', mood='Happy')
+    yield database.get_expenses_summary, (user_id,), window
+    yield database.get_expenses_summary, (user_id,), dict(window, category='Food', min_amount=10, max_amount=500)
+    for name in database.ROLLUPS:
+        yield database.get_rollup, (user_id, name), window
+    yield database.get_spending_by_mood, (user_id,), window
+    yield database.get_spending_by_category_mood, (user_id,), window
+    yield database.get_forecast_stats, (user_id,), window
+    yield database.get_forecast_stats, (user_id, 'Food'), window
+    yield database.get_anomalies, (user_id,), window
+    yield database.get_anomaly_stats, (user_id,), {}
+    yield database.search_expenses, (user_id, 'coffee'), window
+    yield database.search_expenses, (user_id, 'lunch'), dict(window, category='Food')
+    for by in eco.IMPACT_QUERIES:
+        yield eco.get_eco_impact, (user_id, by), window
+
+def expense_names(sql):
+    # The names expenses goes by in sql: itself and its aliases (the regex
+    # also picks up keywords after it, which never name a plan step)
+    return {'expenses'} | set(re.findall(r'\bexpenses\s+(?:AS\s+)?(\w+)', sql, re.IGNORECASE))
+
+@pytest.fixture
+def traced(tmp_path, monkeypatch):
+    # A populated database whose reader connections record every statement
+    statements = []
+    open_reader = database._open_reader
+
+    def recording_reader(path):
+        conn = open_reader(path)
+        conn.set_trace_callback(lambda sql: statements.append((conn, sql)))
+        return conn
+
+    monkeypatch.setattr(database, '_open_reader', recording_reader)
+    database.configure(str(tmp_path / 'plans.db'), readers=1, shards=0)
+    database.init_db()
+    users = [database.create_user(f'user{index}', 'password') for index in range(3)]
+    descriptions = ['coffee', 'lunch with friends', 'rent', 'uber ride', '']
+    database.add_expenses_bulk([
+        (user_id, f'{2018 + day % 6}-{day % 12 + 1:02d}-{day % 28 + 1:02d}', database.CATEGORIES[day % 5],
+         float(day % 97 + 1), descriptions[day % 5], database.MOODS[day % 5 * 3 % 5])
+        for user_id in users for day in range(400)
+    ])
+    yield users[1], statements
+    database.close_connections()
+    database.read_cache.clear()
+
+def scans_of_expenses(statements):
+    problems = []
+    for conn, sql in list(statements):
+        if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            continue
+        names = expense_names(sql)
+        plan = {row['id']: (row['parent'], row['detail']) for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)}
+        # The archive union is a subquery aliased like the table; reading
+        # its result back is a SCAN of that name outside the subquery
+        subqueries = {detail.split()[1]: step for step, (_, detail) in plan.items()
+                      if detail.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+        for step, (parent, detail) in plan.items():
+            match = re.match(r'SCAN (\w+)', detail)
+            if not match or match.group(1) not in names:
+                continue
+            ancestors = set()
+            while parent:
+                ancestors.add(parent)
+                parent = plan[parent][0]
+            if match.group(1) not in subqueries or subqueries[match.group(1)] in ancestors:
+                problems.append((sql, detail))
+    return problems
+
+@pytest.mark.parametrize('archived', [False, True], ids=['hot', 'archived'])
+def test_reads_never_scan_expenses(traced, archived):
+    user_id, statements = traced
+    if archived:
+        # Reads reaching into archived years union the archive back in
+        archive.run('2020', user_id=user_id)
+    for window in WINDOWS:
+        for read, args, kwargs in reads(user_id, window):
+            statements.clear()
+            getattr(read, 'uncached', read)(*args, **kwargs)
+            assert statements, read.__name__
+            assert scans_of_expenses(statements) == [], read.__name__
+
+def test_hot_queries_use_an_index(traced):
+    database.check_query_plans()
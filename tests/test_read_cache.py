@@ -0,0 +1,35 @@
+import pandas as pd
+
+import database
+
+def frame(rows):
+    return pd.DataFrame({'date': pd.date_range('2020-01-01', periods=rows), 'description': ['coffee'] * rows})
+
+def test_entries_are_evicted_against_the_byte_budget():
+    size = database.result_size(frame(1000))
+    cache = database.ReadCache(max_bytes=int(size * 3.5))
+    for user_id in range(5):
+        cache.put(user_id, 1, 'frame', frame(1000))
+        assert cache.bytes <= cache.max_bytes
+    # The three most recently used users are left
+    assert [cache.get(user_id, 1, 'frame')[0] for user_id in range(5)] == [False, False, True, True, True]
+    assert cache.stats()['evictions'] == 2
+
+def test_a_result_over_the_budget_is_not_cached():
+    cache = database.ReadCache(max_bytes=database.result_size(frame(10)))
+    cache.put(1, 1, 'small', frame(10))
+    cache.put(1, 1, 'large', frame(100_000))
+    assert cache.get(1, 1, 'small')[0] and not cache.get(1, 1, 'large')[0]
+    assert cache.bytes == database.result_size(frame(10))
+
+def test_a_new_version_releases_the_old_results():
+    cache = database.ReadCache()
+    cache.put(1, 1, 'rows', [{'id': expense_id, 'description': 'coffee'} for expense_id in range(100)])
+    assert cache.bytes > 0
+    cache.put(1, 2, 'count', {'count': 100})
+    assert cache.bytes == database.result_size({'count': 100})
+    assert not cache.get(1, 1, 'rows')[0] and cache.get(1, 2, 'count') == (True, {'count': 100})
+
+def test_result_size_counts_frames_deeply():
+    assert database.result_size(frame(10_000)) > 10_000 * (8 + len('coffee'))
+    assert database.result_size((frame(10), None)) > database.result_size(frame(10))
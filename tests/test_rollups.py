@@ -0,0 +1,74 @@
+import io
+import sqlite3
+from collections import defaultdict
+
+import pytest
+
+import archive
+import database
+import importer
+
+ROWS = [
+    ('2021-03-04', 'Food', 12.5, 'lunch', 'Happy'),
+    ('2021-11-30', 'Travel', 40.0, 'train', 'Neutral'),
+    ('2022-01-15', 'Food', 7.25, 'coffee', 'Sad'),
+    ('2024-02-01', 'Shopping', 99.99, 'shoes', 'Happy'),
+    ('2024-02-01', 'Food', 3.0, 'snack', 'Happy'),
+]
+
+@pytest.fixture
+def user_id(tmp_path):
+    database.configure(str(tmp_path / 'rollups.db'), shards=0)
+    database.init_db()
+    yield database.create_user('user', 'password')
+    database.close_connections()
+    database.read_cache.clear()
+
+def import_rows(user_id, rows):
+    lines = ['date,category,amount,description,mood'] + [','.join(map(str, row)) for row in rows]
+    return importer.import_csv(user_id, io.StringIO('\n'.join(lines) + '\n'))
+
+def raw_aggregates(rows):
+    keys = {
+        'daily': lambda row: (row[0],),
+        'monthly': lambda row: (row[0][:7],),
+        'category': lambda row: (row[1],),
+        'mood': lambda row: (row[4],),
+        'category_mood': lambda row: (row[1], row[4]),
+    }
+    aggregates = {}
+    for name, key in keys.items():
+        groups = defaultdict(lambda: [0.0, 0])
+        for row in rows:
+            groups[key(row)][0] += row[2]
+            groups[key(row)][1] += 1
+        aggregates[name] = sorted((*group, round(total, 2), count) for group, (total, count) in groups.items())
+    return aggregates
+
+def rollups(user_id):
+    aggregates = {}
+    for name in database.ROLLUPS:
+        rows = [list(row.values()) for row in database.get_rollup(user_id, name)]
+        aggregates[name] = sorted((*row[:-2], round(row[-2], 2), row[-1]) for row in rows)
+    return aggregates
+
+def test_rollups_match_raw_aggregates_through_import_archive_and_restore(user_id):
+    assert import_rows(user_id, ROWS)['inserted'] == len(ROWS)
+    assert rollups(user_id) == raw_aggregates(ROWS)
+    assert archive.run(before_year='2023')['rows'] == 3
+    assert rollups(user_id) == raw_aggregates(ROWS)
+    with database.write_connection(user_id) as conn:
+        database.rebuild_rollups(conn)
+    assert rollups(user_id) == raw_aggregates(ROWS)
+    assert archive.restore(user_id) == 3
+    assert rollups(user_id) == raw_aggregates(ROWS)
+
+def test_rebuild_refreshes_cached_reads_of_users_without_hot_rows(user_id, tmp_path):
+    import_rows(user_id, ROWS)
+    assert database.get_expense_totals(user_id)['count'] == len(ROWS)
+    # Rows removed behind the app's back leave the user only in the rollups
+    with sqlite3.connect(str(tmp_path / 'rollups.db')) as conn:
+        conn.execute('DELETE FROM expenses WHERE user_id = ?', (user_id,))
+    with database.write_connection(user_id) as conn:
+        database.rebuild_rollups(conn)
+    assert database.get_expense_totals(user_id)['count'] == 0
@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+import database
+
+@pytest.fixture
+def users(tmp_path):
+    database.configure(str(tmp_path / 'search.db'), shards=0)
+    database.init_db()
+    yield [database.create_user(f'user{index}', 'password') for index in range(2)]
+    database.close_connections()
+    database.read_cache.clear()
+
+def found(user_id, text):
+    return sorted(row['description'] for row in database.search_expenses.uncached(user_id, text)[0])
+
+def test_words_split_like_queries(users):
+    user_id, other = users
+    for description in ['Paid ₹500 for uber', 'dinner—friends', 'a=b~c $20', 'Coffee at Starbucks', 'café crème', 'foo_bar']:
+        database.add_expense(user_id, '2024-01-01', 'Food', 1.0, description, 'Happy')
+    database.add_expense(other, '2024-01-01', 'Food', 1.0, 'friends 500', 'Happy')
+    assert found(user_id, '500') == ['Paid ₹500 for uber']
+    assert found(user_id, 'friends') == ['dinner—friends']
+    assert found(user_id, '20') == ['a=b~c $20']
+    assert found(user_id, 'cof star') == ['Coffee at Starbucks']
+    assert found(user_id, 'cafe') == found(user_id, 'crème') == ['café crème']
+    assert found(user_id, 'bar') == ['foo_bar']
+    assert found(user_id, 'uber ₹') == ['Paid ₹500 for uber']
+
+def test_other_clients_can_write_expenses(users, tmp_path):
+    user_id = users[0]
+    database.add_expenses_bulk([(user_id, '2024-01-01', 'Food', 1.0, 'coffee', 'Happy'),
+                                (user_id, '2024-01-02', 'Food', 1.0, 'lunch', 'Happy')])
+    # No functions registered: a plain connection, like the sqlite3 shell
+    with sqlite3.connect(str(tmp_path / 'search.db')) as conn:
+        conn.execute("INSERT INTO expenses (user_id, date, category, amount, description, mood) "
+                     "VALUES (?, '2024-01-03', 'Food', 2.0, 'late coffee', 'Sad')", (user_id,))
+        conn.execute("UPDATE expenses SET description = 'team lunch' WHERE description = 'lunch'")
+    assert found(user_id, 'coffee') == ['coffee']
+    assert found(user_id, 'lunch') == []
+    with database.write_connection(user_id) as conn:
+        database.rebuild_search_index(conn)
+    assert found(user_id, 'coffee') == ['coffee', 'late coffee']
+    assert found(user_id, 'lunch') == ['team lunch']
+    with sqlite3.connect(str(tmp_path / 'search.db')) as conn:
+        conn.execute("DELETE FROM expenses WHERE description = 'coffee'")
+    assert found(user_id, 'coffee') == ['late coffee']
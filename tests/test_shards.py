@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+import database
+
+def add(user_ids, per_user=5):
+    database.add_expenses_bulk([(user_id, f'2024-01-{day + 1:02d}', 'Food', 10.0 + day, f'lunch {user_id}', 'Happy')
+                                for user_id in user_ids for day in range(per_user)])
+
+def reads(user_id):
+    # bm25 scores depend on the whole index, so only the search order counts
+    found = [row['id'] for row in database.search_expenses(user_id, 'lunch')[0]]
+    return (database.get_all_expenses(user_id), database.get_expense_totals(user_id),
+            database.get_rollup(user_id, 'category'), database.get_anomaly_stats(user_id), found)
+
+@pytest.fixture
+def sharded(tmp_path):
+    database.configure(str(tmp_path / 'shards.db'), shards=3)
+    database.init_db()
+    yield [database.create_user(f'user{index}', 'password') for index in range(12)]
+    database.close_connections()
+    database.read_cache.clear()
+    database.configure(shards=0)
+
+def test_users_are_routed_to_their_shard_with_unique_ids(sharded):
+    add(sharded)
+    assert {database.shard_of(user_id) for user_id in sharded} == {0, 1, 2}
+    ids = []
+    for index in range(3):
+        with sqlite3.connect(database.shard_path(index)) as conn:
+            rows = conn.execute('SELECT id, user_id FROM expenses').fetchall()
+        assert {user_id for _, user_id in rows} == {user_id for user_id in sharded if database.shard_of(user_id) == index}
+        # The shard is carried in the high bits of each id
+        assert {expense_id >> database.SHARD_ID_BITS for expense_id, _ in rows} == {index + 1}
+        ids.extend(expense_id for expense_id, _ in rows)
+    assert len(ids) == len(set(ids)) == len(sharded) * 5
+    with sqlite3.connect(database.DB_PATH) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM expenses').fetchone()[0] == 0
+    for user_id in sharded:
+        assert database.get_expense_totals(user_id)['count'] == 5
+
+def test_splitting_keeps_every_read(tmp_path):
+    path = str(tmp_path / 'split.db')
+    database.configure(path, shards=0)
+    database.init_db()
+    try:
+        user_ids = [database.create_user(f'user{index}', 'password') for index in range(8)]
+        add(user_ids)
+        before = {user_id: reads(user_id) for user_id in user_ids}
+        database.configure(path, shards=3)
+        assert sum(database.split_into_shards(prune=True)) == len(user_ids) * 5
+        database.read_cache.clear()
+        assert {user_id: reads(user_id) for user_id in user_ids} == before
+        # New ids land above every id from before the split
+        add(user_ids[:1], per_user=1)
+        newest = max(row['id'] for row in database.get_expenses_page(user_ids[0], limit=10)[0])
+        assert newest >> database.SHARD_ID_BITS == database.shard_of(user_ids[0]) + 1
+    finally:
+        database.close_connections()
+        database.read_cache.clear()
+        database.configure(shards=0)